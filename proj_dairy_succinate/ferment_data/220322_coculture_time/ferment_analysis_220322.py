@@ -1,22 +1,31 @@
 # %%
 # Import necessary libraries
+import sys
 import glob
 from itertools import count
 import os
 import io
 import csv
-import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy import stats
+
+sys.path.append(os.path.join("..", "..", "..", "utility_scripts"))
+from ferment_io import load_dataframe, read_workbook_sheets
+from clean_ferment_data import fill_sampling_times
+from ferment_stats import summarize_groups, summary_stat, paired_ttests
+from ferment_report import timecourse_figure, comparison_figure, draw_figure, render_figures_in_subprocess
 
 
 # %%
 # Import raw data
 compound_list = pd.read_csv(r"gc_output\20220322_coculture_time_compounds.csv", index_col="Compound").index
-gc_raw = pd.read_csv(r"gc_output\20220322_coculture_time_data.csv", index_col="Sample ID")
-ferment_raw = pd.read_excel(r"220322_coculture_time_raw.xlsx", sheet_name="Data", index_col="Sample ID")
-ferment_time = pd.read_excel(r"220322_coculture_time_raw.xlsx", sheet_name="Sampling times", index_col="Planned time point")
+# The GC data can also be loaded from the .feather/.parquet files written by read_gc_data.py --format
+gc_raw = load_dataframe(r"gc_output\20220322_coculture_time_data.csv", index_col="Sample ID")
+ferment_sheets = read_workbook_sheets(
+    r"220322_coculture_time_raw.xlsx",
+    {"Data": "Sample ID", "Sampling times": "Planned time point"},
+)
+ferment_raw = ferment_sheets["Data"]
+ferment_time = ferment_sheets["Sampling times"]
 
 
 # %%
@@ -27,8 +36,7 @@ ferment_data = ferment_raw.dropna(axis=1, how="all")
 
 # %%
 # Fill in sampling time
-ferment_data = pd.merge(ferment_data, ferment_time, on="Planned time point")
-ferment_data.index.rename("Sample ID", inplace=True)
+ferment_data = fill_sampling_times(ferment_data, ferment_time)
 
 
 # %%
@@ -57,6 +65,15 @@ ferment_hieu_eric.loc[:, "Compare sample"] = (
 compare_samples = pd.Index(ferment_hieu_eric["Compare sample"].unique())
 std_source = pd.Index(ferment_hieu_eric["1-propanol standard"].unique())
 
+# Paired t-tests between the standards for all samples and compounds, reused by every figure
+standards_p_values = paired_ttests(
+    ferment_hieu_eric,
+    "Compare sample",
+    "1-propanol standard",
+    ["Hieu", "Eric"],
+    compound_list,
+)
+
 
 # List culture types
 culture_types = pd.Index(ferment_data["Culture type"].unique())
@@ -77,51 +94,24 @@ culture_styles.loc[:,'Fill'] = ['none', 'none', 'none', 'none', 'full', 'full']
 
 # %%
 # Plot fermentation product yield (for writings)
-ferment_group1 = ferment_hieu.groupby(
-    ["Culture type", "Actual time point (h)"], sort=False
+summary1 = summarize_groups(
+    ferment_hieu, ["Culture type", "Actual time point (h)"], compound_list
 )
-
-series_x = ferment_hieu.loc[:, "Actual time point (h)"].unique()
-
-fig1w, ax1s = plt.subplots(
-    nrows=int(len(compound_list) / 2),
-    ncols=2,
+mean1 = summary_stat(summary1, "mean")
+std1 = summary_stat(summary1, "std")
+
+spec1w = timecourse_figure(
+    "220322_fermentation_products_vw5",
+    mean1,
+    std1,
+    compound_list,
+    [culture for culture in culture_types if "pre" not in culture],
+    culture_styles,
+    suptitle="Fermentation Products",
     figsize=(14.5, 20),
-    facecolor="white",
-    tight_layout=True,
+    xticks=list(range(0, 80, 12)),
 )
-fig1w.suptitle("Fermentation Products")
-
-for compound in compound_list:
-    ax1 = ax1s.ravel()[compound_list.get_loc(compound)]
-    ax1.set_title(compound)
-    ax1.set_xlabel("Time (h)")
-    ax1.xaxis.set_ticks(np.arange(0, 80, 12))
-    ax1.set_ylabel("Concentration (g/L)")
-    for culture in culture_types:
-        if "pre" not in culture:
-            series_y = ferment_group1.mean().loc[culture, compound]
-            series_yerr = ferment_group1.std().loc[culture, compound]
-            ax1.errorbar(
-                series_x,
-                series_y,
-                label = culture,
-                marker = culture_styles.loc[culture, 'Marker'],
-                # markerfacecolor = culture_styles.loc[culture, 'Color'],
-                fillstyle = culture_styles.loc[culture, 'Fill'],
-                ms = 8,
-                # alpha = 0.8,
-                linestyle = '--',
-                linewidth = 1,
-                yerr = series_yerr,
-                elinewidth = 0.5,
-                capsize = 4,
-                capthick = 0.5,
-            )
-            ax1.set_ylim(bottom=0, auto=True)
-        else:
-            pass
-    ax1.legend()
+fig1w = draw_figure(spec1w)
 
 
 # %%
@@ -162,141 +152,49 @@ ax2.legend()
  """
 # %%
 # Plot comparision of samples with different standards, by sample (for writings)
-ferment_group3a = ferment_hieu_eric.groupby(
-    ["Compare sample", "1-propanol standard"], sort=False
+summary3a = summarize_groups(
+    ferment_hieu_eric, ["Compare sample", "1-propanol standard"], compound_list
 )
-
-fig3aw, ax3as = plt.subplots(
-    nrows=int(len(compare_samples) / 2),
-    ncols=2,
+mean3a = summary_stat(summary3a, "mean")
+std3a = summary_stat(summary3a, "std")
+
+spec3aw = comparison_figure(
+    "220322_compare_standards_vw3a",
+    mean3a,
+    std3a,
+    standards_p_values,
+    compare_samples,
+    compound_list,
+    std_source,
+    panel_by="sample",
+    suptitle="Comparison between standards",
     figsize=(12, 12),
-    facecolor="white",
-    tight_layout=True,
+    title_format="Sample: {}",
+    xlabel="Concentration (g/L)",
+    legend_title="1-propanol\nstandard",
 )
-fig3aw.suptitle("Comparison between standards")
-
-error_format = {
-    "elinewidth": 0.65,
-    "capsize": 4,
-    "capthick": 0.8,
-}
-
-for sample in compare_samples:
-    ax3a = ax3as.ravel()[compare_samples.get_loc(sample)]
-    ax3a.set_title("Sample: " + sample, pad=12)
-    ax3a.set_xlabel("Concentration (g/L)")
-    ax3a.xaxis.set_ticks_position("top")
-    ax3a.xaxis.set_label_position("top")
-    ax3a.tick_params(axis="y", which="major", length=0)
-    ax3a.spines["left"].set(linewidth=0.001)
-    ax3a.spines["right"].set(visible=False)
-    ax3a.spines["bottom"].set(visible=False)
-
-    series_x = compound_list
-    ax3a.set_yticklabels(series_x)
-    xtick_pos = np.arange(len(series_x))
-    bar_offset = np.linspace(-1.2, 1.2, len(std_source))
-    ax3a.set_yticks(xtick_pos, series_x)
-    barwidth = 0.26
-
-    for std in std_source:
-        series_y = ferment_group3a.mean().loc[(sample, std), :][compound_list]
-        series_yerr = ferment_group3a.std().loc[(sample, std), :][compound_list]
-        ax3a.barh(
-            xtick_pos + bar_offset[std_source.get_loc(std)] * barwidth / 2,
-            series_y,
-            barwidth,
-            label=std,
-            xerr=series_yerr,
-            error_kw=error_format,
-        )
-        ax3a.set_xlim(left=0, auto=True)
-        ax3a.xaxis
-        ax3a.legend(title="1-propanol\nstandard")
-
-    for compound in compound_list:
-        samples_H = ferment_group3a.get_group((sample, "Hieu"))[compound]
-        samples_E = ferment_group3a.get_group((sample, "Eric"))[compound]
-        p_value = stats.ttest_rel(samples_H, samples_E)[1]
-        if pd.notnull(p_value):
-            if p_value < 0.05:
-                significance = "*"
-            else:
-                significance = "ns"
-            ann_x = (
-                ferment_group3a.mean().loc[(sample, std), :][compound]
-                + ferment_group3a.std().loc[(sample, std), :][compound]
-            ) * 1.2
-            ann_y = xtick_pos[compound_list.get_loc(compound)]
-            ax3a.annotate(significance, (ann_x, ann_y))
+fig3aw = draw_figure(spec3aw)
 
 
 # %%
 # Plot comparision of samples with different standards, by compound (for writings)
-ferment_group3b = ferment_hieu_eric.groupby(
-    ["1-propanol standard", "Compare sample"], sort=False
-)
-
-fig3bw, ax3bs = plt.subplots(
-    nrows=int(len(compound_list) / 2),
-    ncols=2,
+spec3bw = comparison_figure(
+    "220322_compare_standards_vw3b",
+    mean3a,
+    std3a,
+    standards_p_values,
+    compare_samples,
+    compound_list,
+    std_source,
+    panel_by="compound",
+    suptitle="Comparison between standards",
     figsize=(12, 14),
-    facecolor="white",
-    tight_layout=True,
+    title_format="{} (g/L)",
+    barwidth=0.22,
+    annotation_offset=1.1,
+    legend_title="1-propanol\nstandard",
 )
-fig3bw.suptitle("Comparison between standards")
-
-error_format = {
-    "elinewidth": 0.65,
-    "capsize": 4,
-    "capthick": 0.8,
-}
-
-for compound in compound_list:
-    ax3b = ax3bs.ravel()[compound_list.get_loc(compound)]
-    ax3b.set_title(compound + " (g/L)", pad=12)
-    ax3b.xaxis.set_ticks_position("top")
-    ax3b.tick_params(axis="y", which="major", length=0)
-    ax3b.spines["left"].set(linewidth=0.001)
-    ax3b.spines["right"].set(visible=False)
-    ax3b.spines["bottom"].set(visible=False)
-
-    series_x = compare_samples
-    ax3b.set_yticklabels(series_x)
-    xtick_pos = np.arange(len(series_x))
-    bar_offset = np.linspace(-1.2, 1.2, len(std_source))
-    ax3b.set_yticks(xtick_pos, series_x)
-
-    for std in std_source:
-        series_y = ferment_group3b.mean().loc[std, compound]
-        series_yerr = ferment_group3b.std().loc[std, compound]
-        barwidth = 0.22
-        ax3b.barh(
-            xtick_pos + bar_offset[std_source.get_loc(std)] * barwidth / 2,
-            series_y,
-            barwidth,
-            label=std,
-            xerr=series_yerr,
-            error_kw=error_format,
-        )
-    ax3b.set_xlim(left=0, auto=True)
-    ax3b.legend(title="1-propanol\nstandard")
-
-    for sample in compare_samples:
-        samples_H = ferment_group3b.get_group(("Hieu", sample))[compound]
-        samples_E = ferment_group3b.get_group(("Eric", sample))[compound]
-        p_value = stats.ttest_rel(samples_H, samples_E)[1]
-        if pd.notnull(p_value):
-            if p_value < 0.05:
-                significance = "*"
-            else:
-                significance = "ns"
-            ann_x = (
-                ferment_group3b.mean().loc[(std, sample), :][compound]
-                + ferment_group3b.std().loc[(std, sample), :][compound]
-            ) * 1.1
-            ann_y = xtick_pos[compare_samples.get_loc(sample)]
-            ax3b.annotate(significance, (ann_x, ann_y))
+fig3bw = draw_figure(spec3bw)
 
 
 # %%
@@ -307,95 +205,32 @@ for compound in compound_list:
 
 # %%
 # Plot comparision of samples with different standards, by sample, with zoom (for writings)
-ferment_group4a = ferment_hieu_eric.groupby(
-    ["Compare sample", "1-propanol standard"], sort=False
-)
-
-fig4aw, ax4as = plt.subplots(
-    nrows=int(len(compare_samples) / 1),
-    ncols=2,
+spec4aw = comparison_figure(
+    "220322_compare_standards_vw4a",
+    mean3a,
+    std3a,
+    standards_p_values,
+    compare_samples,
+    compound_list,
+    std_source,
+    panel_by="sample",
+    axes_per_panel=2,
+    suptitle="Comparison between standards",
     figsize=(13, 24),
-    facecolor="white",
-    tight_layout=True,
+    title_format="Sample: {}",
+    xlabel="Concentration (g/L)",
+    legend_title="1-propanol\nstandard",
 )
-fig4aw.suptitle("Comparison between standards")
-
-error_format = {
-    "elinewidth": 0.65,
-    "capsize": 4,
-    "capthick": 0.8,
-}
-
-for sample in compare_samples:
-    ax4a_index = compare_samples.get_loc(sample) * 2
-    # ax4ao, ax4ai = ax4as.ravel()[ax4a_index:ax4a_index+2]
-    for ax4a in ax4as.ravel()[ax4a_index : ax4a_index + 2]:
-        ax4a.set_title("Sample: " + sample, pad=12)
-        ax4a.set_xlabel("Concentration (g/L)")
-        ax4a.xaxis.set_ticks_position("top")
-        ax4a.tick_params(axis="y", which="major", length=0)
-        ax4a.xaxis.set_label_position("top")
-        ax4a.spines["left"].set(visible=False, linewidth=0.01)
-        ax4a.spines["right"].set(visible=False)
-        ax4a.spines["bottom"].set(visible=False)
-
-        series_x = compound_list
-        ax4a.set_yticklabels(series_x)
-        xtick_pos = np.arange(len(series_x))
-        bar_offset = np.linspace(-1.2, 1.2, len(std_source))
-        ax4a.set_yticks(xtick_pos, series_x)
-        barwidth = 0.26
-
-        for std in std_source:
-            series_y = ferment_group4a.mean().loc[(sample, std), :][compound_list]
-            series_yerr = ferment_group4a.std().loc[(sample, std), :][compound_list]
-            ax4a.barh(
-                xtick_pos + bar_offset[std_source.get_loc(std)] * barwidth / 2,
-                series_y,
-                barwidth,
-                label=std,
-                xerr=series_yerr,
-                error_kw=error_format,
-            )
-            ax4a.set_xlim(left=0, auto=True)
-            ax4a.xaxis
-            ax4a.legend(title="1-propanol\nstandard")
-
-        for compound in compound_list:
-            samples_H = ferment_group4a.get_group((sample, "Hieu"))[compound]
-            samples_E = ferment_group4a.get_group((sample, "Eric"))[compound]
-            p_value = stats.ttest_rel(samples_H, samples_E)[1]
-            if pd.notnull(p_value):
-                if p_value < 0.05:
-                    significance = "*"
-                else:
-                    significance = "ns"
-                ann_x = (
-                    ferment_group4a.mean().loc[(sample, std), :][compound]
-                    + ferment_group4a.std().loc[(sample, std), :][compound]
-                ) * 1.2
-                ann_y = xtick_pos[compound_list.get_loc(compound)]
-                ax4a.annotate(significance, (ann_x, ann_y))
+fig4aw = draw_figure(spec4aw)
 
 
 # %%
 
 
 # %%
-# Save figures to files
-""" fig1w.savefig(r"Graphs\220322_fermentation_products_vw5.pdf")
-fig1w.savefig(r"Graphs\220322_fermentation_products_vw5.svg")
-
-fig2w.savefig(r"Graphs\220322_culture_growth_vw5.pdf")
-fig2w.savefig(r"Graphs\220322_culture_growth_vw5.svg")
- """
-
-
-fig3aw.savefig(r"Graphs\220322_compare_standards_vw3a.pdf")
-fig3aw.savefig(r"Graphs\220322_compare_standards_vw3a.svg")
-
-fig3bw.savefig(r"Graphs\220322_compare_standards_vw3b.pdf")
-fig3bw.savefig(r"Graphs\220322_compare_standards_vw3b.svg")
+# Render figures to files (in parallel, headless, skipping figures that have not changed)
+# Rendered by ferment_report in its own process, so its worker processes do not run this script again
+render_figures_in_subprocess([spec1w, spec3aw, spec3bw, spec4aw], "Graphs", formats=["pdf", "svg"])
 
 
 # %%
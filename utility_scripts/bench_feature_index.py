@@ -0,0 +1,90 @@
+# %%
+# Import necessary libraries
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from feature_index import FeatureIndex
+
+
+# %%
+script_descr = """
+Benchmark of FeatureIndex base-position lookups against the previous boolean mask scan of lookup_loci,
+on a synthetic feature table of a 4-6 Mb genome (one gene and one CDS row per ORF, as in NCBI feature tables).
+"""
+
+
+# %%
+def make_feature_table(genome_size=5_000_000, n_genes=5000, seed=0):
+    """Make a synthetic feature table with gene and CDS rows of n_genes ORFs spread over genome_size bases."""
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.integers(1, genome_size - 3000, n_genes))
+    ends = starts + rng.integers(150, 3000, n_genes)
+    genes = pd.DataFrame(
+        {
+            "# feature": "gene",
+            "genomic_accession": "NC_000001.1",
+            "start": starts,
+            "end": ends,
+            "strand": rng.choice(["+", "-"], n_genes),
+            "locus_tag": ["SYN_{:05d}".format(number) for number in range(n_genes)],
+        }
+    )
+    cds = genes.assign(**{"# feature": "CDS"})
+    feature_table = pd.concat([genes, cds]).sort_values(["start", "# feature"], kind="stable")
+    return feature_table.reset_index(drop=True), genome_size
+
+
+def mask_scan(feature_table, bases):
+    """Previous lookup_loci(column="base") scan, once per position, with inclusive ends to match FeatureIndex."""
+    located_loci = []
+    for base in bases:
+        located = feature_table[(feature_table["start"] <= base) & (feature_table["end"] >= base)]
+        located_loci.append(located.assign(position=base))
+    return pd.concat(located_loci).reset_index(drop=True)
+
+
+# %%
+if __name__ == "__main__":
+    bench_parser = argparse.ArgumentParser(description=script_descr)
+    bench_parser.add_argument(
+        "-n", "--queries",
+        help="Numbers of base positions to look up (default: 100 1000 10000).",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        metavar="<number>",
+    )
+    bench_args = bench_parser.parse_args()
+
+    feature_table, genome_size = make_feature_table()
+    rng = np.random.default_rng(1)
+
+    start = time.perf_counter()
+    index = FeatureIndex(feature_table)
+    build_time = time.perf_counter() - start
+    print("Index built in {:.4f} s for {} features\n".format(build_time, len(feature_table)))
+
+    print("{:>10}{:>16}{:>16}{:>10}".format("Queries", "mask scan (s)", "index (s)", "Speed-up"))
+    for n_queries in bench_args.queries:
+        bases = rng.integers(1, genome_size, n_queries)
+
+        start = time.perf_counter()
+        scan_result = mask_scan(feature_table, bases)
+        scan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_result = index.positions(bases)
+        index_time = time.perf_counter() - start
+
+        key = ["position", "locus_tag", "# feature"]
+        pd.testing.assert_frame_equal(
+            index_result.sort_values(key).reset_index(drop=True),
+            scan_result[index_result.columns].sort_values(key).reset_index(drop=True),
+        )
+        print(
+            "{:>10}{:>16.3f}{:>16.4f}{:>9.0f}x".format(
+                n_queries, scan_time, index_time, scan_time / index_time
+            )
+        )
@@ -0,0 +1,139 @@
+# %%
+# Import necessary libraries
+import os
+import io
+import time
+import random
+import tempfile
+import argparse
+import numpy as np
+import pandas as pd
+
+from gc_parser import parse_gc_report
+
+
+# %%
+script_descr = """
+Micro-benchmark of the shared GC report parser against the previous pandas-based parser.
+
+Writes synthetic GC output files into a temporary folder, parses all of them with both
+implementations, and reports the number of files read per second.
+"""
+
+COMPOUNDS = [
+    "Ethanol",
+    "Acetone",
+    "1-Propanol",
+    "Butanol",
+    "Acetic acid",
+    "Propionic acid",
+    "Butyric acid",
+    "Lactic acid",
+]
+
+
+# %%
+def write_gc_report(gc_file, sample_id, compounds=COMPOUNDS):
+    """Write a synthetic GC output file with the same layout as the instrument's .txt export."""
+    lines = [
+        "[Header]",
+        "Data File Name,C:\\GCsolution\\Data\\sample_{}.gcd".format(sample_id),
+        "Output Date,3/22/2022",
+        "[Sample Information]",
+        "Sample Name,Sample {}".format(sample_id),
+        "Sample ID,{}".format(sample_id),
+        "[Compound Results(Ch1)]",
+        "# of IDs,{}".format(len(compounds)),
+        "ID#,Name,Ret. Time,Area,Height,Conc.,Curve,3rd,2nd,a,b,c",
+    ]
+    for number, compound in enumerate(compounds, start=1):
+        lines.append(
+            "{},{},{:.3f},{},{},{:.4f},Linear,0,0,0.0001,0,0".format(
+                number,
+                compound,
+                random.uniform(1, 20),
+                random.randint(1000, 900000),
+                random.randint(100, 90000),
+                random.uniform(0, 5),
+            )
+        )
+    lines += ["", "[Group Results(Ch1)]", "# of Groups,0", ""]
+    with open(gc_file, "w") as gc_content:
+        gc_content.write("\n".join(lines))
+
+
+def legacy_read_gc_data(gc_file):
+    """Previous implementation of read_gc_data, kept here as the benchmark baseline."""
+    with open(gc_file, "r") as gc_content:
+        gc_output = ""
+        sample_id = -999
+        for line in gc_content:
+            if "[Group Results(Ch1)]" in line:
+                break
+            if "Sample ID" in line:
+                try:
+                    sample_id = np.intc(line.split(",")[1])
+                except ValueError:
+                    pass
+            if "[Compound Results(Ch1)]" in line:
+                for line2 in gc_content:
+                    if "[Group Results(Ch1)]" in line2:
+                        break
+                    gc_output += line2
+                break
+    if sample_id >= 0:
+        gc_results = pd.read_csv(
+            io.StringIO(gc_output),
+            header=1,
+            usecols=["Name", "Conc."],
+            index_col="Name",
+        )
+        gc_compounds = gc_results.index.rename("Compound")
+        concs = (gc_results["Conc."] * 10).tolist()
+        return sample_id, gc_compounds, concs
+    else:
+        return -999, -999, -999
+
+
+def time_parser(parser, gc_files):
+    """Parse every file with the given function and return the number of files read per second."""
+    start = time.perf_counter()
+    for gc_file in gc_files:
+        parser(gc_file)
+    return len(gc_files) / (time.perf_counter() - start)
+
+
+# %%
+if __name__ == "__main__":
+    bench_parser = argparse.ArgumentParser(description=script_descr)
+    bench_parser.add_argument(
+        "-n", "--files",
+        help="Number of synthetic GC output files to parse (default: 2000).",
+        type=int,
+        default=2000,
+        metavar="<number>",
+    )
+    bench_args = bench_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        gc_files = []
+        for sample_id in range(bench_args.files):
+            gc_file = os.path.join(tmpdir, "sample_{}.txt".format(sample_id))
+            write_gc_report(gc_file, sample_id)
+            gc_files.append(gc_file)
+
+        # Both parsers must agree before their speeds are compared
+        for gc_file in gc_files[:50]:
+            sample_id, compounds, concs = legacy_read_gc_data(gc_file)
+            gc_report = parse_gc_report(gc_file)
+            assert gc_report.sample_id == sample_id
+            assert list(gc_report.compounds) == compounds.tolist()
+            assert np.allclose(gc_report.concs, concs)
+
+        legacy_rate = time_parser(legacy_read_gc_data, gc_files)
+        shared_rate = time_parser(parse_gc_report, gc_files)
+
+    print("{:<28}{:>14}".format("Parser", "Files/sec"))
+    print("{:<28}{:>14.1f}".format("pandas (previous)", legacy_rate))
+    print("{:<28}{:>14.1f}".format("gc_parser.parse_gc_report", shared_rate))
+    print("Speed-up: {:.1f}x".format(shared_rate / legacy_rate))
@@ -0,0 +1,84 @@
+# %%
+# Import necessary libraries
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from parse_alignment import readBLAST, BLAST_FIELDS
+
+
+# %%
+script_descr = """
+Benchmark of readBLAST against a plain pandas.read_table of the same tabular BLAST output,
+on a synthetic -outfmt 6 hit file (10 million hits by default).
+"""
+
+
+# %%
+def write_hit_file(blast_file, n_hits, n_queries=2000, n_subjects=50000, seed=0, chunksize=1_000_000):
+    """Write a synthetic -outfmt 6 file of n_hits hits, grouped by query and sorted by bit score within each query."""
+    rng = np.random.default_rng(seed)
+    queries = np.sort(rng.integers(0, n_queries, n_hits))
+    with open(blast_file, "w") as hit_file:
+        for first in range(0, n_hits, chunksize):
+            n = min(chunksize, n_hits - first)
+            qstart = rng.integers(1, 400, n)
+            sstart = rng.integers(1, 5_000_000, n)
+            length = rng.integers(30, 600, n)
+            bitscore = np.round(rng.uniform(20, 1000, n), 1)
+            chunk = pd.DataFrame(
+                {
+                    "qseqid": np.char.add("WP_", queries[first : first + n].astype(str)),
+                    "sseqid": np.char.add("NZ_CP0", rng.integers(0, n_subjects, n).astype(str)),
+                    "pident": np.round(rng.uniform(20, 100, n), 3),
+                    "length": length,
+                    "mismatch": rng.integers(0, 200, n),
+                    "gapopen": rng.integers(0, 20, n),
+                    "qstart": qstart,
+                    "qend": qstart + length // 3,
+                    "sstart": sstart,
+                    "send": sstart + length,
+                    "evalue": 10.0 ** rng.uniform(-150, 1, n),
+                    "bitscore": bitscore,
+                }
+            ).sort_values(["qseqid", "bitscore"], ascending=[True, False])
+            chunk.to_csv(hit_file, sep="\t", header=False, index=False, float_format="%.3g")
+
+
+def memory_mb(dataframe):
+    return dataframe.memory_usage(deep=True).sum() / 1e6
+
+
+# %%
+if __name__ == "__main__":
+    bench_parser = argparse.ArgumentParser(description=script_descr)
+    bench_parser.add_argument(
+        "-n", "--hits",
+        help="Number of synthetic hits (default: 10000000).",
+        type=int,
+        default=10_000_000,
+        metavar="<number>",
+    )
+    bench_args = bench_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        blast_file = os.path.join(tmpdir, "synthetic_hits.tsv")
+        print("Writing {} synthetic hits".format(bench_args.hits))
+        write_hit_file(blast_file, bench_args.hits)
+
+        runs = [
+            ("pandas.read_table", lambda: pd.read_table(blast_file, header=None, names=BLAST_FIELDS)),
+            ("readBLAST", lambda: readBLAST(blast_file)),
+            ("readBLAST evalue<=1e-10", lambda: readBLAST(blast_file, evalue=1e-10)),
+            ("readBLAST best 5 hits", lambda: readBLAST(blast_file, max_hits=5)),
+        ]
+        print("{:<28}{:>12}{:>12}{:>14}".format("Reader", "Time (s)", "Rows", "Memory (MB)"))
+        for name, reader in runs:
+            start = time.perf_counter()
+            hits = reader()
+            elapsed = time.perf_counter() - start
+            print("{:<28}{:>12.2f}{:>12}{:>14.1f}".format(name, elapsed, len(hits), memory_mb(hits)))
+            del hits
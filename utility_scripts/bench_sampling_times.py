@@ -0,0 +1,99 @@
+# %%
+# Import necessary libraries
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from clean_ferment_data import fill_sampling_times
+
+
+# %%
+script_descr = """
+Benchmark of fill_sampling_times against the previous per-column .map() loop, on synthetic fermentation data
+with 10^5 to 10^6 samples (e.g., high-throughput plate experiments).
+"""
+
+
+# %%
+def make_ferment_data(n_samples, n_time_points=24, seed=0):
+    """Make synthetic "Data" and "Sampling times" sheets with n_samples samples spread over n_time_points."""
+    rng = np.random.default_rng(seed)
+    ferment_times = pd.DataFrame(
+        {
+            "Actual sampling time": pd.Timestamp("2022-03-22 08:00")
+            + pd.to_timedelta(np.arange(n_time_points) * 3 + rng.uniform(0, 0.5, n_time_points), unit="h"),
+            "Sampled by": rng.choice(["HT", "EW"], n_time_points),
+        },
+        index=pd.Index(np.arange(n_time_points) * 3, name="Planned time point"),
+    )
+    ferment_data = pd.DataFrame(
+        {
+            "Culture type": rng.choice(["LP", "CT", "LP+CT 0h", "LP+CT 3h"], n_samples),
+            "Planned time point": rng.choice(ferment_times.index, n_samples),
+            "Replicate": rng.integers(1, 4, n_samples),
+            "OD600 1:1": rng.uniform(0, 2, n_samples),
+        },
+        index=pd.Index(np.arange(n_samples), name="Sample ID"),
+    )
+    return ferment_data, ferment_times
+
+
+def legacy_fill_sampling_times(ferment_data, ferment_times):
+    """Previous implementation from read_ferment_data, kept here as the benchmark baseline."""
+    for col in ferment_times.columns.tolist():
+        ferment_data.loc[:, col] = ferment_data.loc[:, "Planned time point"].map(
+            ferment_times[col]
+        )
+    ferment_data.loc[:, "Actual time point (h)"] = (
+        ferment_data["Actual sampling time"]
+        - ferment_times.loc[0, "Actual sampling time"]
+    ) / np.timedelta64(1, "h")
+    return ferment_data
+
+
+def best_time(fill_function, ferment_data, ferment_times, repeats):
+    """Return the fastest of repeats runs of fill_function, each on a fresh copy of ferment_data (not timed)."""
+    times = []
+    for _ in range(repeats):
+        data = ferment_data.copy()
+        start = time.perf_counter()
+        fill_function(data, ferment_times)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# %%
+if __name__ == "__main__":
+    bench_parser = argparse.ArgumentParser(description=script_descr)
+    bench_parser.add_argument(
+        "-n", "--samples",
+        help="Numbers of synthetic samples to benchmark (default: 100000 1000000).",
+        type=int,
+        nargs="+",
+        default=[100000, 1000000],
+        metavar="<number>",
+    )
+    bench_parser.add_argument(
+        "-r", "--repeats",
+        help="Number of timed runs of each version, of which the fastest is reported (default: 5).",
+        type=int,
+        default=5,
+        metavar="<number>",
+    )
+    bench_args = bench_parser.parse_args()
+
+    print("{:>10}{:>16}{:>18}{:>10}".format("Samples", "map loop (s)", "indexed join (s)", "Speed-up"))
+    for n_samples in bench_args.samples:
+        ferment_data, ferment_times = make_ferment_data(n_samples)
+        legacy_result = legacy_fill_sampling_times(ferment_data.copy(), ferment_times)
+        result = fill_sampling_times(ferment_data.copy(), ferment_times)
+        pd.testing.assert_frame_equal(result, legacy_result, check_like=True)
+
+        legacy_time = best_time(legacy_fill_sampling_times, ferment_data, ferment_times, bench_args.repeats)
+        join_time = best_time(fill_sampling_times, ferment_data, ferment_times, bench_args.repeats)
+        print(
+            "{:>10}{:>16.4f}{:>18.4f}{:>9.1f}x".format(
+                n_samples, legacy_time, join_time, legacy_time / join_time
+            )
+        )
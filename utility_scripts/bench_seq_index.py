@@ -0,0 +1,92 @@
+# %%
+# Import necessary libraries
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from Bio import SeqIO
+
+from bench_feature_index import make_feature_table
+from seq_index import FastaIndex, locus_sequences
+from bgzf_io import recompress_bgzf
+
+
+# %%
+script_descr = """
+Benchmark of extracting every CDS of a genome with FastaIndex against parsing the genome with SeqIO.parse and
+slicing (and reverse-complementing) the records, on a synthetic 5 Mb genome and feature table.
+FastaIndex is timed on the plain FASTA file and on its BGZF compressed copy.
+"""
+
+
+# %%
+def write_genome(fasta_path, genome_size, seq_id="NC_000001.1", line_length=80, seed=0):
+    """Write a random genome of genome_size bases to a FASTA file."""
+    rng = np.random.default_rng(seed)
+    genome = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, genome_size)].tobytes()
+    with open(fasta_path, "wb") as fasta:
+        fasta.write(">{} synthetic genome\n".format(seq_id).encode())
+        for line_start in range(0, genome_size, line_length):
+            fasta.write(genome[line_start : line_start + line_length] + b"\n")
+
+
+def seqio_extract(fasta_path, cds):
+    """Extract the CDS by parsing the whole genome into memory and slicing its records."""
+    records = {record.id: record.seq for record in SeqIO.parse(fasta_path, "fasta")}
+    sequences = []
+    for seq_id, start, end, strand in zip(cds["genomic_accession"], cds["start"], cds["end"], cds["strand"]):
+        seq = records[seq_id][start - 1 : end]
+        sequences.append(str(seq.reverse_complement() if strand == "-" else seq))
+    return sequences
+
+
+# %%
+if __name__ == "__main__":
+    bench_parser = argparse.ArgumentParser(description=script_descr)
+    bench_parser.add_argument(
+        "-n", "--genes",
+        help="Numbers of CDS in the genome (default: 1000 5000 20000).",
+        type=int,
+        nargs="+",
+        default=[1000, 5000, 20000],
+        metavar="<number>",
+    )
+    bench_args = bench_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fasta_path = os.path.join(tmpdir, "synthetic_genomic.fna")
+        feature_table, genome_size = make_feature_table()
+        write_genome(fasta_path, genome_size)
+        bgzf_path = recompress_bgzf(fasta_path, fasta_path + ".gz")
+
+        start = time.perf_counter()
+        FastaIndex(fasta_path).close()
+        FastaIndex(bgzf_path).close()
+        print("Indexes built in {:.4f} s for a {} b genome\n".format(time.perf_counter() - start, genome_size))
+
+        print("{:>10}{:>16}{:>16}{:>10}{:>16}".format("CDS", "SeqIO (s)", "index (s)", "Speed-up", "BGZF index (s)"))
+        for n_genes in bench_args.genes:
+            feature_table, genome_size = make_feature_table(n_genes=n_genes)
+            cds = feature_table[feature_table["# feature"] == "CDS"]
+
+            start = time.perf_counter()
+            seqio_sequences = seqio_extract(fasta_path, cds)
+            seqio_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with FastaIndex(fasta_path) as index:
+                index_sequences = locus_sequences(cds, index).tolist()
+            index_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with FastaIndex(bgzf_path) as index:
+                bgzf_sequences = locus_sequences(cds, index).tolist()
+            bgzf_time = time.perf_counter() - start
+
+            assert index_sequences == seqio_sequences == bgzf_sequences
+            print(
+                "{:>10}{:>16.3f}{:>16.4f}{:>9.0f}x{:>16.4f}".format(
+                    n_genes, seqio_time, index_time, seqio_time / index_time, bgzf_time
+                )
+            )
@@ -0,0 +1,164 @@
+# %%
+# Import necessary libraries
+import os
+import gzip
+import mmap
+import shutil
+import struct
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from Bio import bgzf
+
+
+# %%
+# Description of the block-gzip reader
+script_descr = """
+Random access to block-gzip (BGZF) compressed files, such as genome files kept compressed in the genome folder.
+
+BGZF files are ordinary gzip files made of independent blocks of at most 64 kb, so every gzip reader can still
+read them whole. The block index (".gzi" file next to the compressed file, in the samtools format) lists where each
+block starts in the compressed and uncompressed data, so a range of the uncompressed data is read by decompressing
+only the blocks that contain it.
+"""
+
+CHUNK_SIZE = 1 << 20
+
+# Number of decompressed blocks (up to 64 kb each) kept in memory by a BgzfFile
+BLOCK_CACHE_SIZE = 64
+
+
+# %%
+def is_bgzf(filepath):
+    """Check whether a file starts with a BGZF block (a gzip member with a "BC" extra subfield)."""
+    with open(filepath, "rb") as handle:
+        header = handle.read(18)
+    return len(header) == 18 and header[:4] == b"\x1f\x8b\x08\x04" and header[12:14] == b"BC"
+
+
+def _block_header(data, start):
+    """Return (size of the header, total size of the block) of the BGZF block starting at offset start."""
+    (xlen,) = struct.unpack_from("<H", data, start + 10)
+    extra = start + 12
+    while extra < start + 12 + xlen:
+        si1, si2, slen = struct.unpack_from("<BBH", data, extra)
+        if (si1, si2) == (66, 67):
+            (bsize,) = struct.unpack_from("<H", data, extra + 4)
+            return 12 + xlen, bsize + 1
+        extra += 4 + slen
+    raise ValueError(f"Not a BGZF block at offset {start}")
+
+
+def build_gzi(filepath, gzi_path=None):
+    """Index the blocks of a BGZF file and write the index to gzi_path (default: filepath + ".gzi").
+
+    The blocks are read from their headers, without decompressing them. The ".gzi" file is in the samtools format:
+    the number of blocks after the first, then their compressed and uncompressed offsets (little-endian uint64).
+    Returns the (compressed offsets, uncompressed offsets) lists of all blocks, starting with (0, 0).
+    """
+    compressed_offsets, uncompressed_offsets = [0], [0]
+    with open(filepath, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < len(data):
+            header_size, block_size = _block_header(data, start)
+            (isize,) = struct.unpack_from("<I", data, start + block_size - 4)
+            start += block_size
+            compressed_offsets.append(start)
+            uncompressed_offsets.append(uncompressed_offsets[-1] + isize)
+    # The offsets after the last block (the end of the file) are not blocks
+    compressed_offsets.pop()
+    uncompressed_offsets.pop()
+
+    gzi_path = gzi_path or filepath + ".gzi"
+    with open(gzi_path + ".tmp", "wb") as gzi:
+        gzi.write(struct.pack("<Q", len(compressed_offsets) - 1))
+        for offsets in zip(compressed_offsets[1:], uncompressed_offsets[1:]):
+            gzi.write(struct.pack("<QQ", *offsets))
+    os.replace(gzi_path + ".tmp", gzi_path)
+    return compressed_offsets, uncompressed_offsets
+
+
+def read_gzi(gzi_path):
+    """Read a samtools ".gzi" block index. Returns the (compressed offsets, uncompressed offsets) lists of all blocks."""
+    with open(gzi_path, "rb") as gzi:
+        (n_blocks,) = struct.unpack("<Q", gzi.read(8))
+        offsets = struct.unpack("<{}Q".format(2 * n_blocks), gzi.read(16 * n_blocks))
+    return [0] + list(offsets[0::2]), [0] + list(offsets[1::2])
+
+
+def recompress_bgzf(gzpath, outpath=None):
+    """Recompress a gzip file (e.g., as downloaded from the NCBI) as BGZF, in streaming chunks, and index its blocks.
+
+    An uncompressed file is compressed the same way. The file is replaced unless outpath is given (required for an
+    uncompressed file), and a file that is already BGZF is only indexed. Returns the BGZF path.
+    """
+    outpath = outpath or gzpath
+    if not is_bgzf(gzpath):
+        with open(gzpath, "rb") as handle:
+            gzipped = handle.read(2) == b"\x1f\x8b"
+        with (gzip.open if gzipped else open)(gzpath, "rb") as source, bgzf.BgzfWriter(
+            outpath + ".tmp", "wb"
+        ) as recompressed:
+            shutil.copyfileobj(source, recompressed, CHUNK_SIZE)
+        os.replace(outpath + ".tmp", outpath)
+    elif outpath != gzpath:
+        shutil.copyfile(gzpath, outpath)
+    build_gzi(outpath)
+    return outpath
+
+
+class BgzfFile:
+    """Random-access reader of the uncompressed data of a BGZF file, through a memory map of the compressed file.
+
+    The ".gzi" block index is built on first use, and rebuilt if the file is newer than it. The most recently
+    read blocks are kept decompressed (see BLOCK_CACHE_SIZE), so nearby reads do not decompress them again.
+    """
+
+    def __init__(self, filepath, cache_size=BLOCK_CACHE_SIZE):
+        self.filepath = filepath
+        gzi_path = filepath + ".gzi"
+        if not os.path.exists(gzi_path) or os.path.getmtime(gzi_path) < os.path.getmtime(filepath):
+            self._compressed_offsets, self._uncompressed_offsets = build_gzi(filepath, gzi_path)
+        else:
+            self._compressed_offsets, self._uncompressed_offsets = read_gzi(gzi_path)
+        self._file = open(filepath, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _block(self, number):
+        """Return the decompressed data of block number."""
+        try:
+            self._cache.move_to_end(number)
+            return self._cache[number]
+        except KeyError:
+            pass
+        start = self._compressed_offsets[number]
+        header_size, block_size = _block_header(self._data, start)
+        block = zlib.decompress(self._data[start + header_size : start + block_size - 8], -15)
+        self._cache[number] = block
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return block
+
+    def read(self, start, end):
+        """Return the uncompressed bytes from offset start to end, decompressing only the blocks that contain them."""
+        first = bisect_right(self._uncompressed_offsets, start) - 1
+        last = bisect_right(self._uncompressed_offsets, max(start, end - 1)) - 1
+        # Slice each block rather than joining whole blocks, as ranges are usually much smaller than a block
+        return b"".join(
+            self._block(number)[
+                max(start - self._uncompressed_offsets[number], 0) : end - self._uncompressed_offsets[number]
+            ]
+            for number in range(first, last + 1)
+        )
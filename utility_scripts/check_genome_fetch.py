@@ -0,0 +1,156 @@
+# %%
+# Import necessary libraries
+import os
+import gzip
+import socket
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import importlib.util
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from genome_fetch import FTPFetcher, fetch_assembly, fetch_file
+
+
+# %%
+script_descr = """
+Check of genome_fetch against local stand-ins of the NCBI's servers: an HTTP server (http.server) and, if pyftpdlib
+is installed, an FTP server with and without MLSD support.
+
+A synthetic assembly folder (with an "md5checksums.txt" and an "*_assembly_structure" subfolder) is downloaded twice
+from each server: the first run must download and rename every file (but not the subfolder), and the second must
+keep them all. Partial downloads are resumed, and an FTP connection broken mid-transfer is replaced for the next file.
+Exits with an AssertionError on the first failed check.
+"""
+
+ASSEMBLY_NAME = "GCF_000001.1_ASM1"
+
+
+# %%
+def make_assembly(root):
+    """Write a synthetic assembly folder into root. Returns {file name: content} of its files."""
+    assembly_dir = os.path.join(root, ASSEMBLY_NAME)
+    os.makedirs(os.path.join(assembly_dir, ASSEMBLY_NAME + "_assembly_structure"))
+    files = {
+        ASSEMBLY_NAME + "_genomic.fna.gz": gzip.compress(b">NC_000001.1\n" + b"ACGT" * 50000 + b"\n"),
+        ASSEMBLY_NAME + "_feature_table.txt.gz": gzip.compress(b"# feature\tclass\nCDS\twith_protein\n"),
+        "README.txt": b"Synthetic assembly\n",
+    }
+    checksums = "".join("{}  ./{}\n".format(hashlib.md5(content).hexdigest(), name) for name, content in files.items())
+    files["md5checksums.txt"] = checksums.encode()
+    for name, content in files.items():
+        with open(os.path.join(assembly_dir, name), "wb") as outfile:
+            outfile.write(content)
+    return files
+
+
+def serve_http(root):
+    """Serve root over HTTP from a background thread. Returns the server and its address."""
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+def serve_ftp(root, mlsd=True):
+    """Serve root over anonymous FTP (pyftpdlib) from a background thread. Returns the server and its address."""
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    # serve_forever logs every command unless the pyftpdlib logger already has a handler
+    logger = logging.getLogger("pyftpdlib")
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(root)
+    proto_cmds = dict(FTPHandler.proto_cmds)
+    if not mlsd:
+        del proto_cmds["MLSD"]
+    handler = type("Handler", (FTPHandler,), {"authorizer": authorizer, "proto_cmds": proto_cmds})
+    server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={"handle_exit": False}, daemon=True).start()
+    return server, "ftp://127.0.0.1:{}".format(server.address[1])
+
+
+def check_fetch_assembly(address, outdir, files):
+    """Download the assembly twice from address into outdir and check the files and their statuses."""
+    expected = {name.replace(ASSEMBLY_NAME, "Organism"): content for name, content in files.items()}
+    del expected["md5checksums.txt"]
+
+    statuses = fetch_assembly(address + "/" + ASSEMBLY_NAME, outdir, "Organism", connections=2)
+    assert statuses == dict.fromkeys(expected, "downloaded"), statuses
+    for name, content in expected.items():
+        with open(os.path.join(outdir, name), "rb") as infile:
+            assert infile.read() == content, name
+    assert not os.path.exists(os.path.join(outdir, "Organism_assembly_structure"))
+
+    statuses = fetch_assembly(address + "/" + ASSEMBLY_NAME, outdir, "Organism", connections=2)
+    assert statuses == dict.fromkeys(expected, "present"), statuses
+
+
+def check_resume(fetcher, outdir, files):
+    """Resume a partial download of the genome and check its content."""
+    name = ASSEMBLY_NAME + "_genomic.fna.gz"
+    outpath = os.path.join(outdir, "resumed.fna.gz")
+    with open(outpath + ".part", "wb") as part:
+        part.write(files[name][: len(files[name]) // 2])
+    assert fetch_file(fetcher, name, outpath, hashlib.md5(files[name]).hexdigest()) == "downloaded"
+    with open(outpath, "rb") as infile:
+        assert infile.read() == files[name]
+
+
+def check_broken_connection(fetcher, outdir, files):
+    """Break the fetcher's FTP connection and check that the failed transfer is followed by a working one."""
+    name = "README.txt"
+    fetcher._connection().sock.shutdown(socket.SHUT_RDWR)
+    with open(os.path.join(outdir, "broken.txt"), "wb") as outfile:
+        try:
+            fetcher.fetch(name, outfile)
+        except (OSError, EOFError) as error:
+            print("    broken transfer raised {}".format(type(error).__name__))
+        else:
+            raise AssertionError("A transfer over a closed connection did not fail")
+    with open(os.path.join(outdir, "retried.txt"), "wb") as outfile:
+        fetcher.fetch(name, outfile)
+    with open(os.path.join(outdir, "retried.txt"), "rb") as infile:
+        assert infile.read() == files[name]
+
+
+# %%
+if __name__ == "__main__":
+    check_parser = argparse.ArgumentParser(description=script_descr)
+    check_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = os.path.join(tmpdir, "server")
+        files = make_assembly(root)
+
+        server, address = serve_http(root)
+        check_fetch_assembly(address, os.path.join(tmpdir, "http"), files)
+        print("HTTP: OK")
+        server.shutdown()
+
+        if importlib.util.find_spec("pyftpdlib") is None:
+            print("FTP: skipped (pyftpdlib is not installed)")
+        else:
+            for mlsd in (True, False):
+                server, address = serve_ftp(root, mlsd)
+                outdir = os.path.join(tmpdir, "ftp_mlsd" if mlsd else "ftp_nlst")
+                check_fetch_assembly(address, outdir, files)
+                fetcher = FTPFetcher(address + "/" + ASSEMBLY_NAME)
+                try:
+                    check_resume(fetcher, outdir, files)
+                    check_broken_connection(fetcher, outdir, files)
+                finally:
+                    fetcher.close()
+                print("FTP ({}): OK".format("MLSD" if mlsd else "NLST"))
+                server.close_all()
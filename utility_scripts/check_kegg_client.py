@@ -0,0 +1,139 @@
+# %%
+# Import necessary libraries
+import io
+import os
+import glob
+import time
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+
+from download_KEGG_entry import KEGGClient, KEGG_BATCH
+
+
+# %%
+script_descr = """
+Check of the KEGG client (download_KEGG_entry.KEGGClient) against a local stand-in of KEGG's /get endpoint.
+
+The stand-in returns at most 10 entries per request (404 if none is found), and can be told to answer the next
+requests with an error status or to break off a response in the middle of an entry. The checks cover batching,
+entry order, missing entries, the cache, retries within the rate limit and that no partial entry is ever cached.
+Exits with an AssertionError on the first failed check.
+"""
+
+RATE = 20
+
+
+# %%
+class KEGGStandIn(BaseHTTPRequestHandler):
+    """Answers /get/<id>+<id>.../<datatype> like KEGG. Accessions ending with "x" are not found."""
+
+    protocol_version = "HTTP/1.1"
+    requests_log = []
+    failures = []
+
+    def do_GET(self):
+        _, _, ids, datatype = self.path.split("/")
+        ids = ids.split("+")
+        self.requests_log.append((time.monotonic(), ids))
+        failure = self.failures.pop(0) if self.failures else None
+        if len(ids) > KEGG_BATCH:
+            self.send_error(400)
+            return
+        if isinstance(failure, int):
+            self.send_error(failure)
+            return
+        found = [accession for accession in ids if not accession.endswith("x")]
+        if not found:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for number, accession in enumerate(found):
+            entry = entry_text(accession, datatype).encode()
+            if failure == "truncate" and number == len(found) - 1:
+                # Break off the response in the middle of the last entry
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(entry) // 2, entry[: len(entry) // 2]))
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(entry), entry))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def entry_text(accession, datatype):
+    """Return the FASTA entry served for an accession."""
+    return ">{} gene {} ({})\n{}\nTTGA\n".format(accession, accession, datatype, "ACGT" * 30)
+
+
+def check_spacing(requests_log):
+    """Check that the requests were sent at most RATE per second on average.
+
+    The times are those of arrival at the stand-in, which vary with thread scheduling, so single gaps are not checked:
+    the window from the first to the last request must only last at least half of (requests - 1) / RATE.
+    """
+    times = sorted(request_time for request_time, ids in requests_log)
+    window = times[-1] - times[0]
+    assert window >= 0.5 * (len(times) - 1) / RATE, (window, len(times))
+
+
+def check_download(client, accessions, datatype):
+    """Download accessions and check the output order, the missing entries and the batches sent."""
+    fasta_file = io.BytesIO()
+    not_found = client.get(accessions, datatype, fasta_file)
+    assert not_found == [accession for accession in accessions if accession.endswith("x")], not_found
+    expected = "".join(entry_text(accession, datatype) for accession in accessions if not accession.endswith("x"))
+    assert fasta_file.getvalue().decode() == expected
+    assert all(len(ids) <= KEGG_BATCH for request_time, ids in KEGGStandIn.requests_log)
+
+
+# %%
+if __name__ == "__main__":
+    check_parser = argparse.ArgumentParser(description=script_descr)
+    check_parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KEGGStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = KEGGClient(cache_dir, connections=3, rate=RATE, base_url=base_url, backoff=0.01)
+        accessions = ["eco:b{:04d}".format(number) for number in range(25)] + ["eco:b9999x", "eco:b9998x"]
+
+        check_download(client, accessions, "ntseq")
+        assert len(KEGGStandIn.requests_log) == 3, len(KEGGStandIn.requests_log)
+        check_spacing(KEGGStandIn.requests_log)
+        print("Batches, order and missing entries: OK")
+
+        KEGGStandIn.requests_log.clear()
+        check_download(client, accessions[::-1], "ntseq")
+        # Only the batch of the missing entries is sent again
+        assert len(KEGGStandIn.requests_log) == 1, KEGGStandIn.requests_log
+        print("Cache: OK")
+
+        KEGGStandIn.requests_log.clear()
+        KEGGStandIn.failures[:] = [503, 429, "truncate"]
+        check_download(client, accessions[:10], "aaseq")
+        assert len(KEGGStandIn.requests_log) == 4, len(KEGGStandIn.requests_log)
+        check_spacing(KEGGStandIn.requests_log)
+        assert not glob.glob(os.path.join(cache_dir, "*", "*.tmp"))
+        print("Retries within the rate limit: OK")
+
+        KEGGStandIn.failures[:] = ["truncate"] * (client.retries + 1)
+        try:
+            client.get(["eco:b1000", "eco:b1001"], "aaseq", io.BytesIO())
+        except requests.RequestException as error:
+            print("    broken response raised {}".format(type(error).__name__))
+        else:
+            raise AssertionError("A broken response did not fail after all retries")
+        assert not os.path.exists(client.cache_path("eco:b1001", "aaseq"))
+        assert not glob.glob(os.path.join(cache_dir, "*", "*.tmp"))
+        print("No partial entry cached: OK")
+        client.close()
+    server.shutdown()
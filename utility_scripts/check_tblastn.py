@@ -0,0 +1,109 @@
+# %%
+# Import necessary libraries
+import io
+import os
+import shutil
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+
+from parse_alignment import run_tblastn
+
+
+# %%
+script_descr = """
+Check of run_tblastn with BLAST+ (makeblastdb and tblastn must be on the PATH) on a small synthetic genome.
+
+Proteins are back-translated into a random 30 kb genome, half of them on the minus strand, and their query FASTA mixes
+plain and "lcl|" IDs. The query is searched in several shards against the genome's nucleotide database (twice, under
+two names): every query must be found at its exact position with 100% identity, with the hits sorted by query in
+FASTA order and then by database, and the searches must be skipped when run again.
+Exits with an AssertionError on the first failed check.
+"""
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+# One codon per amino acid
+CODONS = dict(
+    zip(
+        AMINO_ACIDS,
+        [
+            "GCT", "TGT", "GAT", "GAA", "TTT", "GGT", "CAT", "ATT", "AAA", "CTG",
+            "ATG", "AAT", "CCG", "CAG", "CGT", "AGC", "ACC", "GTG", "TGG", "TAT",
+        ],
+    )
+)
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+# %%
+def write_genome_and_queries(genome_fasta, query_fasta, n_proteins=8, protein_length=120, seed=0):
+    """Write a random genome with n_proteins back-translated proteins, and the proteins as a query FASTA file.
+
+    The query IDs are listed in decreasing order (prot8, prot7...), so FASTA order is not sorted order.
+    Returns [(query ID without "lcl|", start, end, strand)] of the proteins in FASTA order (1-based genome positions).
+    """
+    rng = np.random.default_rng(seed)
+    genome = list(np.array(list("ACGT"))[rng.integers(0, 4, 30_000)])
+    proteins = []
+    with open(query_fasta, "w") as queries:
+        for number in range(n_proteins):
+            protein = "".join(np.array(list(AMINO_ACIDS))[rng.integers(0, 20, protein_length)])
+            coding = "".join(CODONS[amino_acid] for amino_acid in protein)
+            start = 1000 + number * 3500
+            strand = "+" if number % 2 == 0 else "-"
+            if strand == "-":
+                coding = coding.translate(COMPLEMENT)[::-1]
+            genome[start - 1 : start - 1 + len(coding)] = coding
+            query_id = "prot{}".format(n_proteins - number)
+            prefix = "lcl|" if number % 3 == 0 else ""
+            queries.write(">{}{} synthetic protein\n{}\n".format(prefix, query_id, protein))
+            proteins.append((query_id, start, start + len(coding) - 1, strand))
+    with open(genome_fasta, "w") as genome_file:
+        genome_file.write(">chr1 synthetic genome\n")
+        sequence = "".join(genome)
+        for line_start in range(0, len(sequence), 80):
+            genome_file.write(sequence[line_start : line_start + 80] + "\n")
+    return proteins
+
+
+# %%
+if __name__ == "__main__":
+    check_parser = argparse.ArgumentParser(description=script_descr)
+    check_parser.parse_args()
+
+    if shutil.which("makeblastdb") is None or shutil.which("tblastn") is None:
+        print("tblastn: skipped (BLAST+ is not installed)")
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            genome_fasta = os.path.join(tmpdir, "genome.fna")
+            query_fasta = os.path.join(tmpdir, "queries.faa")
+            proteins = write_genome_and_queries(genome_fasta, query_fasta)
+            subprocess.run(
+                ["makeblastdb", "-dbtype", "nucl", "-in", genome_fasta],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            dbs = {"genome_b": genome_fasta, "genome_a": genome_fasta}
+            workdir = os.path.join(tmpdir, "work")
+
+            # The best hit of each query in each database
+            hits = run_tblastn(query_fasta, dbs, workdir, jobs=2, threads=2, shards=3, evalue=1e-10, max_hits=2)
+            assert hits["qseqid"].notna().all(), hits
+            assert hits["qseqid"].astype(str).str.replace("lcl|", "", regex=False).tolist() == [
+                query_id for query_id, start, end, strand in proteins for db in dbs
+            ], hits
+            assert hits["db"].astype(str).tolist() == list(dbs) * len(proteins), hits
+            for hit, (query_id, start, end, strand) in zip(hits.iloc[:: len(dbs)].itertuples(), proteins):
+                assert hit.pident == 100, hit
+                expected = (start, end) if strand == "+" else (end, start)
+                assert (hit.sstart, hit.send) == expected, (hit, expected)
+            print("tblastn hits, positions and order: OK")
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                rerun = run_tblastn(query_fasta, dbs, workdir, jobs=2, threads=2, shards=3, evalue=1e-10, max_hits=2)
+            assert rerun.equals(hits)
+            assert output.getvalue().count("Skipping") == 3 * len(dbs), output.getvalue()
+            print("tblastn rerun: OK")
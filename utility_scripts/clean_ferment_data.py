@@ -3,51 +3,74 @@
 import sys
 import glob
 import os
-import io
 import csv
+import time
+import itertools
+import queue
+import argparse
 import numpy as np
 import pandas as pd
 
+from gc_parser import parse_gc_report, parse_gc_reports
+from ferment_io import FORMATS, DEFAULT_FORMATS, write_dataframe, read_workbook_sheets
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    # Watch mode falls back to polling the "gc_output" folder
+    Observer = None
+    FileSystemEventHandler = object
+
 
 # %%
 # Description of how to use this ferment data cleaning tool
 script_descr = """
 Fills in the actual sampling time points and compound concentration results from gas chromatography for all samples recorded in an Excel file.
 
-Accepts exactly one argument, which is the path to an Excel file containing at least three spreadsheets:
+Accepts one argument, which is the path to an Excel file containing at least three spreadsheets:
     1. "Culture types" - This sheet explains the experimental setup for the sample types.
     2. "Sampling times" - This sheet contains the actual date & time at which samples were taken for measurements.
     3. "Data" - This sheet contains recorded experimental measurements (e.g., optical density, pH). The missing data will be populated into this sheet.
 
 The folder containing the raw data Excel file should have a folder named "gc_output" containing output files from the GC system. The GC output files may also be contained in one level of subfolders within the "gc_output" folder.
 
-Returns 2 files containing cleaned data and 1 file containing the list of compounds measured by gas chromatography into the folder "cleaned_data":
-    1. "*cleaned.csv"
-    2. "*cleaned.xlsx"
-    3. "*compound_list.csv"
+With the "--watch" option, the script keeps running after cleaning the data and records new GC output files into the cleaned data files as they are created, without reading the Excel file or the older GC output files again.
+
+Returns files containing cleaned data and 1 file containing the list of compounds measured by gas chromatography into the folder "cleaned_data":
+    1. "*cleaned.csv" and "*cleaned.xlsx" (default), and/or "*cleaned.parquet" and "*cleaned.feather" (see "--format")
+    2. "*compound_list.csv"
+
+Parsed GC output files are cached in "*gc_cache.sqlite" in the same folder, so that reruns only read new or changed files.
 """
 
 
 # %%
 # Read fermentation spreadsheets into dataframes
-def read_ferment_data(fermentfile):
+def read_ferment_data(fermentfile, cache=True):
     """Read in Excel spreadsheet, clean data, and return data as pandas DataFrames.
 
+    The workbook is opened once for all 3 spreadsheets. With cache = True (default), the spreadsheets are cached
+    next to the workbook and only read from the workbook again after it has changed.
+
     The 3 resulting dataframes are:
         1. ferment_data, containing the experimental measurements
         2. ferment_times, containing the time at which samples were actually taken for measurements
         3. ferment_cultures, containing the experimental setup of the sample types
     """
 
-    ferment_data = pd.read_excel(fermentfile, sheet_name="Data", index_col="Sample ID")
-
-    ferment_times = pd.read_excel(
-        fermentfile, sheet_name="Sampling times", index_col="Planned time point"
-    )
-
-    ferment_cultures = pd.read_excel(
-        fermentfile, sheet_name="Culture types", index_col="Culture type"
+    ferment_sheets = read_workbook_sheets(
+        fermentfile,
+        {
+            "Data": "Sample ID",
+            "Sampling times": "Planned time point",
+            "Culture types": "Culture type",
+        },
+        cache=cache,
     )
+    ferment_data = ferment_sheets["Data"]
+    ferment_times = ferment_sheets["Sampling times"]
+    ferment_cultures = ferment_sheets["Culture types"]
 
     # Drop completely empty columns
     ferment_data.drop(
@@ -59,20 +82,50 @@ def read_ferment_data(fermentfile):
     #     ferment_data.loc[:,col] = ferment_data.loc[:,'Culture type'].map(ferment_cultures[col])
 
     # Fill in sampling time for all samples in ferment_data, using data from ferment_times
-    for col in ferment_times.columns.tolist():
-        ferment_data.loc[:, col] = ferment_data.loc[:, "Planned time point"].map(
-            ferment_times[col]
-        )
-
-    # Calculate actual sampling time points
-    ferment_data.loc[:, "Actual time point (h)"] = (
-        ferment_data["Actual sampling time"]
-        - ferment_times.loc[0, "Actual sampling time"]
-    ) / np.timedelta64(1, "h")
+    ferment_data = fill_sampling_times(ferment_data, ferment_times)
 
     return (ferment_data, ferment_times, ferment_cultures)
 
 
+# %%
+# Fill in sampling times and elapsed time for every sample
+def fill_sampling_times(
+    ferment_data,
+    ferment_times,
+    time_point_col="Planned time point",
+    time_col="Actual sampling time",
+    start_time_point=0,
+):
+    """Join the sampling times onto the fermentation data and calculate the actual time point (h) of each sample.
+
+    ferment_times is indexed by planned time point, and each of its time points can be shared by many samples
+    (many-to-one from ferment_data, a ValueError is raised if a planned time point is listed twice).
+    The elapsed time is counted from the sampling time of start_time_point, and is calculated once per planned
+    time point in ferment_times rather than once per sample. The planned time point of every sample is then
+    looked up once in the ferment_times index, and all columns (with "Actual time point (h)") are joined
+    onto ferment_data by that lookup, replacing existing columns of the same name.
+
+    ferment_data is modified in place and returned, keeping its index (Sample ID) and row order.
+    """
+    if not ferment_times.index.is_unique:
+        raise ValueError(
+            "Planned time point(s) listed more than once in the sampling times: {}".format(
+                ", ".join(str(time_point) for time_point in ferment_times.index[ferment_times.index.duplicated()])
+            )
+        )
+    ferment_times = ferment_times.assign(
+        **{
+            "Actual time point (h)": (ferment_times[time_col] - ferment_times.loc[start_time_point, time_col])
+            / np.timedelta64(1, "h")
+        }
+    )
+    # Row of each sample's planned time point in ferment_times (-1 if it is not listed, giving missing values)
+    rows = ferment_times.index.get_indexer(ferment_data[time_point_col].to_numpy())
+    for col in ferment_times.columns:
+        ferment_data[col] = ferment_times[col].array.take(rows, allow_fill=True)
+    return ferment_data
+
+
 # %%
 # Read GC results into fermentation dataframe
 def read_gc_result(ferment_dataframe, gc_file):
@@ -80,77 +133,362 @@ def read_gc_result(ferment_dataframe, gc_file):
     
     Uses the unique sample ID to correctly match concentration results to each sample.
     """
-    with open(gc_file, "r") as gc_content:
-        gc_output = ""
-        line_number = 0
-        sample_id = -999
-        for line in gc_content:
-            line_number += 1
-            if "[Group Results(Ch1)]" in line:
-                break
-            if "Sample ID" in line:
+    gc_report = parse_gc_report(gc_file)
+    if gc_report is not None:
+        return record_gc_report(ferment_dataframe, gc_report)
+    else:
+        pass
+
+
+def record_gc_report(ferment_dataframe, gc_report):
+    """Record the concentrations of an already parsed GC report into the fermentation dataframe."""
+    gc_compounds = pd.Index(gc_report.compounds, name="Compound")
+    ferment_dataframe.loc[gc_report.sample_id, gc_compounds] = gc_report.concs
+    return gc_compounds
+
+
+def gc_reports_to_long(gc_reports):
+    """Collect parsed GC reports into one long-format table with "Sample ID", "Compound" and "Conc." columns.
+
+    Reports that are None (files without a valid sample ID) are skipped.
+    """
+    gc_reports = [gc_report for gc_report in gc_reports if gc_report is not None]
+    compound_counts = [len(gc_report.compounds) for gc_report in gc_reports]
+    return pd.DataFrame(
+        {
+            "Sample ID": np.repeat(
+                np.array([gc_report.sample_id for gc_report in gc_reports], dtype=np.int64),
+                compound_counts,
+            ),
+            "Compound": list(
+                itertools.chain.from_iterable(gc_report.compounds for gc_report in gc_reports)
+            ),
+            "Conc.": np.fromiter(
+                itertools.chain.from_iterable(gc_report.concs for gc_report in gc_reports),
+                dtype=float,
+                count=sum(compound_counts),
+            ),
+        }
+    )
+
+
+def pivot_gc_results(gc_long, duplicates="last"):
+    """Pivot long-format GC results into one row per sample and one column per compound.
+
+    duplicates = "last", "mean", or "error" (optional), for samples injected more than once.
+        "last" : (default) keep the result of the last report read, as recording the reports one by one would
+        "mean" : average the results of all injections
+        "error" : raise a ValueError listing the duplicated sample IDs
+    """
+    gc_compounds = pd.Index(gc_long["Compound"].unique(), name="Compound")
+    duplicated = gc_long.duplicated(subset=["Sample ID", "Compound"], keep=False)
+    if duplicated.any():
+        if duplicates == "last":
+            gc_long = gc_long.drop_duplicates(subset=["Sample ID", "Compound"], keep="last")
+        elif duplicates == "mean":
+            gc_long = gc_long.groupby(["Sample ID", "Compound"], as_index=False, sort=False)[
+                "Conc."
+            ].mean()
+        elif duplicates == "error":
+            raise ValueError(
+                "Sample(s) with more than one GC result: {}".format(
+                    ", ".join(str(sample_id) for sample_id in gc_long.loc[duplicated, "Sample ID"].unique())
+                )
+            )
+        else:
+            raise ValueError(f"Unknown duplicates policy: {duplicates!r}")
+    gc_wide = gc_long.pivot(index="Sample ID", columns="Compound", values="Conc.")
+    return gc_wide.reindex(columns=gc_compounds)
+
+
+def merge_gc_reports(ferment_dataframe, gc_reports, duplicates="last"):
+    """Record the concentrations of many parsed GC reports into the fermentation dataframe in a single step.
+
+    The reports are pivoted once into a sample × compound table, which is then joined onto the fermentation dataframe.
+    Samples and compounds not yet in the dataframe are added, as with record_gc_report.
+    See pivot_gc_results for the duplicates policy.
+    Every concentration in the reports is written, including missing ones (NaN), while the compounds that are not in
+    any report of a sample keep their values, as when recording the reports one by one.
+
+    Returns the merged dataframe and the compounds measured.
+    """
+    gc_long = gc_reports_to_long(gc_reports)
+    gc_wide = pivot_gc_results(gc_long, duplicates)
+    reported = (
+        gc_long.drop_duplicates(subset=["Sample ID", "Compound"])
+        .assign(reported=True)
+        .pivot(index="Sample ID", columns="Compound", values="reported")
+        .reindex(index=gc_wide.index, columns=gc_wide.columns)
+        .notna()
+    )
+    ferment_dataframe = ferment_dataframe.reindex(
+        index=ferment_dataframe.index.union(gc_wide.index, sort=False),
+        columns=ferment_dataframe.columns.union(gc_wide.columns, sort=False),
+    )
+    ferment_dataframe.loc[gc_wide.index, gc_wide.columns] = gc_wide.where(
+        reported, ferment_dataframe.loc[gc_wide.index, gc_wide.columns]
+    )
+    return ferment_dataframe, gc_wide.columns
+
+
+# %%
+# List and watch GC output files
+def scan_gc_output(gc_dir="gc_output"):
+    """List the GC output files (.txt) in gc_dir, including those in one level of subfolders."""
+    gc_filepaths = []
+    with os.scandir(gc_dir) as gc_scan:
+        for entry1 in gc_scan:
+            if entry1.is_dir():
+                with os.scandir(entry1) as gc_sub_scan:
+                    for entry2 in gc_sub_scan:
+                        if entry2.is_file() and entry2.name.endswith(".txt"):
+                            gc_filepaths.append(entry2.path)
+            elif entry1.is_file() and entry1.name.endswith(".txt"):
+                gc_filepaths.append(entry1.path)
+    return gc_filepaths
+
+
+def _file_signature(filepath):
+    """Return the size and modification time of a file, used to detect new or changed files."""
+    file_stat = os.stat(filepath)
+    return (file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def _poll_gc_output(gc_dir, interval):
+    """Yield the full listing of gc_dir every interval seconds."""
+    while True:
+        time.sleep(interval)
+        yield scan_gc_output(gc_dir)
+
+
+def _notify_gc_output(gc_dir, interval):
+    """Yield the files in gc_dir reported as created or modified by the operating system (e.g., inotify).
+
+    Events are collected for interval seconds after the first one, so that a file being written is handled once.
+    """
+    gc_events = queue.Queue()
+
+    class GCEventHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if not event.is_directory:
+                gc_events.put(getattr(event, "dest_path", None) or event.src_path)
+
+    observer = Observer()
+    observer.schedule(GCEventHandler(), gc_dir, recursive=True)
+    observer.start()
+    try:
+        while True:
+            gc_filepaths = {gc_events.get()}
+            time.sleep(interval)
+            while not gc_events.empty():
+                gc_filepaths.add(gc_events.get())
+            yield sorted(gc_filepaths)
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def watch_gc_output(
+    ferment_dataframe,
+    gc_filepaths,
+    outbase,
+    formats=["csv"],
+    cache_file=None,
+    interval=5,
+    gc_dir="gc_output",
+    gc_reports=None,
+    compounds=(),
+    duplicates="last",
+):
+    """Watch gc_dir for new or changed GC output files and record them into the fermentation dataframe as they land.
+
+    gc_filepaths are the files that were already recorded, with their parsed gc_reports (optional, read from the
+    files otherwise), which are not read again unless they change. The samples of new files are merged again
+    from all of their reports with merge_gc_reports and the duplicates policy, so samples injected more than once
+    are recorded as in a full run; a sample rejected by duplicates = "error" is reported and left unchanged.
+    Only the rows of the updated samples change, and the output files (outbase + extension of each format)
+    are rewritten atomically after each update.
+    Uses the operating system's file notifications if the 'watchdog' package is installed, and polls gc_dir otherwise.
+    Runs until interrupted (Ctrl+C), then returns the updated dataframe and the compounds measured.
+    """
+    if gc_reports is None:
+        gc_reports = parse_gc_reports(gc_filepaths, cache_file=cache_file)
+    compounds = pd.Index(compounds, name="Compound")
+    seen = {}
+    # Parsed report of each file, with the most recently read files last (as the "last" duplicates policy expects)
+    file_reports = {}
+    for gc_filepath, gc_report in zip(gc_filepaths, gc_reports):
+        seen[os.path.normpath(gc_filepath)] = _file_signature(gc_filepath)
+        file_reports[os.path.normpath(gc_filepath)] = gc_report
+
+    if Observer is not None:
+        gc_changes = _notify_gc_output(gc_dir, interval)
+    else:
+        gc_changes = _poll_gc_output(gc_dir, interval)
+
+    try:
+        for changed_filepaths in gc_changes:
+            updated_samples = []
+            for gc_filepath in changed_filepaths:
+                gc_filepath = os.path.normpath(gc_filepath)
+                if not gc_filepath.endswith(".txt"):
+                    continue
+                try:
+                    signature = _file_signature(gc_filepath)
+                except FileNotFoundError:
+                    continue
+                if seen.get(gc_filepath) == signature:
+                    continue
+                seen[gc_filepath] = signature
                 try:
-                    sample_id = np.intc(line.split(",")[1])
+                    gc_report = parse_gc_reports([gc_filepath], cache_file=cache_file, incomplete="raise")[0]
                 except ValueError:
-                    pass
-            if "[Compound Results(Ch1)]" in line:
-                for line2 in gc_content:
-                    if "[Group Results(Ch1)]" in line2:
-                        break
-                    gc_output += line2
-                break
-    if sample_id >= 0:
-        gc_results = pd.read_csv(
-            io.StringIO(gc_output),
-            header=1,
-            usecols=["Name", "Conc."],
-            index_col="Name",
-        )
-        gc_compounds = gc_results.index.rename("Compound")
-        ferment_dataframe.loc[sample_id, gc_compounds] = (
-            gc_results["Conc."] * 10
-        ).tolist()
-        return gc_compounds
-    else:
+                    # The GC system is still writing this file, it will be read again once it changes
+                    continue
+                file_reports.pop(gc_filepath, None)
+                file_reports[gc_filepath] = gc_report
+                if gc_report is not None and gc_report.sample_id not in updated_samples:
+                    updated_samples.append(gc_report.sample_id)
+            if not updated_samples:
+                continue
+
+            sample_reports = [
+                gc_report
+                for gc_report in file_reports.values()
+                if gc_report is not None and gc_report.sample_id in updated_samples
+            ]
+            try:
+                ferment_dataframe, gc_compounds = merge_gc_reports(ferment_dataframe, sample_reports, duplicates)
+            except ValueError as error:
+                print("GC results not recorded: {}".format(error), file=sys.stderr)
+                continue
+            compounds = compounds.union(gc_compounds, sort=False)
+            outpaths = write_dataframe(ferment_dataframe, outbase, formats, compounds=compounds)
+            print(
+                "Recorded GC results for sample(s) {} into {}".format(
+                    ", ".join(str(sample_id) for sample_id in updated_samples), ", ".join(outpaths)
+                )
+            )
+    except KeyboardInterrupt:
         pass
+    return ferment_dataframe, compounds
+
+# %%
+clean_ferment_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+    add_help=False,
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+)
+clean_ferment_parser.add_argument(
+    "ferment_inpath",
+    help="Path to the Excel file containing the raw fermentation data.",
+    metavar="<file>",
+)
+clean_ferment_parser.add_argument(
+    "-j",
+    "--jobs",
+    help="Number of worker processes used to read the GC output files (default: 1).",
+    type=int,
+    default=1,
+    metavar="<jobs>",
+)
+clean_ferment_parser.add_argument(
+    "--rebuild-cache",
+    help="Ignore the parse cache kept in the \"cleaned_data\" folder and read all GC output files again. By default, only new or changed files are read.",
+    action="store_true",
+)
+clean_ferment_parser.add_argument(
+    "-d",
+    "--duplicates",
+    help="How to handle samples with more than one GC output file: keep the 'last' file read (default), take the 'mean' of all injections, or stop with an 'error' (in --watch mode, the sample is reported and left unchanged).",
+    choices=["last", "mean", "error"],
+    default="last",
+)
+clean_ferment_parser.add_argument(
+    "--format",
+    help="File format of the cleaned data: csv, xlsx, parquet, or feather. Can be used multiple times (default: csv and xlsx). Parquet and Feather files keep typed columns and load much faster.",
+    choices=FORMATS,
+    action="append",
+)
+clean_ferment_parser.add_argument(
+    "-w",
+    "--watch",
+    help="After cleaning the data, keep watching the \"gc_output\" folder and record new GC output files into the cleaned data files (except .xlsx) as they are created. Stop with Ctrl+C, after which all output files are saved again.",
+    action="store_true",
+)
+clean_ferment_parser.add_argument(
+    "--interval",
+    help="Number of seconds between checks of the \"gc_output\" folder in watch mode (default: 5).",
+    type=float,
+    default=5,
+    metavar="<seconds>",
+)
 
 
 # %%
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        # Display script description if incorrectly called
-        print(script_descr)
+    if len(sys.argv) == 1:
+        # Display script description and options if incorrectly called
+        clean_ferment_parser.print_help()
     else:
+        clean_ferment_args = clean_ferment_parser.parse_args()
+
         # Extract file name and working directory from the provided raw data filepath
-        ferment_inpath = sys.argv[1]
+        ferment_inpath = clean_ferment_args.ferment_inpath
         workdir, ferment_infile = os.path.split(ferment_inpath)
-        os.chdir(workdir)
+        if workdir:
+            os.chdir(workdir)
 
         # Read in raw data from Excel file
         ferment_data, ferment_times, ferment_cultures = read_ferment_data(ferment_infile)
 
-        # Read GC output files and record data
-        with os.scandir("gc_output") as gc_scan:
-            for entry1 in gc_scan:
-                if entry1.is_dir():
-                    with os.scandir(entry1) as gc_sub_scan:
-                        for entry2 in gc_sub_scan:
-                            if entry2.is_file and entry2.name.endswith(".txt"):
-                                compound_list = read_gc_result(ferment_data, entry2)
-                elif entry1.is_file and entry1.name.endswith(".txt"):
-                    compound_list = read_gc_result(ferment_data, entry1)
-
-        # Save cleaned and filled dateframes to files
         outdir = "cleaned_data"
         try:
             os.mkdir(outdir)
         except:
             FileExistsError
-        
+
         ferment_outfile = ferment_infile.replace("raw.xlsx", "")
 
-        ferment_data.to_csv(os.path.join(outdir, ferment_outfile + "cleaned.csv"))
-        ferment_data.to_excel(os.path.join(outdir, ferment_outfile + "cleaned.xlsx"))
+        # List GC output files, including those in one level of subfolders
+        gc_filepaths = scan_gc_output("gc_output")
+
+        # Read GC output files (only new or changed ones are parsed) and record data
+        gc_reports = parse_gc_reports(
+            gc_filepaths,
+            jobs=clean_ferment_args.jobs,
+            cache_file=os.path.join(outdir, ferment_outfile + "gc_cache.sqlite"),
+            rebuild_cache=clean_ferment_args.rebuild_cache,
+        )
+        ferment_data, compound_list = merge_gc_reports(
+            ferment_data, gc_reports, duplicates=clean_ferment_args.duplicates
+        )
+
+        # Save cleaned and filled dateframes to files
+        cleaned_outbase = os.path.join(outdir, ferment_outfile + "cleaned")
+        cleaned_formats = clean_ferment_args.format or DEFAULT_FORMATS
+
+        if clean_ferment_args.watch:
+            # Excel files are only written when watching stops, as they are slow to write
+            watch_formats = [
+                file_format for file_format in cleaned_formats if file_format != "xlsx"
+            ] or ["csv"]
+            write_dataframe(ferment_data, cleaned_outbase, watch_formats, compound_list)
+            print("Watching \"gc_output\" for new GC output files. Press Ctrl+C to stop.")
+            ferment_data, compound_list = watch_gc_output(
+                ferment_data,
+                gc_filepaths,
+                cleaned_outbase,
+                watch_formats,
+                cache_file=os.path.join(outdir, ferment_outfile + "gc_cache.sqlite"),
+                interval=clean_ferment_args.interval,
+                gc_reports=gc_reports,
+                compounds=compound_list,
+                duplicates=clean_ferment_args.duplicates,
+            )
+
+        write_dataframe(ferment_data, cleaned_outbase, cleaned_formats, compound_list)
         compound_list.to_series().to_csv(
             os.path.join(outdir, ferment_outfile + "compound_list.csv"),
             index=False,
@@ -1,13 +1,127 @@
 import os
-import sys
-import subprocess
-
-os.chdir("genomes")
-genome_list = []
-with open("genomes_refseq.txt") as refseqs:
-    for line in refseqs:
-        genome_list.append(line.strip().split(","))
-
-for organism, genome_adr in genome_list[1:]:
-    print(">>> Downloading {} genome \n    from {}".format(repr(organism), repr(genome_adr)))
-    subprocess.run(["python3", "../utility_scripts/download_genome.py", "-n", organism, "-f", genome_adr, "-o", organism])
\ No newline at end of file
+import time
+import argparse
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from download_genome import download_genome
+from genome_store import GenomeStore
+
+
+script_descr = """
+Download and format all genomes listed in a genome list file (default: genomes/genomes_refseq.txt).
+
+The genome list is a comma-separated file with a header line, and one "organism,ftp_address" line per genome.
+Several genomes are downloaded concurrently, with a limit on the number of files downloaded at once from each host.
+Genomes already complete in the genome store (see genome_store.py) are skipped without going online.
+"""
+
+
+def read_genome_list(genome_file):
+    """Read (organism, ftp_address) pairs from a genome list file, skipping its header line."""
+    genome_list = []
+    with open(genome_file) as refseqs:
+        for line in refseqs:
+            if line.strip():
+                genome_list.append(line.strip().split(","))
+    return genome_list[1:]
+
+
+def download_all_genomes(genome_list, genomes_dir, jobs=4, per_host=2, force=False):
+    """Download the genomes in genome_list into genomes_dir/<organism>, with up to jobs genomes at a time.
+
+    At most per_host files are downloaded from the same host at once, shared by all genomes from that host;
+    decompression and BLAST database building are not limited by host. Genomes recorded as complete and unchanged in the genome store of genomes_dir
+    are skipped, unless force = True, and downloaded genomes are recorded in it.
+    Prints a progress line as each genome finishes and a summary at the end.
+    Returns a dict of {organism: (status, seconds)}.
+    """
+    store = GenomeStore(genomes_dir)
+    host_locks = {}
+    for organism, genome_adr in genome_list:
+        host = urlparse(genome_adr).netloc
+        host_locks.setdefault(host, threading.BoundedSemaphore(per_host))
+
+    def download_one(organism, genome_adr):
+        start = time.perf_counter()
+        if not force and store.is_complete(organism, genome_adr):
+            return "skipped", time.perf_counter() - start
+        download_genome(
+            genome_adr,
+            store.organism_dir(organism),
+            organism,
+            host_lock=host_locks[urlparse(genome_adr).netloc],
+            quiet=True,
+        )
+        store.record(organism, genome_adr)
+        return "done", time.perf_counter() - start
+
+    results = {}
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(download_one, organism, genome_adr): organism
+            for organism, genome_adr in genome_list
+        }
+        for number, future in enumerate(as_completed(futures), start=1):
+            organism = futures[future]
+            try:
+                results[organism] = future.result()
+            except Exception as error:
+                results[organism] = ("failed: {}".format(error), float("nan"))
+            print(">>> [{}/{}] {} {}".format(number, len(futures), organism, results[organism][0]))
+
+    print("\n{:<45}{:>10}  {}".format("Organism", "Time (s)", "Status"))
+    for organism, genome_adr in genome_list:
+        status, seconds = results[organism]
+        print("{:<45}{:>10.1f}  {}".format(organism, seconds, status))
+    print("Total wall time: {:.1f} s".format(time.perf_counter() - batch_start))
+    return results
+
+
+dlall_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+)
+dlall_parser.add_argument(
+    "-l", "--genome-list",
+    help="Genome list file (default: genomes/genomes_refseq.txt).",
+    default=os.path.join("genomes", "genomes_refseq.txt"),
+    metavar="<file>",
+)
+dlall_parser.add_argument(
+    "-o", "--outdir",
+    help="Folder where each genome will be placed in a subfolder named after the organism (default: the folder of the genome list).",
+    metavar="<path>",
+)
+dlall_parser.add_argument(
+    "-j", "--jobs",
+    help="Number of genomes downloaded and formatted at the same time (default: 4).",
+    type=int,
+    default=4,
+    metavar="<jobs>",
+)
+dlall_parser.add_argument(
+    "--per-host",
+    help="Maximum number of files downloaded at the same time from the same host, across all genomes (default: 2).",
+    type=int,
+    default=2,
+    metavar="<number>",
+)
+dlall_parser.add_argument(
+    "-f", "--force",
+    help="Download all genomes again, even those already complete in the genome store.",
+    action="store_true",
+)
+
+if __name__ == "__main__":
+    dlall_args = dlall_parser.parse_args()
+    genome_list = read_genome_list(dlall_args.genome_list)
+    download_all_genomes(
+        genome_list,
+        dlall_args.outdir or os.path.dirname(dlall_args.genome_list),
+        jobs=dlall_args.jobs,
+        per_host=dlall_args.per_host,
+        force=dlall_args.force,
+    )
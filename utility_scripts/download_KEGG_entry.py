@@ -5,8 +5,12 @@ import sys
 import subprocess
 import glob
 import gzip
-import urllib
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 
 
 # %%
@@ -14,25 +18,166 @@ script_descr = """
 Download entries from KEGG, such as gene or protein sequences in fasta format.
 
 If multiple accession numbers are provided, they will be combined into one output fasta file. The output file will be *.fna for genes and *.faa for proteins.
+Entries are downloaded in batches of 10 within KEGG's rate limit, and cached locally so they are only downloaded once.
 
 """
 
 
 # %%
-def download_KEGG_gene(accessions, seqtypes, outfile):
-    """Download gene or protein sequence(s) in fasta format using KEGG ID numbers."""
-    datatypes = {"nucl": ["ntseq", ".fna"], "prot": ["aaseq", ".faa"]}
-    
-    for seqtype in seqtypes:
-        kegg_link = "http://rest.kegg.jp/get/{}/{}".format(
-            "+".join(accessions), datatypes[seqtype][0]
-        )
-        kegg_page = urllib.request.urlopen(kegg_link)
-        kegg_lines = kegg_page.readlines()
-
-        with open(outfile+datatypes[seqtype][1], "wb") as fasta_file:
-            for kegg_line in kegg_lines:
-                fasta_file.write(kegg_line)
+KEGG_URL = "https://rest.kegg.jp"
+# KEGG's /get endpoint returns at most 10 entries per request, and asks for no more than 3 requests per second
+KEGG_BATCH = 10
+KEGG_RATE = 3
+# Failed requests are sent again (after 1, 2, 4... seconds), each time within the rate limit
+KEGG_RETRIES = 3
+RETRY_STATUS = (403, 429, 500, 502, 503, 504)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".kegg_cache")
+
+DATATYPES = {"nucl": ["ntseq", ".fna"], "prot": ["aaseq", ".faa"]}
+
+
+class RateLimiter:
+    """Spaces out calls to wait() from any number of threads to at most rate per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class KEGGClient:
+    """Downloads KEGG entries in batches of up to 10, concurrently within KEGG's rate limit, with a local per-entry cache.
+
+    Entries are cached in cache_dir/<datatype>/ as one file each, so repeat downloads of the same entries
+    do not go online. Batches are sent over a pooled session with up to connections requests at the same time.
+    Failed requests are retried up to retries times, waiting backoff, 2 * backoff... seconds and the rate limiter.
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_CACHE_DIR,
+        connections=3,
+        rate=KEGG_RATE,
+        base_url=KEGG_URL,
+        retries=KEGG_RETRIES,
+        backoff=1,
+    ):
+        self.cache_dir = cache_dir
+        self.connections = connections
+        self.base_url = base_url.rstrip("/")
+        self.rate_limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def cache_path(self, accession, datatype):
+        return os.path.join(self.cache_dir, datatype, accession.lower().replace(":", "_") + ".fasta")
+
+    def _fetch_batch(self, batch, datatype):
+        """Download one batch of entries, retrying failed requests (error status or lost connection)."""
+        url = "{}/get/{}/{}".format(self.base_url, "+".join(batch), datatype)
+        os.makedirs(os.path.join(self.cache_dir, datatype), exist_ok=True)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.rate_limiter.wait()
+            try:
+                with self.session.get(url, stream=True, timeout=60) as response:
+                    if response.status_code == 404:
+                        # None of the entries were found
+                        return
+                    if response.status_code in RETRY_STATUS and attempt < self.retries:
+                        continue
+                    response.raise_for_status()
+                    self._write_entries(response, datatype)
+                    return
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.retries:
+                    raise
+
+    def _write_entries(self, response, datatype):
+        """Stream each entry of a response into its cache file, written as .tmp and renamed once complete.
+
+        An entry is complete when the next one starts or the response ends; the entry being written when the
+        response fails is removed, so no partial entry is ever cached.
+        """
+        entry_file = None
+        try:
+            for line in response.iter_lines():
+                if line.startswith(b">"):
+                    if entry_file is not None:
+                        entry_file.close()
+                        os.replace(entry_file.name, entry_file.name[: -len(".tmp")])
+                        entry_file = None
+                    accession = line[1:].split()[0].decode()
+                    entry_file = open(self.cache_path(accession, datatype) + ".tmp", "wb")
+                if entry_file is not None:
+                    entry_file.write(line + b"\n")
+        except BaseException:
+            if entry_file is not None:
+                entry_file.close()
+                os.remove(entry_file.name)
+            raise
+        if entry_file is not None:
+            entry_file.close()
+            os.replace(entry_file.name, entry_file.name[: -len(".tmp")])
+
+    def get(self, accessions, datatype, fasta_file):
+        """Write the entries of accessions (e.g., "eco:b0001") to the open binary fasta_file, in the order given.
+
+        datatype is the KEGG option of the /get endpoint (e.g., "ntseq" or "aaseq"). Entries that are not cached yet
+        are downloaded first. Returns the list of accessions that KEGG did not return.
+        """
+        missing = [
+            accession
+            for accession in dict.fromkeys(accessions)
+            if not os.path.exists(self.cache_path(accession, datatype))
+        ]
+        batches = [missing[number : number + KEGG_BATCH] for number in range(0, len(missing), KEGG_BATCH)]
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            for future in [executor.submit(self._fetch_batch, batch, datatype) for batch in batches]:
+                future.result()
+
+        not_found = []
+        for accession in accessions:
+            try:
+                with open(self.cache_path(accession, datatype), "rb") as entry_file:
+                    shutil.copyfileobj(entry_file, fasta_file)
+            except FileNotFoundError:
+                not_found.append(accession)
+        return not_found
+
+    def close(self):
+        self.session.close()
+
+
+def download_KEGG_gene(accessions, seqtypes, outfile, cache_dir=DEFAULT_CACHE_DIR, connections=3, client=None):
+    """Download gene or protein sequence(s) in fasta format using KEGG ID numbers.
+
+    Any number of accessions can be given: they are downloaded in batches of 10 (KEGG's limit per request),
+    up to connections at a time, and cached in cache_dir so they are only downloaded once.
+    """
+    kegg_client = client or KEGGClient(cache_dir, connections)
+    try:
+        for seqtype in seqtypes:
+            with open(outfile + DATATYPES[seqtype][1], "wb") as fasta_file:
+                not_found = kegg_client.get(accessions, DATATYPES[seqtype][0], fasta_file)
+            if not_found:
+                print("No {} entry found in KEGG for: {}".format(seqtype, ", ".join(not_found)))
+    finally:
+        if client is None:
+            kegg_client.close()
 
 
 # %%
@@ -61,10 +206,29 @@ if __name__ == "__main__":
         metavar="<path/basename>",
         required=True,
     )
+    dlkegg_group1.add_argument(
+        "-c", "--cache-dir",
+        help="(Optional) Folder where downloaded entries are cached. The default is .kegg_cache in the home folder.",
+        metavar="<path>",
+        default=DEFAULT_CACHE_DIR,
+    )
+    dlkegg_group1.add_argument(
+        "-j", "--connections",
+        help="(Optional) Number of requests sent to KEGG at the same time. The default value is 3.",
+        type=int,
+        default=3,
+        metavar="<number>",
+    )
     if len(sys.argv) == 1:
         dlkegg_parser.print_help()
     else:
         dlkegg_args = dlkegg_parser.parse_args()
         accessions = dlkegg_args.accession.split(",")
         seqtypes = dlkegg_args.seq_type.split(",")
-        download_KEGG_gene(accessions, seqtypes, dlkegg_args.outfile)
\ No newline at end of file
+        download_KEGG_gene(
+            accessions,
+            seqtypes,
+            dlkegg_args.outfile,
+            cache_dir=dlkegg_args.cache_dir,
+            connections=dlkegg_args.connections,
+        )
\ No newline at end of file
@@ -3,9 +3,13 @@
 import os
 import sys
 import subprocess
-import glob
 import gzip
+import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from genome_fetch import fetch_assembly
+from bgzf_io import recompress_bgzf, is_bgzf
 
 
 # %%
@@ -19,59 +23,179 @@ These files will also be formatted into BLAST-able databases.
 
 
 # %%
-def download_genome(ftp_address, outdir, organism=None):
+CHUNK_SIZE = 1 << 20
+
+# BLAST database type of each sequence file extension
+BLASTDB_TYPES = {
+    ".fna": "nucl",
+    ".faa": "prot",
+}
+
+# Files of a BLAST database (v4 and v5) have these extensions after the sequence file name
+BLASTDB_INDEX = {
+    "nucl": (".nin", ".nal"),
+    "prot": (".pin", ".pal"),
+}
+
+
+def blastdb_type(filepath):
+    """Return the BLAST database type ("nucl" or "prot") of a sequence file, or None. A ".gz" suffix is ignored."""
+    name = filepath[:-3] if filepath.endswith(".gz") else filepath
+    return BLASTDB_TYPES.get(os.path.splitext(name)[1])
+
+
+def blastdb_current(seqpath, dbtype):
+    """Check whether the BLAST database of a sequence file (named after it, without ".gz") is newer than the file."""
+    dbpath = seqpath[:-3] if seqpath.endswith(".gz") else seqpath
+    seq_mtime = os.path.getmtime(seqpath)
+    return any(
+        os.path.exists(dbpath + extension) and os.path.getmtime(dbpath + extension) >= seq_mtime
+        for extension in BLASTDB_INDEX[dbtype]
+    )
+
+
+def decompress_file(gzpath):
+    """Decompress a .gz file next to it in streaming chunks, then remove the .gz file. Returns the new path."""
+    outpath = gzpath[:-3]
+    with gzip.open(gzpath, "rb") as compressed, open(outpath + ".tmp", "wb") as uncompressed:
+        shutil.copyfileobj(compressed, uncompressed, CHUNK_SIZE)
+    os.replace(outpath + ".tmp", outpath)
+    os.remove(gzpath)
+    return outpath
+
+
+def make_blastdb(seqpath, dbtype, output=None):
+    """Build a BLAST database from a sequence file, named after the file (without ".gz").
+
+    A gzipped sequence file is decompressed in streaming chunks into makeblastdb's standard input,
+    so no uncompressed copy is written. Raises a subprocess.CalledProcessError if makeblastdb fails.
+    """
+    seqdir, seqname = os.path.split(seqpath)
+    if not seqpath.endswith(".gz"):
+        makeblastdb_cmd = ["makeblastdb", "-dbtype", dbtype, "-in", seqname]
+        subprocess.run(makeblastdb_cmd, cwd=seqdir or None, stdout=output, stderr=output, check=True)
+        return
+    dbname = seqname[:-3]
+    makeblastdb_cmd = ["makeblastdb", "-dbtype", dbtype, "-in", "-", "-out", dbname, "-title", dbname]
+    with subprocess.Popen(
+        makeblastdb_cmd, cwd=seqdir or None, stdin=subprocess.PIPE, stdout=output, stderr=output
+    ) as makeblastdb, gzip.open(seqpath, "rb") as compressed:
+        try:
+            shutil.copyfileobj(compressed, makeblastdb.stdin, CHUNK_SIZE)
+            makeblastdb.stdin.close()
+        except BrokenPipeError:
+            # makeblastdb stopped early, its error message is in its output
+            pass
+    if makeblastdb.returncode != 0:
+        raise subprocess.CalledProcessError(makeblastdb.returncode, makeblastdb_cmd)
+
+
+def download_genome(
+    ftp_address,
+    outdir,
+    organism=None,
+    host_lock=None,
+    quiet=False,
+    connections=4,
+    blastdb_jobs=2,
+    keep_compressed=False,
+    bgzf=False,
+):
+    """Download all files of a genome assembly from the NCBI's ftp site into outdir, then decompress them and build BLAST databases.
+
+    The files are fetched with genome_fetch.fetch_assembly over up to connections reused connections,
+    resuming partial downloads and checking them against the assembly's "md5checksums.txt".
+    Each file is decompressed as soon as it is downloaded, and its BLAST database (.fna and .faa files) is built
+    right after, with up to blastdb_jobs makeblastdb jobs at the same time.
+    keep_compressed = True keeps the downloaded .gz files as they are, and BLAST databases are built by streaming
+    the compressed sequence files into makeblastdb, so no uncompressed copies are written.
+    bgzf = True recompresses the downloaded .gz files as BGZF (block-gzip, see bgzf_io) with a block index instead,
+    so sequences and feature tables can still be read at random positions (see seq_index) without decompressing them.
+    When run again, files already decompressed or recompressed are not downloaded again, and BLAST databases newer
+    than their sequence file are not rebuilt.
+
+    host_lock (optional) is held while downloading each file, e.g., a semaphore shared by the downloads from the
+    same host to limit the number of files downloaded from it at once.
+    quiet = True hides the output of the external programs.
+    The working directory is not changed, so several genomes can be downloaded concurrently from threads.
+    """
     if organism == None:
-        organism = os.path.split(outdir)[1]
+        organism = os.path.split(os.path.normpath(outdir))[1]
     message = "\nStarting genome download for {}\nfrom {}\ninto {}\n".format(
         organism, ftp_address, outdir
     )
     print(message)
 
-    start_dir = os.getcwd()
     try:
         os.mkdir(outdir)
     except:
         FileExistsError
-    os.chdir(outdir)
-
-    wget_cmd = [
-        "wget",
-        ftp_address,
-        "--recursive",
-        "--no-parent",
-        "--no-directories",
-        "--continue",
-    ]
-    subprocess.run(wget_cmd)
-
-    split_ftp = ftp_address.split("/")
-    old_name = split_ftp[-1]
-    mmv_cmd = ["mmv", f"{old_name}*", f"{organism}#1"]
-    subprocess.run(mmv_cmd)
-
-    for gzfile in glob.glob("*.gz"):
-        gzip_cmd = ["gzip", "-drv", gzfile]
-        subprocess.run(gzip_cmd)
-
-    blastdb = {
-        "nucl": glob.glob(f"{organism}*.fna"),
-        "prot": glob.glob(f"{organism}*.faa"),
-    }
-    for dbtype, dbfiles in blastdb.items():
-        for dbfile in dbfiles:
-            makeblastdb_cmd = ["makeblastdb", "-dbtype", dbtype, "-in", dbfile]
-            subprocess.run(makeblastdb_cmd)
+    output = subprocess.DEVNULL if quiet else None
+
+    with ThreadPoolExecutor(max_workers=connections) as decompressor, ThreadPoolExecutor(
+        max_workers=blastdb_jobs
+    ) as blastdb_builder:
+
+        def format_file(filepath):
+            if filepath.endswith(".gz") and bgzf:
+                recompress_bgzf(filepath)
+                if not quiet:
+                    print("Recompressed {} as BGZF".format(filepath))
+            elif filepath.endswith(".gz") and not keep_compressed:
+                filepath = decompress_file(filepath)
+                if not quiet:
+                    print("Decompressed {}".format(filepath))
+            dbtype = blastdb_type(filepath)
+            if (
+                dbtype is not None
+                and os.path.basename(filepath).startswith(organism)
+                and not blastdb_current(filepath, dbtype)
+            ):
+                return blastdb_builder.submit(make_blastdb, filepath, dbtype, output)
+
+        def is_formatted(filepath):
+            # Decompressed or recompressed files no longer match the checksum of the downloaded .gz file
+            if not filepath.endswith(".gz") or keep_compressed:
+                return False
+            if bgzf:
+                if not (os.path.exists(filepath + ".gzi") and is_bgzf(filepath)):
+                    return False
+            elif os.path.exists(filepath) or not os.path.exists(filepath[:-3]):
+                return False
+            else:
+                filepath = filepath[:-3]
+            dbtype = blastdb_type(filepath)
+            return (
+                dbtype is None
+                or not os.path.basename(filepath).startswith(organism)
+                or blastdb_current(filepath, dbtype)
+            )
+
+        format_futures = []
+        fetch_assembly(
+            ftp_address,
+            outdir,
+            organism,
+            connections=connections,
+            on_file=lambda filepath: format_futures.append(decompressor.submit(format_file, filepath)),
+            done=is_formatted,
+            host_lock=host_lock,
+        )
+        for format_future in format_futures:
+            blastdb_future = format_future.result()
+            if blastdb_future is not None:
+                blastdb_future.result()
 
     print(
         "\n{} genome downloaded and formatted successfully.\nThe associated files are available in genomes/{}\n".format(
             organism, outdir
         )
     )
-    with os.scandir() as filelisting:
-        for entry in filelisting:
-            print(entry.name)
-    print()
-    os.chdir(start_dir)
+    if not quiet:
+        with os.scandir(outdir) as filelisting:
+            for entry in filelisting:
+                print(entry.name)
+        print()
     return outdir
 
 
@@ -89,10 +213,34 @@ dlgenome_group1.add_argument(
 )
 dlgenome_group1.add_argument(
     "-f", "--ftp",
-    help="(Required) Ftp address of the folder containing this genome on the NCBI's server",
+    help="(Required) Ftp (or http/https) address of the folder containing this genome on the NCBI's server",
     metavar="<link>",
     required=True,
 )
+dlgenome_group1.add_argument(
+    "-j", "--connections",
+    help="(Optional) Number of files downloaded at the same time, each over its own reused connection. The default value is 4.",
+    type=int,
+    default=4,
+    metavar="<number>",
+)
+dlgenome_group1.add_argument(
+    "-b", "--blastdb-jobs",
+    help="(Optional) Maximum number of BLAST databases built at the same time. The default value is 2.",
+    type=int,
+    default=2,
+    metavar="<number>",
+)
+dlgenome_group1.add_argument(
+    "-k", "--keep-compressed",
+    help="(Optional) Keep the downloaded files compressed, and build the BLAST databases directly from the compressed sequence files.",
+    action="store_true",
+)
+dlgenome_group1.add_argument(
+    "-z", "--bgzf",
+    help="(Optional) Recompress the downloaded files as BGZF (block-gzip) with a block index instead of decompressing them, so sequences can be read at random positions without decompressing the files.",
+    action="store_true",
+)
 dlgenome_group1.add_argument(
     "-o", "--outdir",
     help="(Required) Path to the output folder (which will be created if not present). If organism name is not provided, the end folder in the directory will be used as the organism name.",
@@ -101,9 +249,17 @@ dlgenome_group1.add_argument(
 )
 
 # Perform genome download if this script is called as the main script from the terminal
-# if __name__ == "__main__":
-if len(sys.argv) == 1:
-    dlgenome_parser.print_help()
-else:
-    dlgenome_args = dlgenome_parser.parse_args()
-    download_genome(dlgenome_args.ftp, dlgenome_args.outdir, dlgenome_args.organism_name)
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        dlgenome_parser.print_help()
+    else:
+        dlgenome_args = dlgenome_parser.parse_args()
+        download_genome(
+            dlgenome_args.ftp,
+            dlgenome_args.outdir,
+            dlgenome_args.organism_name,
+            connections=dlgenome_args.connections,
+            blastdb_jobs=dlgenome_args.blastdb_jobs,
+            keep_compressed=dlgenome_args.keep_compressed,
+            bgzf=dlgenome_args.bgzf,
+        )
\ No newline at end of file
@@ -0,0 +1,110 @@
+# %%
+# Import necessary libraries
+import numpy as np
+import pandas as pd
+
+
+# %%
+# Description of the feature index
+script_descr = """
+Interval index over a genome feature table, for looking up the features at base positions or overlapping base ranges.
+
+Features are sorted by start position, with the running maximum of their end positions, so that the features that
+can contain a position are found with two binary searches (numpy.searchsorted) instead of a scan of the whole table.
+Positions are 1-based and inclusive, as in NCBI feature tables: a feature from start to end contains both bases.
+"""
+
+
+# %%
+class FeatureIndex:
+    """Sorted-interval index of a feature table's "start" and "end" columns, built once and queried many times.
+
+    If the table has a seq_col column (e.g., "genomic_accession" for genomes with several chromosomes or plasmids),
+    each sequence is indexed separately and queries can be restricted to one sequence.
+    """
+
+    def __init__(self, feature_table, seq_col="genomic_accession", start_col="start", end_col="end"):
+        self.feature_table = feature_table
+        self.start_col = start_col
+        self.end_col = end_col
+        if seq_col in feature_table.columns:
+            seq_ids = feature_table[seq_col].to_numpy()
+        else:
+            seq_ids = np.zeros(len(feature_table), dtype=int)
+        self.seq_col = seq_col if seq_col in feature_table.columns else None
+
+        starts = feature_table[start_col].to_numpy(dtype=np.int64)
+        ends = feature_table[end_col].to_numpy(dtype=np.int64)
+        self._intervals = {}
+        for seq_id in pd.unique(seq_ids):
+            rows = np.flatnonzero(seq_ids == seq_id)
+            rows = rows[np.argsort(starts[rows], kind="stable")]
+            self._intervals[seq_id] = (
+                rows,
+                starts[rows],
+                ends[rows],
+                # Running maximum of the ends: the features before the first index where it reaches a position
+                # all end before that position
+                np.maximum.accumulate(ends[rows]),
+            )
+
+    def _overlaps(self, query_starts, query_ends, seq_id):
+        """Return (query number, feature table row) arrays of the features overlapping each query range of one sequence."""
+        rows, starts, ends, max_ends = self._intervals[seq_id]
+        first = np.searchsorted(max_ends, query_starts, side="left")
+        last = np.searchsorted(starts, query_ends, side="right")
+        counts = np.maximum(last - first, 0)
+        query_numbers = np.repeat(np.arange(len(query_starts)), counts)
+        # Candidate positions in the sorted arrays: first[query] + 0, 1, ..., counts[query] - 1 for each query
+        candidates = (
+            np.arange(counts.sum())
+            - np.repeat(np.cumsum(counts) - counts, counts)
+            + np.repeat(first, counts)
+        )
+        overlapping = ends[candidates] >= query_starts[query_numbers]
+        return query_numbers[overlapping], rows[candidates[overlapping]]
+
+    def _query(self, query_starts, query_ends, seq_ids):
+        query_starts = np.atleast_1d(np.asarray(query_starts, dtype=np.int64))
+        query_ends = np.atleast_1d(np.asarray(query_ends, dtype=np.int64))
+        if seq_ids is None:
+            query_seqs = {seq_id: np.arange(len(query_starts)) for seq_id in self._intervals}
+        else:
+            seq_ids = np.broadcast_to(np.asarray(seq_ids, dtype=object), query_starts.shape)
+            query_seqs = {
+                seq_id: np.flatnonzero(seq_ids == seq_id) for seq_id in pd.unique(seq_ids) if seq_id in self._intervals
+            }
+        query_numbers = [np.empty(0, dtype=np.int64)]
+        rows = [np.empty(0, dtype=np.int64)]
+        for seq_id, numbers in query_seqs.items():
+            seq_query_numbers, seq_rows = self._overlaps(query_starts[numbers], query_ends[numbers], seq_id)
+            query_numbers.append(numbers[seq_query_numbers])
+            rows.append(seq_rows)
+        query_numbers = np.concatenate(query_numbers)
+        rows = np.concatenate(rows)
+        order = np.lexsort((rows, query_numbers))
+        return query_numbers[order], rows[order]
+
+    def positions(self, bases, seq_ids=None):
+        """Return the features containing each base position, as one DataFrame for the whole batch.
+
+        bases is a position or a list/array of positions, and seq_ids (optional) the sequence of each position
+        (or one sequence for all). The result has a "position" column followed by the feature table's columns,
+        with one row per (position, feature) match, in the order of the positions.
+        """
+        query_numbers, rows = self._query(bases, bases, seq_ids)
+        located_loci = self.feature_table.iloc[rows].reset_index(drop=True)
+        located_loci.insert(0, "position", np.atleast_1d(np.asarray(bases))[query_numbers])
+        return located_loci
+
+    def ranges(self, range_starts, range_ends, seq_ids=None):
+        """Return the features overlapping each base range [range_start, range_end], as one DataFrame for the whole batch.
+
+        The result has "range_start" and "range_end" columns followed by the feature table's columns,
+        with one row per (range, feature) match, in the order of the ranges.
+        """
+        query_numbers, rows = self._query(range_starts, range_ends, seq_ids)
+        located_loci = self.feature_table.iloc[rows].reset_index(drop=True)
+        located_loci.insert(0, "range_start", np.atleast_1d(np.asarray(range_starts))[query_numbers])
+        located_loci.insert(1, "range_end", np.atleast_1d(np.asarray(range_ends))[query_numbers])
+        return located_loci
@@ -0,0 +1,102 @@
+# %%
+# Import necessary libraries
+import os
+import pandas as pd
+
+from genome_fetch import md5sum
+
+
+# %%
+# Description of the feature table loader
+script_descr = """
+Read NCBI genome feature tables ("*_feature_table.txt", optionally gzipped) into compact, typed DataFrames.
+
+Coordinates are read as int32, and repetitive text columns (feature, class, assembly, strand, chromosome...) as
+categoricals. The parsed table is cached next to the source file ("*.feather" or "*.parquet"), keyed by the source's
+content hash, so later sessions memory-map the cache instead of parsing the text file again.
+The ":start:end" column used for Benchling is not stored: start_end builds it for the rows that are displayed.
+"""
+
+CACHE_FORMATS = ["feather", "parquet"]
+
+FEATURE_TABLE_DTYPES = {
+    "# feature": "category",
+    "class": "category",
+    "assembly": "category",
+    "assembly_unit": "category",
+    "seq_type": "category",
+    "chromosome": "category",
+    "genomic_accession": "category",
+    "start": "int32",
+    "end": "int32",
+    "strand": "category",
+    "product_accession": "object",
+    "non-redundant_refseq": "object",
+    "related_accession": "object",
+    "name": "object",
+    "symbol": "object",
+    "GeneID": "object",
+    "locus_tag": "object",
+    "feature_interval_length": "int32",
+    "product_length": "Int32",
+    "attributes": "object",
+}
+
+
+# %%
+def start_end(feature_table):
+    """Return the ":start:end" strings (e.g., ":1201:2304") of a feature table's rows, for Benchling."""
+    return ":" + feature_table["start"].astype(str) + ":" + feature_table["end"].astype(str)
+
+
+def load_feature_table(filepath, cache=True, cache_format="feather"):
+    """Read an NCBI feature table with explicit dtypes (see FEATURE_TABLE_DTYPES).
+
+    With cache = True, the parsed table is saved to filepath + ".feather" (or ".parquet", see cache_format) with the
+    source's content hash, and is memory-mapped from there as long as the source has not changed.
+    The cache needs pyarrow: without it, the table is parsed from the text file every time.
+    """
+    if cache_format not in CACHE_FORMATS:
+        raise ValueError(f"Unknown cache format: {cache_format!r}, choose from {CACHE_FORMATS}")
+    cache_file = filepath + "." + cache_format
+    if cache:
+        try:
+            from pyarrow import Table, feather, parquet
+        except ImportError:
+            cache = False
+    if cache:
+        digest = md5sum(filepath)
+        try:
+            if cache_format == "feather":
+                cached = feather.read_table(cache_file, memory_map=True)
+            else:
+                cached = parquet.read_table(cache_file, memory_map=True)
+            if (cached.schema.metadata or {}).get(b"source_md5") == digest.encode():
+                feature_table = cached.to_pandas()
+                # Empty categorical columns (e.g., chromosome) are stored without their type
+                return feature_table.astype(
+                    {
+                        col: dtype
+                        for col, dtype in FEATURE_TABLE_DTYPES.items()
+                        if col in feature_table.columns and feature_table[col].dtype != dtype
+                    }
+                )
+        except (OSError, ValueError):
+            pass
+
+    header = pd.read_table(filepath, nrows=0).columns
+    feature_table = pd.read_table(
+        filepath,
+        dtype={col: dtype for col, dtype in FEATURE_TABLE_DTYPES.items() if col in header},
+    )
+
+    if cache:
+        table = Table.from_pandas(feature_table, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b"source_md5": digest.encode()})
+        tmp_cache_file = cache_file + ".tmp"
+        if cache_format == "feather":
+            feather.write_feather(table, tmp_cache_file, compression="uncompressed")
+        else:
+            parquet.write_table(table, tmp_cache_file)
+        os.replace(tmp_cache_file, cache_file)
+    return feature_table
@@ -0,0 +1,158 @@
+# %%
+# Import necessary libraries
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+# %%
+# Description of the shared input/output helpers for fermentation data
+script_descr = """
+Write and read cleaned fermentation and GC data in several file formats.
+
+Supported formats:
+    csv     : plain text, readable anywhere
+    xlsx    : Excel workbook (slowest to write and read)
+    parquet : compressed columnar file, requires pyarrow
+    feather : uncompressed columnar file that can be memory-mapped, requires pyarrow
+
+Sheets read from Excel workbooks are cached next to the workbook ("*.sheets.pkl"), keyed by the workbook's content hash,
+so that repeat analyses only parse the workbook again after it has changed.
+
+Parquet and Feather files keep typed columns: datetime for sampling times, float32 for compound concentrations,
+and categorical for culture types.
+"""
+
+FORMATS = ["csv", "xlsx", "parquet", "feather"]
+DEFAULT_FORMATS = ["csv", "xlsx"]
+
+SAMPLING_TIME_COLUMNS = ["Actual sampling time"]
+CATEGORICAL_COLUMNS = ["Culture type", "1-propanol standard"]
+
+
+# %%
+def type_ferment_columns(dataframe, compounds=()):
+    """Return a copy of the dataframe with compact, typed columns for columnar file formats.
+
+    Sampling times become datetime, compound concentrations become float32, and culture types become categorical.
+    Other text columns become strings, as Excel columns can mix text and numbers (e.g., "n/a" among values),
+    which pyarrow cannot write.
+    """
+    dataframe = dataframe.copy()
+    for col in SAMPLING_TIME_COLUMNS:
+        if col in dataframe.columns:
+            dataframe[col] = pd.to_datetime(dataframe[col])
+    for col in dataframe.columns.intersection(pd.Index(compounds)):
+        dataframe[col] = pd.to_numeric(dataframe[col], errors="coerce").astype(np.float32)
+    for col in CATEGORICAL_COLUMNS:
+        if col in dataframe.columns:
+            dataframe[col] = dataframe[col].astype("category")
+    for col in dataframe.columns[dataframe.dtypes == object]:
+        dataframe[col] = dataframe[col].astype("string")
+    return dataframe
+
+
+def write_dataframe(dataframe, outbase, formats=DEFAULT_FORMATS, compounds=(), index=True):
+    """Write a dataframe to outbase + ".csv", ".xlsx", ".parquet" and/or ".feather", according to formats.
+
+    Each file is written to a temporary file first and then moved into place, so readers never see a partly written file.
+    Returns the list of files written.
+    """
+    outpaths = []
+    typed_dataframe = None
+    for file_format in formats:
+        outpath = outbase + "." + file_format
+        tmp_outpath = outbase + ".tmp." + file_format
+        if file_format == "csv":
+            dataframe.to_csv(tmp_outpath, index=index)
+        elif file_format == "xlsx":
+            dataframe.to_excel(tmp_outpath, index=index)
+        elif file_format in ("parquet", "feather"):
+            from pyarrow import Table, feather, parquet
+
+            if typed_dataframe is None:
+                typed_dataframe = type_ferment_columns(dataframe, compounds)
+            table = Table.from_pandas(typed_dataframe, preserve_index=index)
+            if file_format == "parquet":
+                parquet.write_table(table, tmp_outpath)
+            else:
+                feather.write_feather(table, tmp_outpath, compression="uncompressed")
+        else:
+            raise ValueError(f"Unknown file format: {file_format!r}, choose from {FORMATS}")
+        os.replace(tmp_outpath, outpath)
+        outpaths.append(outpath)
+    return outpaths
+
+
+def load_dataframe(filepath, index_col=None, columns=None, sheet_name=0):
+    """Read a dataframe written by write_dataframe (or any .csv/.xlsx file) based on its file extension.
+
+    Feather and Parquet files are memory-mapped rather than parsed as text, and their column types and index are kept.
+    index_col is only used if that column is not already the index.
+    """
+    file_format = os.path.splitext(filepath)[1].lstrip(".").lower()
+    if file_format == "csv":
+        dataframe = pd.read_csv(filepath, usecols=columns)
+    elif file_format in ("xlsx", "xls"):
+        dataframe = pd.read_excel(filepath, sheet_name=sheet_name, usecols=columns)
+    elif file_format == "parquet":
+        from pyarrow import parquet
+
+        dataframe = parquet.read_table(filepath, columns=columns, memory_map=True).to_pandas()
+    elif file_format == "feather":
+        from pyarrow import feather
+
+        dataframe = feather.read_table(filepath, columns=columns, memory_map=True).to_pandas()
+    else:
+        raise ValueError(f"Unknown file format: {file_format!r}, choose from {FORMATS}")
+    if index_col is not None and index_col in dataframe.columns:
+        dataframe = dataframe.set_index(index_col)
+    return dataframe
+
+
+def _workbook_digest(workbook):
+    """Return the SHA-1 hex digest of a workbook's content."""
+    digest = hashlib.sha1()
+    with open(workbook, "rb") as workbook_content:
+        for block in iter(lambda: workbook_content.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_workbook_sheets(workbook, sheets, cache=True):
+    """Read several sheets of an Excel workbook in one pass and return them as a dict of DataFrames.
+
+    sheets = {sheet name: index column (or None)}
+
+    The workbook is opened once for all sheets. With cache = True, the parsed sheets are also saved to
+    workbook + ".sheets.pkl" together with the workbook's content hash and the index column of each sheet, and are
+    loaded from there (without opening the workbook) as long as the workbook has not changed and each sheet was
+    cached with the same index column.
+    """
+    cache_file = workbook + ".sheets.pkl"
+    if cache:
+        digest = _workbook_digest(workbook)
+        try:
+            with open(cache_file, "rb") as cache_content:
+                cached = pickle.load(cache_content)
+            if cached["digest"] == digest and all(
+                sheet in cached["index_cols"] and cached["index_cols"][sheet] == index_col
+                for sheet, index_col in sheets.items()
+            ):
+                return {sheet: cached["sheets"][sheet].copy() for sheet in sheets}
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            pass
+
+    workbook_sheets = pd.read_excel(workbook, sheet_name=list(sheets))
+    for sheet, index_col in sheets.items():
+        if index_col is not None:
+            workbook_sheets[sheet] = workbook_sheets[sheet].set_index(index_col)
+
+    if cache:
+        tmp_cache_file = cache_file + ".tmp"
+        with open(tmp_cache_file, "wb") as cache_content:
+            pickle.dump({"digest": digest, "index_cols": dict(sheets), "sheets": workbook_sheets}, cache_content)
+        os.replace(tmp_cache_file, cache_file)
+    return workbook_sheets
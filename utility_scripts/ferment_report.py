@@ -0,0 +1,373 @@
+# %%
+# Import necessary libraries
+import os
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+# %%
+# Description of the figure rendering pipeline
+script_descr = """
+Headless rendering of fermentation report figures.
+
+Each figure is described by a figure spec (a dict), built from precomputed summary tables:
+    "name"        : base name of the output files
+    "kind"        : "errorbar" (time courses) or "barh" (grouped horizontal bars)
+    "data"        : tidy DataFrame with one row per plotted point or bar
+    "annotations" : tidy DataFrame of text annotations (e.g., significance), or None
+    "style"       : dict of layout and style options (figure size, titles, markers...)
+
+draw_figure draws a spec on the current matplotlib backend (e.g., in interactive cells), and render_figures draws
+every figure and output format from the same specs in parallel worker processes on the Agg backend.
+A figure is skipped if its data and style have not changed since it was last rendered into the output folder.
+
+Worker processes import the calling script again on platforms that spawn them (Windows, macOS), loading its data and
+drawing its figures once more in every worker. Analysis scripts therefore call render_figures_in_subprocess, which
+saves the specs and renders them from this script in a separate Python process, so the workers only import this module.
+"""
+
+MANIFEST_FILE = "render_manifest.json"
+
+ERROR_FORMAT = {
+    "elinewidth": 0.65,
+    "capsize": 4,
+    "capthick": 0.8,
+}
+
+
+# %%
+# Build figure specs from precomputed data
+def timecourse_figure(name, mean, std, compounds, series, series_styles=None, **style):
+    """Build the spec of a grid of time course plots, one panel per compound and one line per series (e.g., culture).
+
+    mean and std are (series, time) × compound tables, such as those returned by ferment_stats.summary_stat.
+    series_styles is a DataFrame indexed by series with "Marker" and "Fill" columns.
+    """
+    rows = []
+    for compound in compounds:
+        for series_name in series:
+            for time_point, value in mean.loc[series_name, compound].items():
+                rows.append(
+                    (compound, series_name, time_point, value, std.loc[(series_name, time_point), compound])
+                )
+    data = pd.DataFrame(rows, columns=["panel", "series", "x", "y", "yerr"])
+    if series_styles is not None:
+        style.setdefault("markers", series_styles["Marker"].to_dict())
+        style.setdefault("fills", series_styles["Fill"].to_dict())
+    style.setdefault("panels", list(compounds))
+    return {"name": name, "kind": "errorbar", "data": data, "annotations": None, "style": style}
+
+
+def comparison_figure(
+    name, mean, std, p_values, samples, compounds, sources, panel_by="sample", alpha=0.05, **style
+):
+    """Build the spec of a grid of grouped horizontal bar charts comparing sources (e.g., standards) for each sample.
+
+    mean and std are (sample, source) × compound tables, and p_values is a sample × compound table
+    (see ferment_stats.paired_ttests).
+    panel_by = "sample" draws one panel per sample with one bar group per compound,
+    and panel_by = "compound" draws one panel per compound with one bar group per sample.
+    Each bar group is annotated with "*" (p < alpha) or "ns", placed after the bar of the last source.
+    """
+    rows = []
+    annotations = []
+    for sample in samples:
+        for compound in compounds:
+            if panel_by == "sample":
+                panel, category = sample, compound
+            else:
+                panel, category = compound, sample
+            for source in sources:
+                rows.append(
+                    (
+                        panel,
+                        category,
+                        source,
+                        mean.loc[(sample, source), compound],
+                        std.loc[(sample, source), compound],
+                    )
+                )
+            p_value = p_values.loc[sample, compound]
+            if pd.notnull(p_value):
+                annotations.append(
+                    (
+                        panel,
+                        category,
+                        "*" if p_value < alpha else "ns",
+                        mean.loc[(sample, sources[-1]), compound]
+                        + std.loc[(sample, sources[-1]), compound],
+                    )
+                )
+    data = pd.DataFrame(rows, columns=["panel", "category", "series", "value", "error"])
+    annotations = pd.DataFrame(annotations, columns=["panel", "category", "text", "x"])
+    style.setdefault("panels", list(samples) if panel_by == "sample" else list(compounds))
+    style.setdefault("categories", list(compounds) if panel_by == "sample" else list(samples))
+    return {"name": name, "kind": "barh", "data": data, "annotations": annotations, "style": style}
+
+
+# %%
+# Render figures
+def _panel_axes(plt, style):
+    """Create the figure and return it with the list of axes for each panel."""
+    panels = style["panels"]
+    ncols = style.get("ncols", 2)
+    axes_per_panel = style.get("axes_per_panel", 1)
+    nrows = int(np.ceil(len(panels) * axes_per_panel / ncols))
+    fig, axs = plt.subplots(
+        nrows=nrows,
+        ncols=ncols,
+        figsize=style.get("figsize", (12, 12)),
+        facecolor="white",
+        tight_layout=True,
+        squeeze=False,
+    )
+    fig.suptitle(style.get("suptitle", ""))
+    axs = axs.ravel()
+    panel_axes = {
+        panel: axs[number * axes_per_panel : (number + 1) * axes_per_panel]
+        for number, panel in enumerate(panels)
+    }
+    for ax in axs[len(panels) * axes_per_panel :]:
+        ax.set_visible(False)
+    return fig, panel_axes
+
+
+def _draw_errorbar(plt, spec):
+    """Draw a grid of time course plots."""
+    style = spec["style"]
+    fig, panel_axes = _panel_axes(plt, style)
+    markers = style.get("markers", {})
+    fills = style.get("fills", {})
+    for panel, panel_data in spec["data"].groupby("panel", sort=False):
+        for ax in panel_axes[panel]:
+            ax.set_title(panel)
+            ax.set_xlabel(style.get("xlabel", "Time (h)"))
+            if "xticks" in style:
+                ax.xaxis.set_ticks(style["xticks"])
+            ax.set_ylabel(style.get("ylabel", "Concentration (g/L)"))
+            for series_name, series_data in panel_data.groupby("series", sort=False):
+                ax.errorbar(
+                    series_data["x"],
+                    series_data["y"],
+                    label=series_name,
+                    marker=markers.get(series_name, "o"),
+                    fillstyle=fills.get(series_name, "full"),
+                    ms=8,
+                    linestyle="--",
+                    linewidth=1,
+                    yerr=series_data["yerr"],
+                    elinewidth=0.5,
+                    capsize=4,
+                    capthick=0.5,
+                )
+            ax.set_ylim(bottom=0, auto=True)
+            ax.legend()
+    return fig
+
+
+def _draw_barh(plt, spec):
+    """Draw a grid of grouped horizontal bar charts with annotations."""
+    style = spec["style"]
+    fig, panel_axes = _panel_axes(plt, style)
+    categories = pd.Index(style["categories"])
+    ytick_pos = np.arange(len(categories))
+    barwidth = style.get("barwidth", 0.26)
+    annotations = spec["annotations"]
+    for panel, panel_data in spec["data"].groupby("panel", sort=False):
+        series = pd.Index(panel_data["series"].unique())
+        bar_offset = np.linspace(-1.2, 1.2, len(series))
+        for ax in panel_axes[panel]:
+            ax.set_title(style.get("title_format", "{}").format(panel), pad=12)
+            if "xlabel" in style:
+                ax.set_xlabel(style["xlabel"])
+                ax.xaxis.set_label_position("top")
+            ax.xaxis.set_ticks_position("top")
+            ax.tick_params(axis="y", which="major", length=0)
+            ax.spines["left"].set(linewidth=0.001)
+            ax.spines["right"].set(visible=False)
+            ax.spines["bottom"].set(visible=False)
+            ax.set_yticks(ytick_pos, categories)
+            for series_name, series_data in panel_data.groupby("series", sort=False):
+                series_data = series_data.set_index("category").reindex(categories)
+                ax.barh(
+                    ytick_pos + bar_offset[series.get_loc(series_name)] * barwidth / 2,
+                    series_data["value"],
+                    barwidth,
+                    label=series_name,
+                    xerr=series_data["error"],
+                    error_kw=ERROR_FORMAT,
+                )
+            ax.set_xlim(left=0, auto=True)
+            ax.legend(title=style.get("legend_title"))
+            if annotations is not None:
+                for annotation in annotations.loc[annotations["panel"] == panel].itertuples():
+                    ax.annotate(
+                        annotation.text,
+                        (
+                            annotation.x * style.get("annotation_offset", 1.2),
+                            ytick_pos[categories.get_loc(annotation.category)],
+                        ),
+                    )
+    return fig
+
+
+FIGURE_KINDS = {
+    "errorbar": _draw_errorbar,
+    "barh": _draw_barh,
+}
+
+
+def draw_figure(spec, plt=None):
+    """Draw a figure spec with pyplot (default: matplotlib.pyplot on the current backend) and return the figure."""
+    if plt is None:
+        import matplotlib.pyplot as plt
+
+    return FIGURE_KINDS[spec["kind"]](plt, spec)
+
+
+def _render_figure(spec, outpath):
+    """Draw one figure spec and save it to outpath. Runs in a worker process on the Agg backend."""
+    import matplotlib
+
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    fig = draw_figure(spec, plt)
+    fig.savefig(outpath)
+    plt.close(fig)
+    return outpath
+
+
+def figure_hash(spec):
+    """Return a hash of a figure spec's kind, data, annotations and style."""
+    digest = hashlib.sha1(spec["kind"].encode())
+    for table in (spec["data"], spec.get("annotations")):
+        if table is not None:
+            digest.update(json.dumps(list(map(str, table.columns))).encode())
+            digest.update(pd.util.hash_pandas_object(table, index=False).to_numpy().tobytes())
+    digest.update(json.dumps(spec["style"], sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def render_figures(specs, outdir, formats=("pdf", "svg"), jobs=None, force=False):
+    """Render figure specs to outdir/<name>.<format> for every format, in parallel worker processes.
+
+    Figures whose spec hash is unchanged since the last render (recorded in outdir/render_manifest.json)
+    and whose output files all exist are skipped, unless force = True.
+    Returns the list of files rendered.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    manifest_path = os.path.join(outdir, MANIFEST_FILE)
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    tasks = []
+    spec_hashes = {}
+    for spec in specs:
+        spec_hash = figure_hash(spec)
+        outpaths = [os.path.join(outdir, spec["name"] + "." + file_format) for file_format in formats]
+        if (
+            not force
+            and manifest.get(spec["name"]) == spec_hash
+            and all(os.path.exists(outpath) for outpath in outpaths)
+        ):
+            print("Skipping {} (unchanged)".format(spec["name"]))
+            continue
+        spec_hashes[spec["name"]] = spec_hash
+        tasks += [(spec, outpath) for outpath in outpaths]
+
+    rendered = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_render_figure, spec, outpath) for spec, outpath in tasks]
+            for future in futures:
+                rendered.append(future.result())
+                print("Rendered {}".format(rendered[-1]))
+
+    manifest.update(spec_hashes)
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return rendered
+
+
+def render_figures_in_subprocess(specs, outdir, formats=("pdf", "svg"), jobs=None, force=False):
+    """Render figure specs as render_figures does, from this script run in a separate Python process.
+
+    The specs are pickled to a temporary file for the new process, whose worker processes import this module
+    instead of the calling script (see script_descr). Raises a subprocess.CalledProcessError if rendering fails.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        specs_file = os.path.join(tmpdir, "figure_specs.pkl")
+        with open(specs_file, "wb") as spec_content:
+            pickle.dump(list(specs), spec_content)
+        render_cmd = [sys.executable, os.path.abspath(__file__), "-s", specs_file, "-o", outdir, "-f", *formats]
+        if jobs is not None:
+            render_cmd += ["-j", str(jobs)]
+        if force:
+            render_cmd.append("--force")
+        subprocess.run(render_cmd, check=True)
+
+
+# %%
+report_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+    add_help=False,
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+)
+report_group1 = report_parser.add_argument_group("Information to provide")
+report_group1.add_argument(
+    "-s", "--specs",
+    help="(Required) Pickle file of a list of figure specs, as written by render_figures_in_subprocess.",
+    metavar="<file>",
+    required=True,
+)
+report_group1.add_argument(
+    "-o", "--outdir",
+    help="(Required) Folder where the figures are written.",
+    metavar="<path>",
+    required=True,
+)
+report_group1.add_argument(
+    "-f", "--formats",
+    help="(Optional) Output formats of every figure. The default is pdf and svg.",
+    nargs="+",
+    default=["pdf", "svg"],
+    metavar="<format>",
+)
+report_group1.add_argument(
+    "-j", "--jobs",
+    help="(Optional) Number of worker processes. The default is one per CPU.",
+    type=int,
+    metavar="<number>",
+)
+report_group1.add_argument(
+    "--force",
+    help="(Optional) Render all figures, even those unchanged since they were last rendered.",
+    action="store_true",
+)
+report_group2 = report_parser.add_argument_group("Help")
+report_group2.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+if __name__ == "__main__":
+    report_args = report_parser.parse_args()
+    with open(report_args.specs, "rb") as spec_content:
+        figure_specs = pickle.load(spec_content)
+    render_figures(
+        figure_specs,
+        report_args.outdir,
+        formats=report_args.formats,
+        jobs=report_args.jobs,
+        force=report_args.force,
+    )
@@ -0,0 +1,136 @@
+# %%
+# Import necessary libraries
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+# %%
+# Description of the fermentation statistics helpers
+script_descr = """
+Summary statistics for fermentation data, computed once and looked up by the analysis and plotting code.
+
+summarize_groups aggregates the mean, standard deviation, number of replicates (n) and standard error of the mean (sem)
+of every compound for every group (e.g., culture type and time point) into one tidy table.
+summary_stat turns one of these statistics back into a group × compound table for plotting.
+paired_ttests runs the paired t-tests between two conditions (e.g., two standards) for all samples and compounds at once.
+"""
+
+SUMMARY_STATS = ["mean", "std", "n", "sem"]
+
+# Summaries already computed in this session, keyed by the content hash of their input (least recently used first)
+_summary_cache = OrderedDict()
+SUMMARY_CACHE_SIZE = 8
+
+
+# %%
+def summarize_groups(dataframe, group_cols, value_cols):
+    """Compute mean, std, n and sem of every value column for every group in a single aggregation.
+
+    Returns a tidy DataFrame indexed by (*group_cols, "Compound"), with one column per statistic.
+    Groups keep their order of appearance in the dataframe. The last SUMMARY_CACHE_SIZE results are cached for the
+    session, keyed by the hash of the rows in order, so repeat calls with unchanged data return a copy of the same
+    table without aggregating again.
+    """
+    group_cols = list(group_cols)
+    value_cols = list(value_cols)
+    row_hashes = pd.util.hash_pandas_object(dataframe[group_cols + value_cols], index=True).to_numpy()
+    cache_key = (hashlib.sha1(row_hashes.tobytes()).hexdigest(), tuple(group_cols), tuple(value_cols))
+    if cache_key in _summary_cache:
+        _summary_cache.move_to_end(cache_key)
+        return _summary_cache[cache_key].copy()
+
+    summary = (
+        dataframe.groupby(group_cols, sort=False)[value_cols]
+        .agg(["mean", "std", "count"])
+        .rename(columns={"count": "n"}, level=1)
+        .rename_axis(columns=["Compound", None])
+        .stack(level="Compound", dropna=False)
+    )
+    # stack sorts the compounds, put them back in the order of value_cols
+    summary = summary.reindex(value_cols, level="Compound")[["mean", "std", "n"]]
+    summary["sem"] = summary["std"] / np.sqrt(summary["n"])
+
+    _summary_cache[cache_key] = summary
+    if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+        _summary_cache.popitem(last=False)
+    return summary.copy()
+
+
+def summary_stat(summary, stat="mean"):
+    """Return one statistic of a summary table as a group × compound DataFrame.
+
+    stat = "mean", "std", "n", or "sem"
+
+    The table has the same layout as groupby(group_cols).mean() (or .std(), ...), with groups and compounds in the
+    same order as in the summary.
+    """
+    groups = summary.index.droplevel("Compound").unique()
+    compounds = summary.index.get_level_values("Compound").unique()
+    return summary[stat].unstack("Compound").reindex(index=groups, columns=compounds)
+
+
+def paired_ttests(
+    dataframe,
+    sample_col,
+    condition_col,
+    conditions,
+    value_cols,
+    replicate_col="Replicate",
+    correction=None,
+):
+    """Run paired t-tests between two conditions for every sample and compound in one vectorized call.
+
+    Replicates of each sample are paired between conditions[0] and conditions[1] by their replicate_col value,
+    and aligned into sample × compound × replicate arrays that are tested with scipy.stats.ttest_rel along the
+    replicate axis. Missing replicates give a NaN p-value, and a ValueError is raised if a replicate of a sample
+    appears more than once in a condition.
+
+    correction = None, or a method of statsmodels.stats.multitest.multipletests (e.g., "bonferroni", "holm",
+    "fdr_bh") to correct the p-values for multiple testing.
+
+    Returns a sample × compound DataFrame of p-values.
+    """
+    value_cols = list(value_cols)
+    samples = pd.Index(dataframe[sample_col].unique(), name=sample_col)
+    replicates = pd.Index(dataframe[replicate_col].unique(), name=replicate_col)
+    grid = pd.MultiIndex.from_product([samples, replicates])
+
+    replicate_arrays = []
+    for condition in conditions:
+        condition_data = dataframe.loc[dataframe[condition_col] == condition]
+        duplicated = condition_data.duplicated([sample_col, replicate_col], keep=False)
+        if duplicated.any():
+            raise ValueError(
+                "Replicate(s) listed more than once for {} {!r}: {}".format(
+                    condition_col,
+                    condition,
+                    ", ".join(
+                        "{} (replicate {})".format(sample, replicate)
+                        for sample, replicate in condition_data.loc[duplicated, [sample_col, replicate_col]]
+                        .drop_duplicates()
+                        .itertuples(index=False)
+                    ),
+                )
+            )
+        condition_data = condition_data.set_index([sample_col, replicate_col])[value_cols].reindex(grid)
+        # sample × replicate × compound, then sample × compound × replicate
+        replicate_arrays.append(
+            condition_data.to_numpy(dtype=float)
+            .reshape(len(samples), len(replicates), len(value_cols))
+            .transpose(0, 2, 1)
+        )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_values = stats.ttest_rel(*replicate_arrays, axis=-1).pvalue
+
+    if correction is not None:
+        from statsmodels.stats.multitest import multipletests
+
+        tested = ~np.isnan(p_values)
+        if tested.any():
+            p_values[tested] = multipletests(p_values[tested], method=correction)[1]
+
+    return pd.DataFrame(p_values, index=samples, columns=pd.Index(value_cols, name="Compound"))
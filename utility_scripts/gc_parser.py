@@ -0,0 +1,234 @@
+# %%
+# Import necessary libraries
+import os
+import sys
+import csv
+import json
+import math
+import hashlib
+import sqlite3
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+
+# %%
+# Description of the shared GC report parser
+script_descr = """
+Shared parser for the .txt report files exported by the gas chromatography system.
+
+Each report is read in a single pass. The sample ID is taken from the header lines, and the
+"Name" and "Conc." columns of the "[Compound Results(Ch1)]" block are split directly from the
+text, without building a pandas DataFrame for every file.
+"""
+
+COMPOUND_BLOCK = "[Compound Results(Ch1)]"
+GROUP_BLOCK = "[Group Results(Ch1)]"
+
+# Concentrations reported by the GC are for 10x diluted samples
+CONC_FACTOR = 10
+
+# A single parsed GC report: sample ID, compound names and concentrations (same order)
+GCReport = namedtuple("GCReport", ["sample_id", "compounds", "concs"])
+
+
+# %%
+def _to_float(value):
+    """Convert a field from the GC report to a float, using NaN for blank or invalid values."""
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def parse_gc_report(gc_file, conc_factor=CONC_FACTOR):
+    """Read a single GC output file in .txt format and return its results as a GCReport.
+
+    Returns None if the file has no valid (non-negative integer) sample ID. Raises a ValueError if the compound
+    results have no "Name" and "Conc." columns, or a row too short to have both (an incomplete file).
+    """
+    sample_id = -999
+    block = []
+    with open(gc_file, "r") as gc_content:
+        for line in gc_content:
+            if GROUP_BLOCK in line:
+                break
+            if "Sample ID" in line:
+                try:
+                    sample_id = int(line.split(",")[1])
+                except (ValueError, IndexError):
+                    pass
+            if COMPOUND_BLOCK in line:
+                for line2 in gc_content:
+                    if GROUP_BLOCK in line2:
+                        break
+                    if line2.strip():
+                        block.append(line2)
+                break
+    if sample_id < 0:
+        return None
+
+    # The first line of the block is the number of compounds, the second one is the header
+    rows = csv.reader(block[1:])
+    header = next(rows, [])
+    try:
+        name_col = header.index("Name")
+        conc_col = header.index("Conc.")
+    except ValueError:
+        raise ValueError(f"{gc_file} has no 'Name' and 'Conc.' columns in its compound results")
+    compounds = []
+    concs = []
+    for row in rows:
+        if len(row) <= max(name_col, conc_col):
+            # e.g., a report read while the GC is still writing it
+            raise ValueError(f"{gc_file} has an incomplete compound results row: {','.join(row)}")
+        compounds.append(row[name_col])
+        concs.append(_to_float(row[conc_col]) * conc_factor)
+    return GCReport(sample_id, tuple(compounds), concs)
+
+
+def iter_gc_reports(gc_files, conc_factor=CONC_FACTOR):
+    """Parse GC output files one at a time and yield a GCReport for each file with a valid sample ID."""
+    for gc_file in gc_files:
+        gc_report = parse_gc_report(gc_file, conc_factor)
+        if gc_report is not None:
+            yield gc_report
+
+
+def _try_parse_gc_report(gc_file, conc_factor):
+    """Parse a GC output file, returning the ValueError of an unreadable (e.g., incomplete) file instead of raising."""
+    try:
+        return parse_gc_report(gc_file, conc_factor)
+    except ValueError as error:
+        return error
+
+
+def _parse_gc_files(gc_files, jobs, conc_factor):
+    """Parse GC output files serially, or in chunks over a pool of worker processes if jobs > 1.
+
+    Returns a GCReport, None or the ValueError of each file, so that one unreadable file does not stop the others.
+    """
+    if jobs <= 1 or len(gc_files) < 2:
+        return [_try_parse_gc_report(gc_file, conc_factor) for gc_file in gc_files]
+    chunksize = max(1, math.ceil(len(gc_files) / (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(
+            executor.map(
+                partial(_try_parse_gc_report, conc_factor=conc_factor),
+                gc_files,
+                chunksize=chunksize,
+            )
+        )
+
+
+def _check_parsed(parsed, incomplete):
+    """Raise the ValueError of an unreadable file (incomplete = "raise"), or warn about it and use None ("warn")."""
+    if not isinstance(parsed, ValueError):
+        return parsed
+    if incomplete == "raise":
+        raise parsed
+    print("Skipping GC output file: {}".format(parsed), file=sys.stderr)
+    return None
+
+
+def _file_digest(gc_file):
+    """Return the SHA-1 hex digest of a file's content."""
+    with open(gc_file, "rb") as gc_content:
+        return hashlib.sha1(gc_content.read()).hexdigest()
+
+
+def parse_gc_reports(
+    gc_files, jobs=1, conc_factor=CONC_FACTOR, cache_file=None, rebuild_cache=False, incomplete="warn"
+):
+    """Parse a list of GC output files and return their GCReports (or None) in the same order as the files.
+
+    With jobs > 1, the files are parsed in a pool of worker processes. The files are submitted
+    in chunks so that each worker reads many small files per round trip.
+
+    If cache_file is given, parsed reports are kept in that SQLite file, keyed by file path, size,
+    modification time and content hash. Only new or changed files are parsed again on later runs.
+    rebuild_cache = True empties the cache first, forcing every file to be parsed.
+
+    Files that cannot be read (e.g., a report still being written by the GC system, see parse_gc_report) are
+    reported on stderr and returned as None with incomplete = "warn", or raise their ValueError with
+    incomplete = "raise". They are not cached, so they are read again on the next run.
+    """
+    if incomplete not in ("warn", "raise"):
+        raise ValueError(f"Unknown incomplete file policy: {incomplete!r}, choose from 'warn' and 'raise'")
+    gc_files = [os.fspath(gc_file) for gc_file in gc_files]
+    if cache_file is None:
+        return [_check_parsed(parsed, incomplete) for parsed in _parse_gc_files(gc_files, jobs, conc_factor)]
+
+    cache = sqlite3.connect(cache_file)
+    try:
+        cache.execute(
+            """CREATE TABLE IF NOT EXISTS gc_reports (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha1 TEXT,
+                conc_factor REAL,
+                sample_id INTEGER,
+                compounds TEXT,
+                concs TEXT
+            )"""
+        )
+        if rebuild_cache:
+            cache.execute("DELETE FROM gc_reports")
+        cached = {
+            row[0]: row[1:]
+            for row in cache.execute("SELECT * FROM gc_reports WHERE conc_factor = ?", (conc_factor,))
+        }
+
+        gc_reports = [None] * len(gc_files)
+        stale = []
+        for number, gc_file in enumerate(gc_files):
+            path = os.path.abspath(gc_file)
+            stat = os.stat(gc_file)
+            row = cached.get(path)
+            if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                gc_reports[number] = _report_from_row(row)
+                continue
+            digest = _file_digest(gc_file)
+            if row is not None and row[2] == digest:
+                # Same content with a new timestamp (e.g., copied or touched file)
+                cache.execute(
+                    "UPDATE gc_reports SET size = ?, mtime_ns = ? WHERE path = ?",
+                    (stat.st_size, stat.st_mtime_ns, path),
+                )
+                gc_reports[number] = _report_from_row(row)
+                continue
+            stale.append((number, path, stat, digest))
+
+        parsed = _parse_gc_files([gc_files[entry[0]] for entry in stale], jobs, conc_factor)
+        for (number, path, stat, digest), gc_report in zip(stale, parsed):
+            if isinstance(gc_report, ValueError):
+                # Keep the reports parsed so far in the cache, then raise or warn
+                cache.commit()
+                gc_reports[number] = _check_parsed(gc_report, incomplete)
+                continue
+            gc_reports[number] = gc_report
+            if gc_report is None:
+                values = (None, None, None)
+            else:
+                values = (
+                    gc_report.sample_id,
+                    json.dumps(gc_report.compounds),
+                    json.dumps(gc_report.concs),
+                )
+            cache.execute(
+                "INSERT OR REPLACE INTO gc_reports VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, digest, conc_factor, *values),
+            )
+        cache.commit()
+    finally:
+        cache.close()
+    return gc_reports
+
+
+def _report_from_row(row):
+    """Rebuild a GCReport (or None) from a row of the parse cache."""
+    sample_id, compounds, concs = row[4:]
+    if sample_id is None:
+        return None
+    return GCReport(sample_id, tuple(json.loads(compounds)), json.loads(concs))
@@ -0,0 +1,271 @@
+# %%
+# Import necessary libraries
+import os
+import re
+import html
+import ftplib
+import hashlib
+import threading
+import contextlib
+from urllib.parse import urlparse, unquote
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# %%
+# Description of the genome fetcher
+script_descr = """
+Fetch all files of a genome assembly folder from the NCBI's server over FTP, HTTP or HTTPS, without external programs.
+
+The folder is listed once, then its files are downloaded in parallel over a small pool of reused connections.
+A lock or semaphore shared by the fetchers of the same host can limit the number of files downloaded from it at once.
+Partial downloads are resumed (HTTP byte ranges or FTP REST), and downloaded files are checked against the folder's
+"md5checksums.txt". Files are renamed as they are written, replacing the assembly name prefix with the organism name.
+"""
+
+CHECKSUM_FILE = "md5checksums.txt"
+BLOCK_SIZE = 1 << 16
+
+
+# %%
+class HTTPFetcher:
+    """Lists and downloads the files of one HTTP(S) folder over a pooled requests session.
+
+    host_lock (optional) is held during each request, e.g., a semaphore shared by the fetchers of the same host.
+    """
+
+    def __init__(self, address, connections=4, host_lock=None):
+        self.address = address.rstrip("/") + "/"
+        self.host_lock = host_lock or contextlib.nullcontext()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def list_files(self):
+        """Return the names of the files (not subfolders) listed in the folder's index page."""
+        with self.host_lock:
+            response = self.session.get(self.address, timeout=60)
+        response.raise_for_status()
+        filenames = []
+        for href in re.findall(r'href="([^"]+)"', response.text):
+            filename = unquote(html.unescape(href))
+            if "/" in filename or filename.startswith(("?", "#")) or ":" in filename:
+                continue
+            if filename not in filenames:
+                filenames.append(filename)
+        return filenames
+
+    def fetch(self, filename, outfile, offset=0):
+        """Write the file's content from byte offset onwards to the open binary outfile."""
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.host_lock, self.session.get(
+            self.address + filename, headers=headers, stream=True, timeout=60
+        ) as response:
+            if response.status_code == 416:
+                # Nothing left to download
+                return
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # The server ignored the byte range, start over
+                outfile.seek(0)
+                outfile.truncate()
+            for block in response.iter_content(BLOCK_SIZE):
+                outfile.write(block)
+
+    def close(self):
+        self.session.close()
+
+
+class FTPFetcher:
+    """Lists and downloads the files of one FTP folder, reusing one connection per worker thread.
+
+    host_lock (optional) is held during each transfer, e.g., a semaphore shared by the fetchers of the same host.
+    """
+
+    def __init__(self, address, connections=4, host_lock=None):
+        url = urlparse(address.rstrip("/"))
+        self.host_lock = host_lock or contextlib.nullcontext()
+        self.host = url.hostname
+        self.port = url.port or 21
+        self.path = url.path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is None:
+            ftp = ftplib.FTP(timeout=60)
+            ftp.connect(self.host, self.port)
+            ftp.login()
+            ftp.cwd(self.path)
+            self._local.ftp = ftp
+            with self._lock:
+                self._connections.append(ftp)
+        return ftp
+
+    def _drop_connection(self):
+        """Close the connection of the current thread, so that the next call opens a new one."""
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is not None:
+            self._local.ftp = None
+            with self._lock:
+                self._connections.remove(ftp)
+            ftp.close()
+
+    def list_files(self):
+        """Return the names of the files (not subfolders) in the folder."""
+        with self.host_lock:
+            try:
+                ftp = self._connection()
+                try:
+                    return [name for name, facts in ftp.mlsd(facts=["type"]) if facts.get("type") == "file"]
+                except ftplib.error_perm:
+                    # MLSD is not supported by the server, list names only and keep those with a size (not subfolders)
+                    names = ftp.nlst()
+                    # SIZE is refused in ASCII mode, which the listing switched to
+                    ftp.voidcmd("TYPE I")
+                    filenames = []
+                    for name in names:
+                        try:
+                            ftp.size(name)
+                        except ftplib.error_perm:
+                            continue
+                        filenames.append(name)
+                    return filenames
+            except (OSError, EOFError, ftplib.Error):
+                self._drop_connection()
+                raise
+
+    def fetch(self, filename, outfile, offset=0):
+        """Write the file's content from byte offset onwards to the open binary outfile.
+
+        The connection is closed if the transfer fails (it may be left mid-transfer), and the next call opens a new one.
+        """
+        with self.host_lock:
+            try:
+                self._connection().retrbinary(
+                    "RETR " + filename, outfile.write, blocksize=BLOCK_SIZE, rest=offset or None
+                )
+            except (OSError, EOFError, ftplib.Error):
+                self._drop_connection()
+                raise
+
+    def close(self):
+        for ftp in self._connections:
+            try:
+                ftp.quit()
+            except (OSError, EOFError, ftplib.Error):
+                ftp.close()
+
+
+def open_fetcher(address, connections=4, host_lock=None):
+    """Return an FTPFetcher or HTTPFetcher for the folder address, based on its scheme."""
+    scheme = urlparse(address).scheme
+    if scheme == "ftp":
+        return FTPFetcher(address, connections, host_lock)
+    elif scheme in ("http", "https"):
+        return HTTPFetcher(address, connections, host_lock)
+    else:
+        raise ValueError(f"Unsupported address scheme: {scheme!r} (use ftp, http or https)")
+
+
+# %%
+def md5sum(filepath):
+    """Return the MD5 hex digest of a file."""
+    digest = hashlib.md5()
+    with open(filepath, "rb") as content:
+        for block in iter(lambda: content.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_checksums(checksum_text):
+    """Parse the content of an NCBI "md5checksums.txt" file into {filename: md5}."""
+    checksums = {}
+    for line in checksum_text.splitlines():
+        fields = line.split()
+        if len(fields) == 2:
+            filename = fields[1][2:] if fields[1].startswith("./") else fields[1]
+            checksums[filename] = fields[0].lower()
+    return checksums
+
+
+def local_name(filename, assembly_name, organism):
+    """Rename an assembly file by replacing its assembly name prefix with the organism name."""
+    if filename.startswith(assembly_name):
+        return organism + filename[len(assembly_name) :]
+    return filename
+
+
+def fetch_file(fetcher, filename, outpath, md5=None):
+    """Download one file to outpath, resuming from outpath + ".part" if present, and check its MD5 checksum.
+
+    A complete outpath that matches md5 is kept without downloading. If the checksum does not match after
+    resuming, the file is downloaded once more from the start; a second mismatch raises a ValueError.
+    Returns "present" or "downloaded".
+    """
+    if os.path.exists(outpath) and (md5 is None or md5sum(outpath) == md5):
+        return "present"
+    part_outpath = outpath + ".part"
+    for attempt in range(2):
+        offset = os.path.getsize(part_outpath) if os.path.exists(part_outpath) else 0
+        with open(part_outpath, "ab") as outfile:
+            fetcher.fetch(filename, outfile, offset)
+        if md5 is None or md5sum(part_outpath) == md5:
+            os.replace(part_outpath, outpath)
+            return "downloaded"
+        os.remove(part_outpath)
+    raise ValueError(f"{filename} does not match its MD5 checksum after downloading it again")
+
+
+def fetch_assembly(
+    address, outdir, organism=None, connections=4, verify=True, on_file=None, done=None, host_lock=None
+):
+    """Download all files of a genome assembly folder into outdir, renaming them after the organism.
+
+    address is the assembly folder on the NCBI's server (ftp://, http:// or https://). The folder is listed once and
+    its files are downloaded by up to connections worker threads, each reusing its connection.
+    With verify = True, the files are checked against the folder's "md5checksums.txt".
+    on_file (optional) is called with the path of each file as soon as it is complete, from the worker thread.
+    done (optional) is called with the path of each file before downloading it, and returns True if the file was
+    already downloaded and processed (e.g., decompressed by on_file), so it is neither downloaded nor passed to on_file.
+    host_lock (optional) is held while each file is downloaded, e.g., a semaphore shared by the downloads from the
+    same host, so that it limits the number of files downloaded from the host at once across assemblies.
+    Returns {local file name: "present" or "downloaded"}.
+    """
+    assembly_name = urlparse(address.rstrip("/")).path.rsplit("/", 1)[-1]
+    organism = organism or assembly_name
+    os.makedirs(outdir, exist_ok=True)
+
+    fetcher = open_fetcher(address, connections, host_lock)
+    try:
+        filenames = fetcher.list_files()
+        checksums = {}
+        if verify and CHECKSUM_FILE in filenames:
+            checksum_path = os.path.join(outdir, CHECKSUM_FILE)
+            with open(checksum_path, "wb") as checksum_file:
+                fetcher.fetch(CHECKSUM_FILE, checksum_file)
+            with open(checksum_path) as checksum_file:
+                checksums = parse_checksums(checksum_file.read())
+
+        def fetch_one(filename):
+            outpath = os.path.join(outdir, local_name(filename, assembly_name, organism))
+            if done is not None and done(outpath):
+                return "present"
+            status = fetch_file(fetcher, filename, outpath, checksums.get(filename))
+            if on_file is not None:
+                on_file(outpath)
+            return status
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            futures = {
+                local_name(filename, assembly_name, organism): executor.submit(fetch_one, filename)
+                for filename in filenames
+                if filename != CHECKSUM_FILE
+            }
+            return {name: future.result() for name, future in futures.items()}
+    finally:
+        fetcher.close()
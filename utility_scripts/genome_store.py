@@ -0,0 +1,204 @@
+# %%
+# Import necessary libraries
+import os
+import json
+import threading
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from genome_fetch import md5sum
+from download_genome import blastdb_type, BLASTDB_INDEX
+
+
+# %%
+# Description of the genome store
+script_descr = """
+Local store of downloaded genome assemblies, indexed by a manifest (genomes/genome_manifest.json).
+
+Each organism has its own folder in the store, as created by download_genome. The manifest records, for each organism,
+the assembly accession and address, the size, modification time and MD5 checksum of each file, and whether a BLAST
+database was built for each sequence file. Assemblies that are complete and unchanged are recognized without going
+online, and files with identical content are hard-linked to a single copy in the store's objects folder.
+lookup(organism) resolves the paths of an organism's files from the manifest.
+"""
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "genomes")
+MANIFEST_FILE = "genome_manifest.json"
+OBJECTS_DIR = ".objects"
+
+# Caches and indexes that the readers write next to assembly files (feature_table_io, seq_index and bgzf_io)
+DERIVED_EXTENSIONS = (".feather", ".parquet", ".fai", ".gzi")
+
+GenomeEntry = namedtuple("GenomeEntry", ["organism", "accession", "path", "files", "blastdb"])
+
+
+# %%
+def assembly_accession(address):
+    """Return the accession (e.g., GCF_001642655.1) from the address of an NCBI assembly folder."""
+    assembly_name = urlparse(address.rstrip("/")).path.rsplit("/", 1)[-1]
+    return "_".join(assembly_name.split("_")[:2])
+
+
+def _blastdb_built(directory, seqname):
+    """Check whether the BLAST database of a sequence file (named after it, without ".gz") is present."""
+    dbname = seqname[:-3] if seqname.endswith(".gz") else seqname
+    return any(
+        os.path.exists(os.path.join(directory, dbname + extension))
+        for extension in BLASTDB_INDEX[blastdb_type(seqname)]
+    )
+
+
+def _assembly_files(directory):
+    """List the assembly files of an organism folder, leaving out BLAST database files, partial downloads and the
+    caches and indexes of the readers (see DERIVED_EXTENSIONS), which are rewritten as they are used.
+    """
+    names = sorted(entry.name for entry in os.scandir(directory) if entry.is_file())
+    seq_stems = [
+        name[:-3] if name.endswith(".gz") else name for name in names if blastdb_type(name) is not None
+    ]
+    return [
+        name
+        for name in names
+        if not name.endswith((".part", ".tmp") + DERIVED_EXTENSIONS)
+        and not any(name.startswith(stem + ".") and name != stem + ".gz" for stem in seq_stems)
+    ]
+
+
+class GenomeStore:
+    """Manifest-indexed folder of genome assemblies, with one subfolder per organism."""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        try:
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def organism_dir(self, organism):
+        return os.path.join(self.root, organism)
+
+    def _save(self):
+        with open(self.manifest_path + ".tmp", "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def is_complete(self, organism, address=None, deep=False):
+        """Check whether an organism's assembly is recorded in the manifest and unchanged on disk, without going online.
+
+        Every recorded file must exist with its recorded size and modification time (deep = True compares
+        MD5 checksums instead), and every BLAST database must be present. If address is given, it must be
+        the address the assembly was downloaded from.
+        """
+        record = self.manifest.get(organism)
+        if record is None or (address is not None and record["address"].rstrip("/") != address.rstrip("/")):
+            return False
+        directory = self.organism_dir(organism)
+        for name, info in record["files"].items():
+            filepath = os.path.join(directory, name)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                return False
+            if stat.st_size != info["size"]:
+                return False
+            if deep:
+                if md5sum(filepath) != info["md5"]:
+                    return False
+            elif stat.st_mtime_ns != info["mtime_ns"]:
+                return False
+        return all(_blastdb_built(directory, name) for name in record["blastdb"])
+
+    def record(self, organism, address):
+        """Record an organism's downloaded assembly in the manifest, and hard-link its files to identical copies.
+
+        The MD5 checksum of each file is its key in the objects folder: a file with the same checksum as an
+        object already stored is replaced by a hard link to it, and a new file is linked into the folder.
+        Returns the organism's manifest record.
+        """
+        directory = self.organism_dir(organism)
+        objects_dir = os.path.join(self.root, OBJECTS_DIR)
+        files = {}
+        for name in _assembly_files(directory):
+            filepath = os.path.join(directory, name)
+            md5 = md5sum(filepath)
+            object_path = os.path.join(objects_dir, md5[:2], md5)
+            try:
+                if not os.path.exists(object_path):
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    os.link(filepath, object_path)
+                elif not os.path.samefile(filepath, object_path):
+                    os.link(object_path, filepath + ".tmp")
+                    os.replace(filepath + ".tmp", filepath)
+            except OSError:
+                # Hard links are not supported here (e.g., another file system), keep the file as it is
+                pass
+            stat = os.stat(filepath)
+            files[name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": md5}
+
+        record = {
+            "accession": assembly_accession(address),
+            "address": address,
+            "files": files,
+            "blastdb": {
+                name: _blastdb_built(directory, name) for name in files if blastdb_type(name) is not None
+            },
+        }
+        with self._lock:
+            self.manifest[organism] = record
+            self._save()
+        return record
+
+    def lookup(self, organism):
+        """Return the GenomeEntry of an organism, with the absolute paths of its files. Raises a KeyError if absent."""
+        record = self.manifest[organism]
+        directory = os.path.abspath(self.organism_dir(organism))
+        return GenomeEntry(
+            organism,
+            record["accession"],
+            directory,
+            {name: os.path.join(directory, name) for name in record["files"]},
+            record["blastdb"],
+        )
+
+    def file(self, organism, suffix):
+        """Return the path of an organism's file ending with suffix (e.g., "_feature_table.txt", "_protein.faa").
+
+        The file named organism + suffix is preferred over other files ending with suffix (e.g., "_genomic.fna"
+        over "_cds_from_genomic.fna"), and a compressed copy (suffix + ".gz") is returned if the uncompressed file
+        is absent. Raises a KeyError if none is recorded.
+        """
+        files = self.lookup(organism).files
+        for candidate in (suffix, suffix + ".gz"):
+            if organism + candidate in files:
+                return files[organism + candidate]
+            for name, filepath in files.items():
+                if name.endswith(candidate):
+                    return filepath
+        raise KeyError(f"No {suffix} file recorded for {organism}")
+
+
+# %%
+_stores = {}
+
+
+def open_store(root=DEFAULT_ROOT):
+    """Return the GenomeStore of root, reading its manifest only once per session (or again after it changes)."""
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+    mtime_ns = os.stat(manifest_path).st_mtime_ns if os.path.exists(manifest_path) else None
+    key = os.path.abspath(root)
+    if key not in _stores or _stores[key][0] != mtime_ns:
+        _stores[key] = (mtime_ns, GenomeStore(root))
+    return _stores[key][1]
+
+
+def lookup(organism, root=DEFAULT_ROOT):
+    """Return the GenomeEntry (accession, folder, file paths, BLAST database status) of an organism in the genome store."""
+    return open_store(root).lookup(organism)
+
+
+def genome_file(organism, suffix, root=DEFAULT_ROOT):
+    """Return the path of an organism's file ending with suffix (e.g., "_feature_table.txt") in the genome store."""
+    return open_store(root).file(organism, suffix)
@@ -0,0 +1,157 @@
+# %%
+# Import necessary libraries
+import sys
+import argparse
+import pandas as pd
+
+from feature_table_io import load_feature_table
+
+
+# %%
+# Description of the locus resolver
+script_descr = """
+Resolve lists of gene identifiers (locus tags, old locus tags, gene symbols or product names) to the loci of a
+genome feature table.
+
+The "attributes" column of the feature table (e.g., "old_locus_tag=CTK_C00760") is parsed once into one column
+per attribute, and all identifiers are indexed by the locus tag they belong to. A list of identifiers is then
+resolved in one join, with all feature table rows (e.g., gene and CDS) of each matching locus.
+Identifiers are read one per line from a file or from the standard input, and the result is written as a
+tab-separated table.
+"""
+
+LOCUS_FIELDS = ["locus_tag", "old_locus_tag", "symbol", "name"]
+
+
+# %%
+def parse_attributes(attributes: pd.Series):
+    """Parse an NCBI feature table "attributes" column into a DataFrame with one column per attribute.
+
+    Attributes are separated by ";" and written as key=value. Keys without a value (e.g., "pseudo") are set to "true",
+    and repeated keys are joined with ",". Rows without an attribute get NaN.
+    """
+    pairs = attributes.dropna().rename_axis("row").str.split(";").explode().str.strip()
+    pairs = pairs[pairs != ""]
+    if pairs.empty:
+        return pd.DataFrame(index=attributes.index)
+    parts = pairs.str.partition("=")
+    parsed = (
+        pd.DataFrame({"key": parts[0], "value": parts[2].where(parts[1] == "=", "true")})
+        .groupby(["row", "key"], sort=False)["value"]
+        .agg(",".join)
+        .unstack("key")
+    )
+    parsed.columns.name = None
+    return parsed.reindex(attributes.index)
+
+
+class LocusIndex:
+    """Hash index from the identifiers of a feature table's loci (see LOCUS_FIELDS) to their locus tags."""
+
+    def __init__(self, feature_table: pd.DataFrame, fields: list = LOCUS_FIELDS):
+        if "attributes" in feature_table.columns:
+            attributes = parse_attributes(feature_table["attributes"])
+            feature_table = feature_table.join(
+                attributes[attributes.columns.difference(feature_table.columns)]
+            )
+        self.feature_table = feature_table
+        self.fields = [field for field in fields if field in feature_table.columns]
+
+        keys = []
+        for field in self.fields:
+            field_keys = feature_table[list(dict.fromkeys([field, "locus_tag"]))].dropna()
+            if field == "old_locus_tag":
+                # A locus can have several old locus tags
+                field_keys = field_keys.assign(
+                    old_locus_tag=field_keys["old_locus_tag"].str.split(",")
+                ).explode("old_locus_tag")
+            keys.append(
+                pd.DataFrame(
+                    {"key": field_keys[field].astype(str), "field": field, "locus_tag": field_keys["locus_tag"]}
+                )
+            )
+        keys = pd.concat(keys, ignore_index=True).drop_duplicates()
+        keys["field"] = pd.Categorical(keys["field"], categories=self.fields)
+        self.keys = keys.set_index("key")
+
+    def resolve(self, ids, fields: list = None):
+        """Resolve identifiers to the feature table rows of their loci, in one join.
+
+        fields (optional) restricts the identifier types searched (default: all of LOCUS_FIELDS in the table).
+        Returns a DataFrame with "query" and "matched_field" columns followed by the feature table's columns,
+        with one row per (identifier, feature) match in the order of ids. Identifiers that match nothing are
+        kept with NaN values.
+        """
+        keys = self.keys if fields is None else self.keys.loc[self.keys["field"].isin(fields)]
+        queries = pd.DataFrame({"query": pd.Series(list(ids), dtype=str)})
+        matches = queries.merge(keys, how="left", left_on="query", right_index=True)
+        resolved = matches.merge(self.feature_table, how="left", on="locus_tag")
+        # Keep integer columns (e.g., start and end) as integers despite the NaN of unmatched identifiers
+        integer_cols = self.feature_table.select_dtypes("integer").columns
+        resolved[integer_cols] = resolved[integer_cols].astype("Int64")
+        return resolved.rename(columns={"field": "matched_field"}).reset_index(drop=True)
+
+
+def read_ids(id_file):
+    """Read identifiers, one per line, from an open text file, skipping blank lines."""
+    return [line.strip() for line in id_file if line.strip()]
+
+
+# %%
+locus_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+    add_help=False,
+)
+locus_group1 = locus_parser.add_argument_group("Information to provide")
+locus_group1.add_argument(
+    "-t", "--feature-table",
+    help="(Required unless organism name is given) Path to the genome feature table (tab-separated, as downloaded from the NCBI).",
+    metavar="<file>",
+)
+locus_group1.add_argument(
+    "-n", "--organism-name",
+    help="(Optional) Organism name in the genome store, used to find its feature table if no feature table path is given.",
+    metavar="<name>",
+)
+locus_group1.add_argument(
+    "-i", "--ids",
+    help="(Optional) File of identifiers to look up, one per line. The default is to read them from the standard input.",
+    metavar="<file>",
+)
+locus_group1.add_argument(
+    "-f", "--fields",
+    help="(Optional) Comma-separated list of identifier types to search, among locus_tag, old_locus_tag, symbol and name. The default is all of them.",
+    metavar="<fields>",
+)
+locus_group1.add_argument(
+    "-o", "--outfile",
+    help="(Optional) Path to the output tab-separated file. The default is to write to the standard output.",
+    metavar="<file>",
+)
+locus_group2 = locus_parser.add_argument_group("Help")
+locus_group2.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+if __name__ == "__main__":
+    locus_args = locus_parser.parse_args()
+    if locus_args.feature_table is None and locus_args.organism_name is None:
+        locus_parser.error("provide a feature table (-t) or an organism name (-n)")
+    feature_table_path = locus_args.feature_table
+    if feature_table_path is None:
+        from genome_store import genome_file
+
+        feature_table_path = genome_file(locus_args.organism_name, "_feature_table.txt")
+
+    if locus_args.ids is None:
+        ids = read_ids(sys.stdin)
+    else:
+        with open(locus_args.ids) as id_file:
+            ids = read_ids(id_file)
+    fields = locus_args.fields.split(",") if locus_args.fields else None
+
+    locus_index = LocusIndex(load_feature_table(feature_table_path))
+    resolved = locus_index.resolve(ids, fields)
+    resolved.to_csv(locus_args.outfile or sys.stdout, sep="\t", index=False)
+    unresolved = resolved.loc[resolved["matched_field"].isna(), "query"]
+    if len(unresolved):
+        print("{} identifier(s) not found: {}".format(len(unresolved), ", ".join(unresolved)), file=sys.stderr)
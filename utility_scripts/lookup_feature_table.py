@@ -4,6 +4,11 @@ import subprocess
 from numpy import append
 import pandas as pd
 from Bio import SeqIO
+from genome_store import genome_file
+from feature_index import FeatureIndex
+from feature_table_io import load_feature_table, start_end
+from locus_index import LocusIndex, LOCUS_FIELDS
+from seq_index import FastaIndex, locus_sequences
 pd.options.display.max_columns = 999
 
 
@@ -11,10 +16,14 @@ pd.options.display.max_columns = 999
 # Define utility functions
 
 
-def select_fields(feature_table: pd.DataFrame, fields: int = 1, Benchling: int = 1):
+# Fields computed from other fields when selected, rather than stored in the feature table
+DERIVED_FIELDS = {":start:end": start_end}
+
+
+def select_fields(feature_table: pd.DataFrame, fields: int or list = 1, Benchling: int = 1, rows=None):
     """Display the genome feature table with selected information fields.
 
-    fields = 1, 2, or 3 (optional).
+    fields = 1, 2, or 3 (optional), or a list of field names.
         1 : (default) use recommended fields (:start:end, strand, name, symbol, locus_tag)
         2 : use the same fields from the genome feature table
         3 : fields of your choice (type exactly as they are listed)
@@ -22,6 +31,12 @@ def select_fields(feature_table: pd.DataFrame, fields: int = 1, Benchling: int =
     Benchling = 0 or 1 (optional).
         1 : (default) replace the 'start' and 'end' fields with a ':start:end' field for easier locus search and selection in Benchling.
         0 : No preference
+
+    rows (optional) selects the rows to display before the fields are taken: a boolean mask, a function of the
+    feature table returning a mask (e.g., lambda table: table["# feature"] == "CDS"), or a list of row labels.
+
+    Only the selected rows and fields are copied, and the feature table itself is not modified.
+    Derived fields (:start:end) are computed for the selected rows only.
     """
     if fields == 1:
         selected_fields = [":start:end", "strand", "name", "symbol", "locus_tag"]
@@ -29,11 +44,13 @@ def select_fields(feature_table: pd.DataFrame, fields: int = 1, Benchling: int =
         selected_fields = feature_table.columns.tolist()
     elif fields == 3:
         selected_fields = []
-        field_count = str(input(print("Number of fields to be included: ")))
+        field_count = int(input(print("Number of fields to be included: ")))
         number = 0
         while number < field_count:
             selected_fields.append(input(print(f"Field {number+1}: ")))
             number += 1
+    else:
+        selected_fields = list(fields)
     if Benchling == 1:
         if ":start:end" in selected_fields:
             pass
@@ -44,40 +61,48 @@ def select_fields(feature_table: pd.DataFrame, fields: int = 1, Benchling: int =
                 selected_fields.remove("end")
             except ValueError:
                 pass
-    feature_table_selected = feature_table
-    if ":start:end" in selected_fields:
-        feature_table_selected[":start:end"] = (
-            ":"
-            + feature_table["start"].astype(str)
-            + ":"
-            + feature_table["end"].astype(str)
-        )
-    else:
-        pass
+
+    derived_fields = [
+        field for field in selected_fields if field in DERIVED_FIELDS and field not in feature_table.columns
+    ]
+    source_fields = [field for field in selected_fields if field not in derived_fields]
+    if derived_fields:
+        source_fields = list(dict.fromkeys(source_fields + ["start", "end"]))
+
+    if rows is None:
+        rows = slice(None)
+    elif callable(rows):
+        rows = rows(feature_table)
+    feature_table_selected = feature_table.loc[rows, source_fields]
+    for field in derived_fields:
+        feature_table_selected[field] = DERIVED_FIELDS[field](feature_table_selected)
     return feature_table_selected[selected_fields]
 
 
 def lookup_loci(
-    feature_table: pd.DataFrame, column: str, col_values: list or str or int
+    feature_table: pd.DataFrame, column: str, col_values: list or str or int = None, index: FeatureIndex = None
 ):
     # to be worked on
     """Choose a column in the genome feature table and search for the ORF or locus that has specific values for that column (e.g., contains a given base pair position, or has a specific locus tag).
 
-    column = base or loctag (locus tag)
+    column = base, locus_tag, old_locus_tag, symbol or name
+
+    For column = "base", col_values is a base pair position or a list of positions (asked for if not provided),
+    looked up with a FeatureIndex of the feature table. Pass a prebuilt index to reuse it across lookups.
+    For the other columns, col_values is an identifier or a list of identifiers (asked for if not provided),
+    resolved with a LocusIndex of the feature table. To resolve many lists, build a LocusIndex once instead.
     """
     if column == "base":
-
-        base = int(input(print("Base pair position to look up: ")))
-        located_loci = feature_table[
-            (feature_table["start"] < base) & (feature_table["end"] > base)
-        ]
-    elif column == "locus_tag":
-        locus_tags = []
-        loci_count = int(input(print("Number of locus tags to look up: ")))
-        loci_counter = 0
-        while loci_counter < loci_count:
-            locus_tags.append(input(print(f"Locus {loci_counter+1}: ")))
-        located_loci = feature_table[feature_table["locus_tag"].isin(locus_tags)]
+        if col_values is None:
+            col_values = int(input(print("Base pair position to look up: ")))
+        index = index or FeatureIndex(feature_table)
+        located_loci = index.positions(col_values)
+    elif column in LOCUS_FIELDS:
+        if col_values is None:
+            col_values = input(print("Comma-separated list of values to look up: ")).split(",")
+        elif isinstance(col_values, str):
+            col_values = [col_values]
+        located_loci = LocusIndex(feature_table, [column]).resolve(col_values)
     else:
         print("Searching using this column is not supported yet.")
     return located_loci.reset_index(drop=True)
@@ -85,11 +110,8 @@ def lookup_loci(
 
 # %%
 # Read in feature table
-feature_table = pd.read_table(
-    r"H:\Ujor_Lab\Proj_Dairy_succinate\Sequences\Genomes\Ctyro_KCTC_5387_feat-table.txt"
-)
-feature_table[":start:end"] = (
-    ":" + feature_table["start"].astype(str) + ":" + feature_table["end"].astype(str)
+feature_table = load_feature_table(
+    genome_file("Clostridium_tyrobutyricum_KCTC_5387", "_feature_table.txt")
 )
 feature_table
 
@@ -97,15 +119,18 @@ feature_table
 # %%
 # Look up with old locus tags
 old_loci = ["CTK_C00760"]
-new_loci = feature_table.loc[
-    feature_table["attributes"].str.lstrip("old_locus_tag=").isin(old_loci), 'locus_tag'
-]
-table_lookup = feature_table.loc[
-    feature_table["locus_tag"].isin(new_loci), :
-]
+locus_index = LocusIndex(feature_table)
+table_lookup = locus_index.resolve(old_loci, fields=["old_locus_tag"])
 table_lookup
 
 
+# %%
+# Obtain the sequences of the looked-up loci from the genome folder
+with FastaIndex(genome_file("Clostridium_tyrobutyricum_KCTC_5387", "_genomic.fna")) as genome_index:
+    table_lookup["sequence"] = locus_sequences(table_lookup, genome_index)
+table_lookup[["locus_tag", "# feature", "sequence"]]
+
+
 # %%
 # Obtain sequence from downloaded genbank
 prot_gbs = [
@@ -0,0 +1,272 @@
+# %%
+# Import necessary libraries
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+from itertools import permutations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from Bio.Blast.Applications import NcbiblastpCommandline as blastp
+
+from parse_alignment import readBLAST
+from genome_fetch import md5sum
+from genome_store import open_store, DEFAULT_ROOT
+from feature_table_io import load_feature_table
+
+
+# %%
+# Description of the ortholog finder
+script_descr = """
+Find orthologs between genomes of the genome store (e.g., all genomes of genomes/genomes_refseq.txt) as
+reciprocal best BLAST hits (RBH) between their proteins.
+
+Each genome's proteins ("*_protein.faa") are searched with blastp against the protein BLAST database of every other
+genome, in parallel. The hits of each ordered genome pair are cached, keyed by the content of both protein files,
+so adding a genome only runs the searches between it and the other genomes.
+Proteins are mapped to their locus tags with the genomes' feature tables, and the reciprocal best hits are grouped
+into an ortholog table with one locus_tag column per genome, which can be joined onto the feature tables.
+"""
+
+RBH_FIELDS = ["qseqid", "sseqid", "pident", "length", "evalue", "bitscore"]
+
+
+# %%
+def _protein_files(organism, store):
+    """Return the protein FASTA, protein BLAST database and feature table paths of an organism in the genome store."""
+    protein_faa = store.file(organism, "_protein.faa")
+    protein_db = protein_faa[:-3] if protein_faa.endswith(".gz") else protein_faa
+    return protein_faa, protein_db, store.file(organism, "_feature_table.txt")
+
+
+def _run_pair(query_faa, db, outfile, options):
+    """Search one genome's proteins against another genome's protein database, writing outfile once finished.
+
+    blastp does not read gzipped queries, so a compressed protein file (e.g., kept as BGZF by download_genome) is
+    decompressed to a temporary file for the search.
+    """
+    if query_faa.endswith(".gz"):
+        with gzip.open(query_faa, "rb") as compressed, open(outfile + ".query.faa", "wb") as uncompressed:
+            shutil.copyfileobj(compressed, uncompressed, 1 << 20)
+        query_faa = outfile + ".query.faa"
+    try:
+        blastp(query=query_faa, db=db, out=outfile + ".tmp", **options)()
+    finally:
+        if query_faa == outfile + ".query.faa":
+            os.remove(query_faa)
+    os.replace(outfile + ".tmp", outfile)
+    return outfile
+
+
+def protein_loci(feature_table):
+    """Map the protein accessions of a feature table's CDS rows to their locus tags.
+
+    Returns a DataFrame with "product_accession" and "locus_tag" columns. A protein shared by several loci
+    (e.g., a RefSeq non-redundant WP_ protein) has one row per locus.
+    """
+    cds = feature_table.loc[feature_table["# feature"] == "CDS", ["product_accession", "locus_tag"]]
+    return cds.dropna().drop_duplicates().reset_index(drop=True)
+
+
+def reciprocal_best_hits(hits_ab, hits_ba):
+    """Return the reciprocal best hits of two searches (A against B and B against A), as a DataFrame of
+    "query" (protein of A), "subject" (protein of B) and "bitscore" (of the search of A against B).
+
+    The best hit of each query is its hit with the highest bit score.
+    """
+    best_ab = (
+        hits_ab.sort_values("bitscore", ascending=False, kind="stable")
+        .drop_duplicates("qseqid")
+        .astype({"qseqid": str, "sseqid": str})
+    )
+    best_ba = (
+        hits_ba.sort_values("bitscore", ascending=False, kind="stable")
+        .drop_duplicates("qseqid")
+        .astype({"qseqid": str, "sseqid": str})
+    )
+    rbh = best_ab.merge(
+        best_ba[["qseqid", "sseqid"]],
+        left_on=["qseqid", "sseqid"],
+        right_on=["sseqid", "qseqid"],
+        suffixes=("", "_ba"),
+    )
+    return rbh.rename(columns={"qseqid": "query", "sseqid": "subject"})[["query", "subject", "bitscore"]]
+
+
+def ortholog_table(rbh_pairs, loci):
+    """Group reciprocal best hits between genomes into an ortholog table keyed by locus tag.
+
+    rbh_pairs = {(organism A, organism B): reciprocal_best_hits DataFrame}
+    loci = {organism: protein_loci DataFrame}
+
+    Loci connected by reciprocal best hits form one ortholog group (one row), with the locus tag(s) of each genome
+    in its column (several locus tags of a genome are joined with ","), and the number of genomes in "n_genomes".
+    Rows are sorted by the locus tags of the genomes, in the order of loci.
+    """
+    organisms = list(loci)
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for (organism_a, organism_b), rbh in rbh_pairs.items():
+        pairs = rbh.merge(
+            loci[organism_a].rename(columns={"product_accession": "query", "locus_tag": "locus_a"}), on="query"
+        ).merge(loci[organism_b].rename(columns={"product_accession": "subject", "locus_tag": "locus_b"}), on="subject")
+        for locus_a, locus_b in zip(pairs["locus_a"], pairs["locus_b"]):
+            root_a, root_b = find((organism_a, locus_a)), find((organism_b, locus_b))
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    groups = pd.DataFrame(
+        [(find(node), node[0], node[1]) for node in list(parent)], columns=["group", "organism", "locus_tag"]
+    )
+    if groups.empty:
+        return pd.DataFrame(columns=organisms + ["n_genomes"])
+    table = (
+        groups.sort_values("locus_tag")
+        .groupby(["group", "organism"], sort=False)["locus_tag"]
+        .agg(",".join)
+        .unstack("organism")
+        .reindex(columns=organisms)
+    )
+    table["n_genomes"] = table[organisms].notna().sum(axis=1)
+    return table.sort_values(organisms, na_position="last").reset_index(drop=True).rename_axis(columns=None)
+
+
+def find_orthologs(organisms, cache_dir=None, root=DEFAULT_ROOT, jobs=None, threads=None, evalue=1e-5, **blastp_options):
+    """Find the orthologs between organisms of the genome store as reciprocal best protein BLAST hits.
+
+    Every ordered pair of organisms is searched with blastp (up to jobs searches at once, each with threads // jobs
+    threads), unless its hits are cached in cache_dir (default: <root>/orthologs) for the same protein files and
+    options. Other keyword arguments are passed to blastp (e.g., max_target_seqs=5).
+    Returns the ortholog table (see ortholog_table).
+    """
+    store = open_store(root)
+    cache_dir = cache_dir or os.path.join(root, "orthologs")
+    os.makedirs(cache_dir, exist_ok=True)
+    threads = threads or os.cpu_count()
+    jobs = jobs or threads
+    options = dict(blastp_options, outfmt="6 " + " ".join(RBH_FIELDS), evalue=evalue)
+    files = {organism: _protein_files(organism, store) for organism in organisms}
+    digests = {organism: md5sum(files[organism][0]) for organism in organisms}
+
+    manifest_path = os.path.join(cache_dir, "completed_pairs.json")
+    try:
+        with open(manifest_path) as manifest_file:
+            completed = json.load(manifest_file)
+    except (OSError, ValueError):
+        completed = {}
+
+    outfiles = {}
+    searches = {}
+    for organism_a, organism_b in permutations(organisms, 2):
+        outfile = os.path.join(cache_dir, "{}__{}.tsv".format(organism_a, organism_b))
+        key = hashlib.sha1(
+            json.dumps([digests[organism_a], digests[organism_b], options], sort_keys=True).encode()
+        ).hexdigest()
+        outfiles[organism_a, organism_b] = outfile
+        if completed.get(os.path.basename(outfile)) != key or not os.path.exists(outfile):
+            searches[organism_a, organism_b] = (outfile, key)
+    print("{} genome pair searches cached, {} to run".format(len(outfiles) - len(searches), len(searches)))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                _run_pair,
+                files[organism_a][0],
+                files[organism_b][1],
+                outfile,
+                dict(options, num_threads=max(1, threads // jobs)),
+            ): (outfile, key)
+            for (organism_a, organism_b), (outfile, key) in searches.items()
+        }
+        for future in as_completed(futures):
+            outfile, key = futures[future]
+            future.result()
+            completed[os.path.basename(outfile)] = key
+            with open(manifest_path + ".tmp", "w") as manifest_file:
+                json.dump(completed, manifest_file, indent=2, sort_keys=True)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            print("Completed {}".format(outfile))
+
+    rbh_pairs = {}
+    for index_a, organism_a in enumerate(organisms):
+        for organism_b in organisms[index_a + 1 :]:
+            rbh_pairs[organism_a, organism_b] = reciprocal_best_hits(
+                readBLAST(outfiles[organism_a, organism_b], fields=RBH_FIELDS, max_hits=1),
+                readBLAST(outfiles[organism_b, organism_a], fields=RBH_FIELDS, max_hits=1),
+            )
+    loci = {organism: protein_loci(load_feature_table(files[organism][2])) for organism in organisms}
+    return ortholog_table(rbh_pairs, loci)
+
+
+# %%
+ortho_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+    add_help=False,
+)
+ortho_group1 = ortho_parser.add_argument_group("Information to provide")
+ortho_group1.add_argument(
+    "-l", "--genome-list",
+    help="(Optional) Genome list file, whose organisms are compared. The default is genomes/genomes_refseq.txt.",
+    default=os.path.join(DEFAULT_ROOT, "genomes_refseq.txt"),
+    metavar="<file>",
+)
+ortho_group1.add_argument(
+    "-o", "--outfile",
+    help="(Required) Path to the output ortholog table (tab-separated).",
+    metavar="<file>",
+    required=True,
+)
+ortho_group1.add_argument(
+    "-c", "--cache-dir",
+    help="(Optional) Folder where the hits of each genome pair are cached. The default is the orthologs folder of the genome store.",
+    metavar="<path>",
+)
+ortho_group1.add_argument(
+    "-j", "--jobs",
+    help="(Optional) Number of blastp searches run at the same time. The default is one per CPU.",
+    type=int,
+    metavar="<number>",
+)
+ortho_group1.add_argument(
+    "-t", "--threads",
+    help="(Optional) Total number of threads shared by the blastp searches. The default is the number of CPUs.",
+    type=int,
+    metavar="<number>",
+)
+ortho_group1.add_argument(
+    "-e", "--evalue",
+    help="(Optional) Maximum e-value of the hits. The default value is 1e-5.",
+    type=float,
+    default=1e-5,
+    metavar="<evalue>",
+)
+ortho_group2 = ortho_parser.add_argument_group("Help")
+ortho_group2.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        ortho_parser.print_help()
+    else:
+        from dl_all_genomes import read_genome_list
+
+        ortho_args = ortho_parser.parse_args()
+        organisms = [organism for organism, genome_adr in read_genome_list(ortho_args.genome_list)]
+        orthologs = find_orthologs(
+            organisms,
+            cache_dir=ortho_args.cache_dir,
+            root=os.path.dirname(ortho_args.genome_list),
+            jobs=ortho_args.jobs,
+            threads=ortho_args.threads,
+            evalue=ortho_args.evalue,
+        )
+        orthologs.to_csv(ortho_args.outfile, sep="\t", index=False)
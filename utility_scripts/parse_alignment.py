@@ -1,14 +1,403 @@
 # %%
+import os
+import sys
+import json
+import heapq
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import Bio
+from Bio import SeqIO
 from Bio.Blast.Applications import NcbitblastnCommandline as tblastn
+from pandas.api.types import union_categoricals
 
 
-def readBLAST(filepath):
-    pass
+# %%
+# Description of the alignment parsing utilities
+script_descr = """
+Read tabular BLAST output (-outfmt 6, or 7 with comment lines) into compact, typed DataFrames.
+
+Large outputs are read in chunks, and each chunk is filtered (e-value, percent identity, best hits per query)
+before it is kept, so only the hits that pass the filters are ever held in memory.
+
+run_tblastn splits a protein query FASTA into shards of about the same number of residues, runs tblastn on every
+shard against every database in a process pool, and merges the outputs into one sorted table with readBLAST.
+Completed shards are recorded in the work folder and skipped when the same search is run again.
+"""
+
+# Default fields of -outfmt 6 and 7 ("std")
+BLAST_FIELDS = [
+    "qseqid", "sseqid", "pident", "length", "mismatch", "gapopen",
+    "qstart", "qend", "sstart", "send", "evalue", "bitscore",
+]
+
+# Types of the BLAST output fields. Sequence IDs are categorical, since each query and subject appears in many hits.
+# Note that e-values below ~1e-45 are stored as 0 in float32.
+BLAST_DTYPES = {
+    "qseqid": "category",
+    "sseqid": "category",
+    "qacc": "category",
+    "sacc": "category",
+    "pident": "float32",
+    "length": "int32",
+    "mismatch": "int32",
+    "gapopen": "int32",
+    "gaps": "int32",
+    "qstart": "int32",
+    "qend": "int32",
+    "sstart": "int32",
+    "send": "int32",
+    "qlen": "int32",
+    "slen": "int32",
+    "qframe": "int8",
+    "sframe": "int8",
+    "evalue": "float32",
+    "bitscore": "float32",
+    "score": "int32",
+    "qcovs": "float32",
+    "qcovhsp": "float32",
+    "positive": "int32",
+    "ppos": "float32",
+}
+
+# Field names of the "# Fields:" comment line of -outfmt 7
+OUTFMT7_FIELDS = {
+    "query id": "qseqid",
+    "query acc.ver": "qseqid",
+    "query acc.": "qacc",
+    "subject id": "sseqid",
+    "subject acc.ver": "sseqid",
+    "subject acc.": "sacc",
+    "% identity": "pident",
+    "alignment length": "length",
+    "mismatches": "mismatch",
+    "gap opens": "gapopen",
+    "gaps": "gaps",
+    "q. start": "qstart",
+    "q. end": "qend",
+    "s. start": "sstart",
+    "s. end": "send",
+    "query length": "qlen",
+    "subject length": "slen",
+    "query frame": "qframe",
+    "sbjct frame": "sframe",
+    "evalue": "evalue",
+    "bit score": "bitscore",
+    "score": "score",
+    "% query coverage per subject": "qcovs",
+    "% query coverage per hsp": "qcovhsp",
+    "positives": "positive",
+    "% positives": "ppos",
+    "subject title": "stitle",
+}
+
+
+# %%
+def _outfmt7_fields(filepath):
+    """Return the field names of the first "# Fields:" comment line of an -outfmt 7 file, or None."""
+    with open(filepath) as blast_file:
+        for line in blast_file:
+            if line.startswith("# Fields:"):
+                return [
+                    OUTFMT7_FIELDS.get(field.strip(), field.strip())
+                    for field in line[len("# Fields:") :].split(",")
+                ]
+            if not line.startswith("#"):
+                return None
+    return None
+
 
+def _best_hits(hits, max_hits):
+    """Keep the max_hits hits with the highest bit scores for each query, in their original order."""
+    ranked = hits.sort_values("bitscore", ascending=False, kind="stable")
+    keep = ranked.groupby("qseqid", sort=False, observed=True).cumcount() < max_hits
+    return hits.loc[keep.reindex(hits.index).to_numpy()]
 
 
+def _concat_hits(chunks, dtypes):
+    """Concatenate filtered chunks, merging the categories of categorical columns."""
+    categorical_cols = [col for col, dtype in dtypes.items() if dtype == "category"]
+    hits = pd.concat([chunk.drop(columns=categorical_cols) for chunk in chunks], ignore_index=True)
+    for col in categorical_cols:
+        hits[col] = union_categoricals([chunk[col] for chunk in chunks])
+    return hits[chunks[0].columns]
+
+
+def readBLAST(filepath, fields=None, evalue=None, pident=None, max_hits=None, chunksize=1_000_000):
+    """Read a tabular BLAST output file (-outfmt 6 or 7) into a typed DataFrame, streaming it in chunks.
+
+    fields (optional) are the output fields, as given to -outfmt (e.g., "6 qseqid sseqid pident ... slen").
+    The default is the fields listed in the file's "# Fields:" line (outfmt 7), or BLAST_FIELDS (outfmt 6 "std").
+    Fields are typed according to BLAST_DTYPES, and other fields (e.g., stitle) are read as text.
+
+    Filters applied to each chunk as it is read:
+        evalue   : keep hits with an e-value of at most evalue
+        pident   : keep hits with a percent identity of at least pident
+        max_hits : keep the max_hits hits with the highest bit scores for each query
+
+    Hits keep their order in the file.
+    """
+    if fields is None:
+        fields = _outfmt7_fields(filepath) or BLAST_FIELDS
+    elif isinstance(fields, str):
+        fields = fields.split()
+    fields = [field for field in fields if not field.isdigit()]
+    dtypes = {field: BLAST_DTYPES[field] for field in fields if field in BLAST_DTYPES}
+    categorical_dtypes = {field: dtype for field, dtype in dtypes.items() if dtype == "category"}
+
+    chunks = []
+    for chunk in pd.read_csv(
+        filepath,
+        sep="\t",
+        comment="#",
+        header=None,
+        names=fields,
+        # Sequence IDs (parsing straight to categories is slow) and e-values (float32 rounds the smallest to 0)
+        # are converted after filtering
+        dtype={**dtypes, **{field: "object" for field in categorical_dtypes}, "evalue": "float64"},
+        chunksize=chunksize,
+    ):
+        if evalue is not None:
+            chunk = chunk.loc[chunk["evalue"] <= evalue]
+        if pident is not None:
+            chunk = chunk.loc[chunk["pident"] >= pident]
+        if max_hits is not None:
+            chunk = _best_hits(chunk, max_hits)
+        chunks.append(chunk.astype({field: dtype for field, dtype in dtypes.items() if chunk[field].dtype != dtype}))
+
+    if not chunks:
+        return pd.DataFrame({field: pd.Series(dtype=dtypes.get(field, "object")) for field in fields})
+    hits = _concat_hits(chunks, dtypes)
+    if max_hits is not None and len(chunks) > 1:
+        # A query's hits can be split across chunks
+        hits = _best_hits(hits, max_hits).reset_index(drop=True)
+    return hits
 
 
 # %%
+def shard_fasta(query_fasta, n_shards, outdir):
+    """Split a FASTA file into up to n_shards files with about the same total sequence length.
+
+    Sequences are assigned, longest first, to the shard with the fewest residues so far, and keep their
+    original order within each shard. Returns the list of shard file paths (outdir/shard_<number>.fasta).
+    """
+    records = list(SeqIO.parse(query_fasta, "fasta"))
+    n_shards = max(1, min(n_shards, len(records)))
+    shard_records = [[] for shard in range(n_shards)]
+    shard_sizes = [(0, shard) for shard in range(n_shards)]
+    for number in sorted(range(len(records)), key=lambda number: -len(records[number])):
+        size, shard = heapq.heappop(shard_sizes)
+        shard_records[shard].append(number)
+        heapq.heappush(shard_sizes, (size + len(records[number]), shard))
+
+    os.makedirs(outdir, exist_ok=True)
+    shard_paths = []
+    for shard, numbers in enumerate(shard_records):
+        shard_path = os.path.join(outdir, "shard_{}.fasta".format(shard))
+        with open(shard_path + ".tmp", "w") as shard_file:
+            SeqIO.write([records[number] for number in sorted(numbers)], shard_file, "fasta")
+        os.replace(shard_path + ".tmp", shard_path)
+        shard_paths.append(shard_path)
+    return shard_paths
+
+
+def _search_key(shard_path, db, options):
+    """Return a hash of a shard's sequences, the database and the tblastn options, identifying one search."""
+    digest = hashlib.sha1()
+    with open(shard_path, "rb") as shard_file:
+        digest.update(shard_file.read())
+    digest.update(json.dumps([os.path.abspath(db), options], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _run_shard(shard_path, db, outfile, options):
+    """Run tblastn on one shard against one database, writing outfile only once the search has finished."""
+    tblastn(query=shard_path, db=db, out=outfile + ".tmp", **options)()
+    os.replace(outfile + ".tmp", outfile)
+    return outfile
+
+
+def _query_order(hit_ids, fasta_ids):
+    """Return the query IDs of BLAST hits in the order of the query FASTA file.
+
+    BLAST reports local IDs without their "lcl|" prefix, so a FASTA ID is matched with or without it. IDs of hits
+    that match no FASTA ID are kept after the others, sorted.
+    """
+    hit_ids = set(hit_ids)
+    order = []
+    for fasta_id in fasta_ids:
+        if fasta_id not in hit_ids and fasta_id.startswith("lcl|") and fasta_id[4:] in hit_ids:
+            fasta_id = fasta_id[4:]
+        order.append(fasta_id)
+    order = list(dict.fromkeys(order))
+    return order + sorted(hit_ids.difference(order))
+
+
+def run_tblastn(
+    query_fasta,
+    dbs,
+    workdir,
+    jobs=None,
+    threads=None,
+    shards=None,
+    fields=BLAST_FIELDS,
+    evalue=10,
+    pident=None,
+    max_hits=None,
+    **tblastn_options,
+):
+    """Search a protein query FASTA against one or more nucleotide BLAST databases with tblastn, in parallel shards.
+
+    dbs is a list of database paths (e.g., genomes/<organism>/<organism>_genomic.fna, as built by download_genome),
+    or a dict of {name: database path}. The query is split into shards of about the same number of residues in workdir
+    (default: enough shards for each of the jobs processes to have a search), and up to jobs tblastn processes
+    (default: one per thread) run at once, each with threads // jobs threads (default: all CPUs in total). Other keyword arguments are passed to tblastn (e.g., max_target_seqs=5).
+
+    A shard's search is skipped if it already completed in workdir with the same sequences, database and options.
+    The outputs are read with readBLAST (see it for evalue, pident and max_hits) and merged into one DataFrame
+    with a categorical "db" column, sorted by query (in FASTA order), database and decreasing bit score.
+    """
+    if not isinstance(dbs, dict):
+        dbs = {os.path.basename(db): db for db in dbs}
+    threads = threads or os.cpu_count()
+    jobs = jobs or threads
+    # Enough shards for every process to have a search, with all databases searched for each shard
+    shards = shards or -(-jobs // len(dbs))
+    shard_paths = shard_fasta(query_fasta, shards, os.path.join(workdir, "shards"))
+    options = dict(
+        tblastn_options,
+        outfmt="6 " + " ".join(fields),
+        evalue=evalue,
+        num_threads=max(1, threads // jobs),
+    )
+    manifest_path = os.path.join(workdir, "completed_searches.json")
+    try:
+        with open(manifest_path) as manifest_file:
+            completed = json.load(manifest_file)
+    except (OSError, ValueError):
+        completed = {}
+
+    searches = []
+    for name, db in dbs.items():
+        for shard_path in shard_paths:
+            outfile = os.path.join(
+                workdir, "{}.{}.tsv".format(os.path.splitext(os.path.basename(shard_path))[0], name)
+            )
+            key = _search_key(shard_path, db, {**options, "num_threads": None})
+            searches.append((name, outfile, key, shard_path, db))
+
+    chunks = []
+
+    def read_output(name, outfile):
+        hits = readBLAST(outfile, fields=fields, evalue=evalue, pident=pident, max_hits=max_hits)
+        hits["db"] = pd.Series(name, index=hits.index, dtype="category")
+        chunks.append(hits)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for name, outfile, key, shard_path, db in searches:
+            if completed.get(outfile) == key and os.path.exists(outfile):
+                print("Skipping {} (already completed)".format(outfile))
+                read_output(name, outfile)
+            else:
+                futures[executor.submit(_run_shard, shard_path, db, outfile, options)] = (name, outfile, key)
+        for future in as_completed(futures):
+            name, outfile, key = futures[future]
+            future.result()
+            completed[outfile] = key
+            with open(manifest_path + ".tmp", "w") as manifest_file:
+                json.dump(completed, manifest_file, indent=2, sort_keys=True)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            print("Completed {}".format(outfile))
+            read_output(name, outfile)
+
+    dtypes = {field: BLAST_DTYPES[field] for field in fields if field in BLAST_DTYPES}
+    hits = _concat_hits(chunks, {**dtypes, "db": "category"})
+    # Sort queries in their FASTA order and databases in the order given, not in order of completion
+    hits["qseqid"] = hits["qseqid"].cat.set_categories(
+        _query_order(hits["qseqid"].cat.categories, [record.id for record in SeqIO.parse(query_fasta, "fasta")])
+    )
+    hits["db"] = hits["db"].cat.set_categories(list(dbs))
+    hits = hits.sort_values(
+        ["qseqid", "db", "bitscore"], ascending=[True, True, False], kind="stable"
+    ).reset_index(drop=True)
+    if max_hits is not None:
+        hits = _best_hits(hits, max_hits).reset_index(drop=True)
+    return hits
+
+
+# %%
+tblastn_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+    add_help=False,
+)
+tblastn_group1 = tblastn_parser.add_argument_group("Information to provide")
+tblastn_group1.add_argument(
+    "-q", "--query",
+    help="(Required) Protein query FASTA file.",
+    metavar="<file>",
+    required=True,
+)
+tblastn_group1.add_argument(
+    "-d", "--db",
+    help="(Required) Nucleotide BLAST database(s) to search, e.g., genomes/<organism>/<organism>_genomic.fna.",
+    nargs="+",
+    metavar="<db>",
+    required=True,
+)
+tblastn_group1.add_argument(
+    "-o", "--outfile",
+    help="(Required) Path to the merged, tab-separated output file.",
+    metavar="<file>",
+    required=True,
+)
+tblastn_group1.add_argument(
+    "-w", "--workdir",
+    help="(Optional) Folder for the shards and their outputs, kept to skip completed shards when run again. The default is the output file path + '_shards'.",
+    metavar="<path>",
+)
+tblastn_group1.add_argument(
+    "-j", "--jobs",
+    help="(Optional) Number of tblastn processes run at the same time. The default is one per CPU, up to the number of searches.",
+    type=int,
+    metavar="<number>",
+)
+tblastn_group1.add_argument(
+    "-t", "--threads",
+    help="(Optional) Total number of threads shared by the tblastn processes. The default is the number of CPUs.",
+    type=int,
+    metavar="<number>",
+)
+tblastn_group1.add_argument(
+    "-e", "--evalue",
+    help="(Optional) Maximum e-value of the hits. The default value is 10.",
+    type=float,
+    default=10,
+    metavar="<evalue>",
+)
+tblastn_group1.add_argument(
+    "-m", "--max-hits",
+    help="(Optional) Maximum number of hits kept per query, by bit score.",
+    type=int,
+    metavar="<number>",
+)
+tblastn_group2 = tblastn_parser.add_argument_group("Help")
+tblastn_group2.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        tblastn_parser.print_help()
+    else:
+        tblastn_args = tblastn_parser.parse_args()
+        hits = run_tblastn(
+            tblastn_args.query,
+            tblastn_args.db,
+            tblastn_args.workdir or tblastn_args.outfile + "_shards",
+            jobs=tblastn_args.jobs,
+            threads=tblastn_args.threads,
+            evalue=tblastn_args.evalue,
+            max_hits=tblastn_args.max_hits,
+        )
+        hits.to_csv(tblastn_args.outfile, sep="\t", index=False)
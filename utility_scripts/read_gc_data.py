@@ -1,19 +1,22 @@
 import sys
 import glob
 import os
-import io
 import csv
-import numpy as np
 import pandas as pd
 import argparse
 
+from gc_parser import parse_gc_report, parse_gc_reports
+from ferment_io import FORMATS, DEFAULT_FORMATS, write_dataframe
+
 
 script_descr = """
 Read output text files from gas chromatography and finds the concentration of relevant compounds measured for each experimental sample.
 
 Returns 3 files:
-	"*gc.csv" and "*gc.xlsx" containing concentrations of measured compound for each experimental sample.
+	"*gc.csv" and "*gc.xlsx" containing concentrations of measured compound for each experimental sample (or .parquet/.feather files, see "--format").
 	"*compound_list.csv" containing the names of the compounds that were measured.
+
+Parsed GC files are cached in "*_gc_cache.sqlite" in the output directory, so that reruns only read new or changed files.
 """
 
 
@@ -23,35 +26,10 @@ def read_gc_data(gc_file):
 
     Uses the sample ID unique to each experiment to identify experimental samples.
     """
-    with open(gc_file, "r") as gc_content:
-        gc_output = ""
-        line_number = 0
-        sample_id = -999
-        for line in gc_content:
-            line_number += 1
-            if "[Group Results(Ch1)]" in line:
-                break
-            if "Sample ID" in line:
-                try:
-                    sample_id = np.intc(line.split(",")[1])
-                except ValueError:
-                    pass
-            if "[Compound Results(Ch1)]" in line:
-                for line2 in gc_content:
-                    if "[Group Results(Ch1)]" in line2:
-                        break
-                    gc_output += line2
-                break
-    if sample_id >= 0:
-        gc_results = pd.read_csv(
-            io.StringIO(gc_output),
-            header=1,
-            usecols=["Name", "Conc."],
-            index_col="Name",
-        )
-        gc_compounds = gc_results.index.rename("Compound")
-        concs = (gc_results["Conc."] * 10).tolist()
-        return sample_id, gc_compounds, concs
+    gc_report = parse_gc_report(gc_file)
+    if gc_report is not None:
+        gc_compounds = pd.Index(gc_report.compounds, name="Compound")
+        return gc_report.sample_id, gc_compounds, gc_report.concs
     else:
         return -999, -999, -999
 
@@ -109,6 +87,25 @@ read_gc_parser_group2.add_argument(
     action="count",
     default=0,
 )
+read_gc_parser_group2.add_argument(
+    "-j",
+    "--jobs",
+    help="Number of worker processes used to read the GC raw data files (default: 1). The output files are identical to those of a single-process run.",
+    type=int,
+    default=1,
+    metavar="<jobs>",
+)
+read_gc_parser_group2.add_argument(
+    "--format",
+    help="File format of the result records: csv, xlsx, parquet, or feather. Can be used multiple times (default: csv and xlsx). Parquet and Feather files keep typed columns and load much faster.",
+    choices=FORMATS,
+    action="append",
+)
+read_gc_parser_group2.add_argument(
+    "--rebuild-cache",
+    help="Ignore the parse cache kept in the output directory and read all GC raw data files again. By default, only new or changed files are read.",
+    action="store_true",
+)
 
 if __name__ == "__main__":
     if len(sys.argv) == 1:
@@ -116,26 +113,34 @@ if __name__ == "__main__":
     else:
         read_gc_args = read_gc_parser.parse_args()
         read_gc_result = []
-        for indir in read_gc_args.indir:
+
+        # List GC output files first, so they can be parsed serially or in parallel
+        gc_filepaths = list(read_gc_args.file or [])
+        for indir in read_gc_args.indir or []:
             if read_gc_args.recursive == True:
                 for walk_entry in os.walk(indir):
                     for gc_filename in walk_entry[2]:
                         if gc_filename.endswith(".txt"):
-                            gc_filepath = os.path.join(walk_entry[0], gc_filename)
-                            sample_id, compound_list, concs = read_gc_data(gc_filepath)
-                            if sample_id >= 0:
-                                read_gc_result.append(
-                                    [sample_id, *concs, os.path.basename(gc_filepath)]
-                                )
+                            gc_filepaths.append(os.path.join(walk_entry[0], gc_filename))
             else:
                 for scan_entry in os.scandir(indir):
-                    if scan_entry.isfile() and scan_entry.endswith(".txt"):
-                        gc_filepath = os.path.join(scan_entry, gc_filename)
-                        sample_id, compound_list, concs = read_gc_data(gc_filepath)
-                        if sample_id >= 0:
-                            read_gc_result.append(
-                                [sample_id, *concs, os.path.basename(gc_filepath)]
-                            )
+                    if scan_entry.is_file() and scan_entry.name.endswith(".txt"):
+                        gc_filepaths.append(scan_entry.path)
+
+        gc_reports = parse_gc_reports(
+            gc_filepaths,
+            jobs=read_gc_args.jobs,
+            cache_file=os.path.join(
+                read_gc_args.outdir, read_gc_args.experiment + "_gc_cache.sqlite"
+            ),
+            rebuild_cache=read_gc_args.rebuild_cache,
+        )
+        for gc_filepath, gc_report in zip(gc_filepaths, gc_reports):
+            if gc_report is not None:
+                compound_list = pd.Index(gc_report.compounds, name="Compound")
+                read_gc_result.append(
+                    [gc_report.sample_id, *gc_report.concs, os.path.basename(gc_filepath)]
+                )
 
         read_gc_result.sort(key=(lambda x: x[0]))
 
@@ -175,11 +180,10 @@ if __name__ == "__main__":
             ),
             index=False,
         )
-        pd.DataFrame(read_gc_result, columns=["Sample ID", *compound_list, "File name"]).to_csv(
-            os.path.join(read_gc_args.outdir, read_gc_args.experiment + "_data.csv"),
-            index=False,
-        )
-        pd.DataFrame(read_gc_result, columns=["Sample ID", *compound_list, "File name"]).to_excel(
-            os.path.join(read_gc_args.outdir, read_gc_args.experiment + "_data.xlsx"),
+        write_dataframe(
+            pd.DataFrame(read_gc_result, columns=["Sample ID", *compound_list, "File name"]),
+            os.path.join(read_gc_args.outdir, read_gc_args.experiment + "_data"),
+            read_gc_args.format or DEFAULT_FORMATS,
+            compounds=compound_list,
             index=False,
         )
@@ -0,0 +1,261 @@
+# %%
+# Import necessary libraries
+import os
+import sys
+import gzip
+import mmap
+import argparse
+import pandas as pd
+
+from bgzf_io import BgzfFile, is_bgzf
+
+
+# %%
+# Description of the sequence index
+script_descr = """
+Extract the nucleotide or protein sequences of genome feature table loci from the genome's FASTA files
+("*_genomic.fna" and "*_protein.faa" in the genome folder).
+
+Each FASTA file is indexed once, in the samtools faidx format (a ".fai" file next to it, with the name, length,
+offset and line layout of every sequence), and read through a memory map: each locus is sliced straight from the
+file, so the genome is never loaded into Python strings. Minus-strand loci are reverse-complemented.
+Block-gzip (BGZF) compressed files ("*.fna.gz", see bgzf_io) are read the same way, decompressing only the blocks
+that contain each locus.
+Sequences are selected with identifiers resolved by the locus index (locus tags, old locus tags, symbols or names)
+and written as a FASTA file.
+"""
+
+FAI_COLUMNS = ["name", "length", "offset", "linebases", "linewidth"]
+
+# Complement of IUPAC nucleotide codes, keeping case
+COMPLEMENT = bytes.maketrans(b"ACGTUMRWSYKVHDBNacgtumrwsykvhdbn", b"TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn")
+
+
+# %%
+def build_faidx(fasta_path, fai_path=None):
+    """Index a FASTA file in the samtools faidx format and write the index to fai_path (default: fasta_path + ".fai").
+
+    All lines of a sequence but its last must have the same length. Offsets are in the uncompressed data of
+    gzipped files (as for samtools faidx of BGZF files). Returns the index as a DataFrame.
+    """
+    records = []
+    with (gzip.open if fasta_path.endswith(".gz") else open)(fasta_path, "rb") as fasta:
+        offset = 0
+        record = None
+        for line in fasta:
+            if line.startswith(b">"):
+                name = line[1:].split(None, 1)[0].decode()
+                record = [name, 0, offset + len(line), 0, 0]
+                records.append(record)
+                last_line = False
+            elif record is not None and line.strip():
+                bases = len(line.rstrip(b"\r\n"))
+                if record[3] == 0:
+                    record[3], record[4] = bases, len(line)
+                elif last_line or bases > record[3]:
+                    raise ValueError(f"Sequence {record[0]} of {fasta_path} has lines of different lengths")
+                last_line = bases < record[3]
+                record[1] += bases
+            offset += len(line)
+
+    fai = pd.DataFrame(records, columns=FAI_COLUMNS)
+    fai_path = fai_path or fasta_path + ".fai"
+    fai.to_csv(fai_path + ".tmp", sep="\t", header=False, index=False)
+    os.replace(fai_path + ".tmp", fai_path)
+    return fai
+
+
+def read_faidx(fai_path):
+    """Read a samtools faidx index into a DataFrame indexed by sequence name."""
+    return pd.read_table(fai_path, names=FAI_COLUMNS, dtype={"name": str}).set_index("name")
+
+
+def reverse_complement(seq: bytes):
+    """Return the reverse complement of a nucleotide sequence (bytes)."""
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+class FastaIndex:
+    """Random-access reader of an indexed FASTA file, through a memory map of the file.
+
+    The FASTA file can be plain or BGZF compressed (see bgzf_io.recompress_bgzf for files downloaded gzipped).
+    The ".fai" index is built on first use, and rebuilt if the FASTA file is newer than it.
+    Positions are 1-based and inclusive, as in NCBI feature tables.
+    """
+
+    def __init__(self, fasta_path):
+        self.fasta_path = fasta_path
+        if fasta_path.endswith(".gz") and not is_bgzf(fasta_path):
+            raise ValueError(f"{fasta_path} is gzipped but not BGZF, recompress it with bgzf_io.recompress_bgzf")
+        fai_path = fasta_path + ".fai"
+        if not os.path.exists(fai_path) or os.path.getmtime(fai_path) < os.path.getmtime(fasta_path):
+            build_faidx(fasta_path, fai_path)
+        self.fai = read_faidx(fai_path)
+        self._records = dict(zip(self.fai.index, self.fai[FAI_COLUMNS[1:]].itertuples(index=False, name=None)))
+        if fasta_path.endswith(".gz"):
+            self._bgzf = BgzfFile(fasta_path)
+            self._read = self._bgzf.read
+        else:
+            self._bgzf = None
+            self._file = open(fasta_path, "rb")
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._bgzf is not None:
+            self._bgzf.close()
+        else:
+            self._data.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read(self, start, end):
+        """Return the (uncompressed) file bytes from offset start to end."""
+        return self._data[start:end]
+
+    def fetch(self, name, start=None, end=None, strand="+"):
+        """Return bases start to end (1-based, inclusive; default: the whole sequence) of sequence name, as bytes.
+
+        With strand = "-", the reverse complement is returned.
+        """
+        length, offset, linebases, linewidth = self._records[name]
+        start = 1 if start is None else int(start)
+        end = length if end is None else int(end)
+        if not 1 <= start <= end <= length:
+            raise ValueError(f"Range {start}-{end} is outside of {name} (1-{length})")
+        first = offset + (start - 1) // linebases * linewidth + (start - 1) % linebases
+        last = offset + (end - 1) // linebases * linewidth + (end - 1) % linebases + 1
+        seq = self._read(first, last)
+        # bytes.replace is several times faster than bytes.translate with deleted characters
+        if linewidth > linebases:
+            seq = seq.replace(b"\n", b"")
+        if linewidth > linebases + 1:
+            seq = seq.replace(b"\r", b"")
+        return reverse_complement(seq) if strand == "-" else seq
+
+    def extract(self, names, starts=None, ends=None, strands=None):
+        """Return the sequences of many ranges at once, as a list of str.
+
+        names, starts, ends and strands are lists (or columns) of the same length; starts and ends can be omitted
+        to take whole sequences (e.g., proteins by accession), and strands to read all ranges on the + strand.
+        """
+        n_ranges = len(names)
+        starts = [None] * n_ranges if starts is None else starts
+        ends = [None] * n_ranges if ends is None else ends
+        strands = ["+"] * n_ranges if strands is None else strands
+        return [
+            self.fetch(name, start, end, strand).decode()
+            for name, start, end, strand in zip(names, starts, ends, strands)
+        ]
+
+
+def locus_sequences(loci: pd.DataFrame, index: FastaIndex, protein=False):
+    """Return the sequences of feature table rows, as a Series with the index of loci.
+
+    Nucleotide sequences are read from the genome (index of "*_genomic.fna") with the genomic_accession, start, end
+    and strand columns. With protein = True, proteins are read from index of "*_protein.faa" by product_accession.
+    """
+    if protein:
+        sequences = index.extract(loci["product_accession"].tolist())
+    else:
+        sequences = index.extract(
+            loci["genomic_accession"].astype(str).tolist(),
+            loci["start"].tolist(),
+            loci["end"].tolist(),
+            loci["strand"].astype(str).tolist(),
+        )
+    return pd.Series(sequences, index=loci.index, dtype=object)
+
+
+def write_fasta(loci: pd.DataFrame, sequences: pd.Series, fasta_file, protein=False, line_length=80):
+    """Write the sequences of feature table rows to an open text file in FASTA format.
+
+    Headers are the locus tag, followed by the protein accession (protein = True) or the genomic range and strand,
+    and the locus name.
+    """
+    for (_, locus), seq in zip(loci.iterrows(), sequences):
+        if protein:
+            location = locus["product_accession"]
+        else:
+            location = "{}:{}-{}({})".format(locus["genomic_accession"], locus["start"], locus["end"], locus["strand"])
+        name = locus["name"] if pd.notna(locus["name"]) else ""
+        fasta_file.write(">{} {} {}\n".format(locus["locus_tag"], location, name).rstrip() + "\n")
+        for line_start in range(0, len(seq), line_length):
+            fasta_file.write(seq[line_start : line_start + line_length] + "\n")
+
+
+# %%
+seq_parser = argparse.ArgumentParser(
+    description=script_descr,
+    fromfile_prefix_chars="@",
+    add_help=False,
+)
+seq_group1 = seq_parser.add_argument_group("Information to provide")
+seq_group1.add_argument(
+    "-n", "--organism-name",
+    help="(Required) Organism name in the genome store, used to find its feature table and FASTA files.",
+    metavar="<name>",
+    required=True,
+)
+seq_group1.add_argument(
+    "-i", "--ids",
+    help="(Optional) File of identifiers (locus tags, old locus tags, symbols or names), one per line. The default is to read them from the standard input.",
+    metavar="<file>",
+)
+seq_group1.add_argument(
+    "-f", "--fields",
+    help="(Optional) Comma-separated list of identifier types to search, among locus_tag, old_locus_tag, symbol and name. The default is all of them.",
+    metavar="<fields>",
+)
+seq_group1.add_argument(
+    "-p", "--protein",
+    help="(Optional) Extract protein sequences (from *_protein.faa) instead of nucleotide sequences (from *_genomic.fna).",
+    action="store_true",
+)
+seq_group1.add_argument(
+    "-o", "--outfile",
+    help="(Optional) Path to the output FASTA file. The default is to write to the standard output.",
+    metavar="<file>",
+)
+seq_group2 = seq_parser.add_argument_group("Help")
+seq_group2.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+if __name__ == "__main__":
+    from genome_store import genome_file
+    from feature_table_io import load_feature_table
+    from locus_index import LocusIndex, read_ids
+
+    seq_args = seq_parser.parse_args()
+    if seq_args.ids is None:
+        ids = read_ids(sys.stdin)
+    else:
+        with open(seq_args.ids) as id_file:
+            ids = read_ids(id_file)
+    fields = seq_args.fields.split(",") if seq_args.fields else None
+
+    feature_table = load_feature_table(genome_file(seq_args.organism_name, "_feature_table.txt"))
+    resolved = LocusIndex(feature_table).resolve(ids, fields)
+    unresolved = resolved.loc[resolved["matched_field"].isna(), "query"]
+    if len(unresolved):
+        print("{} identifier(s) not found: {}".format(len(unresolved), ", ".join(unresolved)), file=sys.stderr)
+    resolved = resolved.dropna(subset=["matched_field"])
+    if seq_args.protein:
+        # One protein per CDS
+        loci = resolved[(resolved["# feature"] == "CDS") & resolved["product_accession"].notna()]
+        fasta_path = genome_file(seq_args.organism_name, "_protein.faa")
+    else:
+        # The first row of each locus (its gene row in NCBI feature tables)
+        loci = resolved.drop_duplicates(["query", "locus_tag"])
+        fasta_path = genome_file(seq_args.organism_name, "_genomic.fna")
+
+    with FastaIndex(fasta_path) as index:
+        sequences = locus_sequences(loci, index, protein=seq_args.protein)
+    if seq_args.outfile is None:
+        write_fasta(loci, sequences, sys.stdout, protein=seq_args.protein)
+    else:
+        with open(seq_args.outfile, "w") as fasta_file:
+            write_fasta(loci, sequences, fasta_file, protein=seq_args.protein)